@@ -0,0 +1,52 @@
+"""Time the audio effects: changing the speed, concatenating and overlaying.
+
+Usage (from the repository root):
+    python bench/bench_audio_edits.py [path to wav] [repeats]
+"""
+
+from pathlib import Path
+import sys
+import time
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "src"))
+
+from audio_edits import _concatenate, _getData, _overlay, applyPlan
+from effect_plan import compilePlan
+from playback_options import PlaybackOptions
+
+
+def timeIt(function, repeats):
+    """Best time of repeats calls to function, in milliseconds."""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else str(Path("sounds", "coffee.wav"))
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    data = _getData(path)
+    fast_plan = compilePlan(
+        PlaybackOptions(2, None, False, None, None, None, None, None, None, False)
+    )
+    slow_plan = compilePlan(
+        PlaybackOptions(0.5, None, False, None, None, None, None, None, None, False)
+    )
+    cases = {
+        "speed x2": lambda: applyPlan(data, fast_plan),
+        "speed x0.5": lambda: applyPlan(data, slow_plan),
+        "concatenate x4": lambda: _concatenate([data] * 4),
+        "overlay x4": lambda: _overlay([data] * 4),
+        "overlay x50": lambda: _overlay([data] * 50),
+    }
+
+    print(f"{path}: {data.params.nframes} frames, best of {repeats}")
+    for case, function in cases.items():
+        print(f"{case:>16}: {timeIt(function, repeats):9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
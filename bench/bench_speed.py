@@ -0,0 +1,55 @@
+"""Time the ways of changing the speed of a sound on a long input: varispeed (a
+resample with soxr) and tempo (WSOLA, which keeps the pitch).
+
+Without a path, a few minutes of stereo noise at 44.1kHz are used.
+
+Usage (from the repository root):
+    python bench/bench_speed.py [path to wav] [repeats]
+"""
+
+from pathlib import Path
+import sys
+import time
+import wave
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "src"))
+
+import numpy as np
+from audio_edits import WavData, _changeTempo, _getData, _resample
+
+MINUTES = 3
+
+
+def timeIt(function, repeats):
+    """Best time of repeats calls to function, in milliseconds."""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    if len(sys.argv) > 1:
+        path = sys.argv[1]
+        data = _getData(path)
+    else:
+        path = f"{MINUTES} minutes of noise"
+        params = wave._wave_params(2, 2, 44100, 0, "NONE", "not compressed")
+        noise = np.random.default_rng(0).normal(0, 3000, (MINUTES * 60 * 44100, 2))
+        data = WavData(noise.astype("<i2"), params)
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    print(f"{path}: {data.params.nframes} frames, best of {repeats}")
+    for speed in [0.75, 1.5]:
+        cases = {
+            "varispeed": lambda: _resample(data, speed, 0, 1),
+            "tempo": lambda: _changeTempo(data, speed),
+        }
+        for case, function in cases.items():
+            print(f"x{speed:<5} {case:>10}: {timeIt(function, repeats):9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
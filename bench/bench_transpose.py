@@ -0,0 +1,75 @@
+"""Time transposing a sound in memory against the old way, which wrote it to a
+temporary wav file and loaded it with librosa (mixing it down to mono at 22050Hz),
+then wrote the result out and read it again.
+
+The old way only shifted one channel at 22050Hz, so the in memory transpose is also
+timed on the same mono 22050Hz sound to compare them doing the same work.
+
+Usage (from the repository root):
+    python bench/bench_transpose.py [path to wav] [semitones] [repeats]
+"""
+
+from pathlib import Path
+import sys
+import tempfile
+import time
+import wave
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "src"))
+
+import librosa
+import numpy as np
+import soundfile
+from audio_edits import _fromFloat, _getData, _pitchShift, _readWav
+
+
+def legacyPitchShift(data, semitones):
+    """The transpose _pitchShift did before it worked in memory."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = str(Path(temp_dir, "sound.wav"))
+        with wave.open(path, mode="wb") as wav_file:
+            wav_file.setparams(data.params)
+            wav_file.writeframes(data.frames)
+        y, sr = librosa.load(path)
+        new_y = librosa.effects.pitch_shift(y, sr=sr, n_steps=semitones)
+        soundfile.write(path, new_y, sr)
+        return _readWav(path)
+
+
+def timeIt(function, repeats):
+    """Best time of repeats calls to function, in milliseconds."""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else str(Path("sounds", "coffee.wav"))
+    semitones = float(sys.argv[2]) if len(sys.argv) > 2 else 3
+    repeats = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+    data = _getData(path)
+    y, sr = librosa.load(path)
+    params = data.params._replace(nchannels=1, framerate=sr, nframes=len(y))
+    mono = _fromFloat(y[:, np.newaxis], params)
+    cases = {
+        "temp file": lambda: legacyPitchShift(data, semitones),
+        "in memory, mono 22050Hz": lambda: _pitchShift(mono, semitones),
+        "in memory": lambda: _pitchShift(data, semitones),
+    }
+    # the first call to librosa compiles its numba functions
+    _pitchShift(data.slice(0, 4096), semitones)
+
+    print(f"{path}: {data.params.nframes} frames, best of {repeats}")
+    for case, function in cases.items():
+        params = function().params
+        print(
+            f"{case:>23}: {timeIt(function, repeats):9.1f} ms"
+            f" ({params.nchannels} channels at {params.framerate}Hz)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -25,7 +25,9 @@ class GUI_Manager:
         # setup
         checkForPriorSetUp()
         self.base_dir = Path("sounds")
-        self.commander = Commander(sounds_directory="../sounds")
+        self.commander = Commander(
+            sounds_directory="../sounds", render_cache_directory="../render_cache"
+        )
         self.listOfSounds = None
         self.options = None
         self.token = False
@@ -92,6 +94,7 @@ class GUI_Manager:
 def main():
     manager = GUI_Manager()
     manager.runMenuCycle()
+    manager.commander.close()
     print("Thanks for using our audio archive!!!")
 
 
@@ -0,0 +1,255 @@
+"""This module talks to a running archive server (see server.py), so that commands
+can use the server's open database and warm caches instead of setting up their own.
+
+ArchiveClient has the same playAudio method and storage attribute as Commander, so
+the CLI can use either one. Errors from the server are raised as the same
+exceptions Commander would raise.
+
+Only the standard library is imported here, so the client starts quickly.
+"""
+
+import http.client
+import json
+import os
+from pathlib import Path
+import socket
+from urllib.parse import urlencode
+from audio_metadata import AudioMetadata
+from playback_options import PlaybackOptions
+from storage_exceptions import *
+
+DEFAULT_SERVER_ADDRESS = "127.0.0.1:8765"
+_UNIX_PREFIX = "unix://"
+
+
+class ServerUnavailable(ConnectionError):
+    """Couldn't connect to the archive server."""
+
+
+def parseAddress(address):
+    """Split a server address into a (host, port) tuple.
+
+    Args:
+        address: String "host:port", or "unix://path" for a Unix socket.
+
+    Returns:
+        (host, port), where host is "unix://path" and port is 0 for a Unix socket.
+
+    Raises:
+        ValueError: The address has no port.
+    """
+    if address.startswith(_UNIX_PREFIX):
+        return address, 0
+    host, _, port = address.rpartition(":")
+    if host == "" or not port.isdigit():
+        raise ValueError(f"Server address {address} must be host:port or unix://path")
+    return host, int(port)
+
+
+def soundToDict(sound):
+    """Turn an AudioMetadata object into something that can be sent as JSON."""
+    return {
+        "file_path": str(sound.file_path),
+        "name": sound.name,
+        "duration": sound.duration,
+        "date_added": sound.date_added,
+        "last_played": sound.last_played,
+        "author": sound.author,
+        "tags": sorted(sound.tags),
+        "play_count": sound.play_count,
+    }
+
+
+def soundFromDict(fields):
+    """Inverse of soundToDict."""
+    return AudioMetadata(**{**fields, "tags": set(fields["tags"])})
+
+
+def optionsToDict(options):
+    """Turn a PlaybackOptions object into something that can be sent as JSON."""
+    return dict(vars(options))
+
+
+def optionsFromDict(fields):
+    """Inverse of optionsToDict.
+
+    Raises:
+        ValueError: The options aren't valid.
+    """
+    try:
+        return PlaybackOptions(**fields)
+    except TypeError as e:
+        raise ValueError(f"Invalid playback options: {e}")
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection to a server listening on a Unix socket."""
+
+    def __init__(self, path, timeout):
+        super().__init__("localhost", timeout=timeout)
+        self._path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self._path)
+
+
+class ArchiveClient:
+    """Send commands to an archive server.
+
+    Attributes:
+        address: String address of the server (see parseAddress).
+        storage: A RemoteStorage object.
+    """
+
+    # Exceptions that the server sends back by name.
+    _ERRORS = {
+        "NameMissing": NameMissing,
+        "NameExists": NameExists,
+        "ValueError": ValueError,
+        "FileNotFoundError": FileNotFoundError,
+        "FileExistsError": FileExistsError,
+    }
+
+    def __init__(self, address=DEFAULT_SERVER_ADDRESS, timeout=None):
+        """Constructor. Doesn't connect until the first command.
+
+        Args:
+            address: String address of the server (see parseAddress).
+            timeout: Float seconds to wait for the server, or None to wait as long
+                as it takes (playing a long sound takes a while).
+        """
+        self.address = address
+        self.storage = RemoteStorage(self)
+        self._host, self._port = parseAddress(address)
+        self._timeout = timeout
+
+    def close(self):
+        """Nothing to release, since every request uses its own connection."""
+
+    def playAudio(self, names, options):
+        """Have the server play sounds (see Commander.playAudio)."""
+        self.request(
+            "POST", "/play", {"names": names, "options": optionsToDict(options)}
+        )
+
+    def renderWav(self, names, options):
+        """Have the server apply audio effects to sounds without playing them.
+
+        Returns:
+            Bytes of a wav file.
+        """
+        return self.request(
+            "POST", "/render", {"names": names, "options": optionsToDict(options)}
+        )
+
+    def request(self, method, path, body=None, query=None):
+        """Send a request to the server.
+
+        Args:
+            method: String HTTP method.
+            path: String path of the endpoint.
+            body: Something to send as JSON, or None.
+            query: Dictionary of query parameters (lists are sent as repeated
+                parameters), or None.
+
+        Returns:
+            The decoded JSON response, or the bytes of any other kind of response.
+
+        Raises:
+            ServerUnavailable: Couldn't connect to the server.
+            The exception the server raised, if it is one of _ERRORS (else
+            RuntimeError).
+        """
+        if query:
+            path = f"{path}?{urlencode(query, doseq=True)}"
+        headers = {}
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        if self._port == 0:
+            connection = _UnixHTTPConnection(
+                self._host[len(_UNIX_PREFIX) :], self._timeout
+            )
+        else:
+            connection = http.client.HTTPConnection(
+                self._host, self._port, timeout=self._timeout
+            )
+        try:
+            connection.request(method, path, data, headers)
+            response = connection.getresponse()
+            content = response.read()
+        except (ConnectionRefusedError, FileNotFoundError) as e:
+            raise ServerUnavailable(
+                f"Couldn't connect to the archive server at {self.address}"
+            ) from e
+        finally:
+            connection.close()
+
+        if response.getheader("Content-Type", "").startswith("application/json"):
+            content = json.loads(content)
+        if response.status >= 400:
+            error = content if isinstance(content, dict) else {}
+            if error.get("error") == "CouldntDecodeError":
+                from pydub.exceptions import CouldntDecodeError
+
+                raise CouldntDecodeError(error["message"])
+            exception = self._ERRORS.get(error.get("error"), RuntimeError)
+            raise exception(error.get("message", f"Server error {response.status}"))
+        return content
+
+
+class RemoteStorage:
+    """The parts of StorageCommander that the archive server provides."""
+
+    def __init__(self, client):
+        self._client = client
+
+    def iterSounds(
+        self, order_by="name", batch_size=500, tags=(), match_all=False, exclude=()
+    ):
+        """See StorageCommander.iterSounds. batch_size is ignored."""
+        query = {
+            "sort": order_by,
+            "tag": list(tags),
+            "match_all": int(match_all),
+            "exclude": list(exclude),
+        }
+        for fields in self._client.request("GET", "/sounds", query=query):
+            yield soundFromDict(fields)
+
+    def fuzzySearch(self, target, n):
+        """See StorageCommander.fuzzySearch."""
+        query = {"name": target, "n": n}
+        return [
+            soundFromDict(fields)
+            for fields in self._client.request("GET", "/sounds/find", query=query)
+        ]
+
+    def search(self, query, fields=("name", "author", "tags"), limit=10):
+        """See StorageCommander.search."""
+        params = {"q": query, "field": list(fields), "limit": limit}
+        return [
+            soundFromDict(sound)
+            for sound in self._client.request("GET", "/sounds/search", query=params)
+        ]
+
+    def addSound(self, file_path, name=None, author=None):
+        """See StorageCommander.addSound. file_path must be readable by the server."""
+        body = {
+            # the server may have been started in another directory
+            "file_path": os.path.abspath(Path(file_path)),
+            "name": name,
+            "author": author,
+        }
+        self._client.request("POST", "/sounds", body)
+
+    def addTag(self, name, tag):
+        """See StorageCommander.addTag."""
+        self._client.request("PUT", "/tags", {"name": name, "tag": tag})
+
+    def removeTag(self, name, tag):
+        """See StorageCommander.removeTag."""
+        self._client.request("DELETE", "/tags", {"name": name, "tag": tag})
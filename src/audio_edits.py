@@ -4,26 +4,218 @@ So, note that every edit function will take a WavData object and a PlaybackOptio
 apply an audio effect, and then return a new WavData object.
 """
 
-import audioop
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from effect_plan import compilePlan
 import librosa
-from pydub import AudioSegment
-from pydub.effects import speedup
-import soundfile
-import tempfile
+import mmap
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+import os
+from playback_options import DEFAULT_CROSSFADE_MS, DEFAULT_MIX
+from source_cache import SourceCache
+from wav_reader import readWavHeader
+import soxr
+import threading
 import wave
-from pathlib import Path
+
+
+# numpy dtype used to hold samples of each sample width. 8 bit wav samples are
+# unsigned, and 24 bit samples are sign extended to 32 bits.
+_SAMPLE_DTYPES = {1: "u1", 2: "<i2", 3: "<i4", 4: "<i4"}
+# Wav files at least this large are memory mapped instead of read and cached.
+MMAP_THRESHOLD = 16 * 1024 * 1024
+# Long sounds are transposed this many frames at a time (see _pitchShift), with
+# this much context on each side and this long a fade between chunks. Each chunk
+# may be moved by up to PITCH_CHUNK_ALIGN frames to line it up with the last one.
+PITCH_CHUNK_FRAMES = 1024 * 1024
+PITCH_CHUNK_CONTEXT = 8192
+PITCH_CHUNK_FADE = 2048
+PITCH_CHUNK_ALIGN = 1024
+# The tempo is changed by overlapping windows this long, each of which may be
+# moved by up to TEMPO_SEARCH_SECONDS to line up with the last (see _changeTempo).
+TEMPO_WINDOW_SECONDS = 0.025
+TEMPO_SEARCH_SECONDS = 0.006
+# The search is done on the sound averaged over this many frames, then refined.
+_TEMPO_DECIMATION = 4
+# Windows are overlapped in batches of this many to bound memory.
+_TEMPO_BATCH_WINDOWS = 1024
+# Decoded sounds shared by every edit in this process. Use source_cache.resize to
+# change its memory budget and source_cache.stats to see how much it uses.
+source_cache = SourceCache()
+# Process pools used by renderSounds, by number of workers (see _getExecutor).
+_executors = {}
+# renderSounds may be called from several threads (such as the archive server's).
+_executors_lock = threading.Lock()
 
 
 class WavData:
-    def __init__(self, frames, params):
-        self.frames = frames
-        self.params = params
+    """Audio samples along with the wav params that describe them.
+
+    Effects work on the samples array, and often only return a view of it, so
+    WavData objects should be treated as read only. The samples are only turned
+    back into wav frames when frames is first used, such as for playback or saving.
+
+    A WavData object can also be created from raw wav frames (see fromRaw), which
+    may be a view of a memory mapped file. 24 bit frames are then only decoded into
+    samples when samples is first used, so cropping with slice beforehand means only
+    the frames that are kept are ever read.
+
+    Attributes:
+        samples: numpy array with one row per frame and one column per channel. The
+            dtype matches the sample width (see _SAMPLE_DTYPES), and 24 bit samples
+            are stored in int32 without being scaled.
+        params: wave params namedtuple. nframes always matches samples.
+    """
+
+    def __init__(self, samples, params):
+        self._samples = samples
+        self._raw = None
+        self.params = params._replace(nframes=len(samples))
+        self._frames = None
+
+    @classmethod
+    def fromRaw(cls, raw, params):
+        """Create a WavData object from raw wav frames without copying them.
+
+        Args:
+            raw: uint8 numpy array with one row of sampwidth * nchannels bytes per
+                frame, such as a view of a wav file's data chunk.
+            params: wave params namedtuple (nframes is ignored).
+        """
+        data = cls.__new__(cls)
+        data._raw = raw
+        data._samples = None
+        if params.sampwidth != 3:
+            data._samples = raw.view(_SAMPLE_DTYPES[params.sampwidth])
+        data.params = params._replace(nframes=len(raw))
+        data._frames = None
+        return data
+
+    @classmethod
+    def fromBytes(cls, frames, params):
+        """Create a WavData object from wav frames and their params.
+
+        Args:
+            frames: Bytes in the format written to a wav file.
+            params: wave params namedtuple (nframes is ignored).
+        """
+        raw = np.frombuffer(frames, dtype=np.uint8)
+        data = cls.fromRaw(raw.reshape(-1, params.sampwidth * params.nchannels), params)
+        data._frames = bytes(frames)
+        return data
+
+    @property
+    def samples(self):
+        if self._samples is None:
+            # 24 bit samples are decoded when first needed
+            raw = self._raw.reshape(-1, 3)
+            padded = np.zeros((len(raw), 4), dtype=np.uint8)
+            padded[:, 1:] = raw
+            # shifting back down sign extends the samples
+            flat = padded.view("<i4").reshape(-1) >> 8
+            self._samples = flat.reshape(-1, self.params.nchannels)
+        return self._samples
+
+    def __reduce__(self):
+        # only send the samples to other processes, not the frames or a memory map
+        return (WavData, (np.ascontiguousarray(self.samples), self.params))
+
+    def slice(self, start=None, stop=None, step=None):
+        """Select frames like samples[start:stop:step], without copying anything."""
+        frames = slice(start, stop, step)
+        if self._samples is None:
+            return WavData.fromRaw(self._raw[frames], self.params)
+        return WavData(self._samples[frames], self.params)
+
+    def nbytes(self):
+        """Int number of bytes of memory used by the samples and frames."""
+        arrays = [array for array in [self._raw, self._samples] if array is not None]
+        if self._frames is not None:
+            arrays.append(np.frombuffer(self._frames, dtype=np.uint8))
+        size = 0
+        for i, array in enumerate(arrays):
+            if not any(np.may_share_memory(array, other) for other in arrays[:i]):
+                size += array.nbytes
+        return size
+
+    @property
+    def frames(self):
+        """The samples as bytes in the format written to a wav file."""
+        if self._frames is None:
+            if self._raw is not None:
+                self._frames = self._raw.tobytes()
+                return self._frames
+            samples = self.samples.astype(
+                _SAMPLE_DTYPES[self.params.sampwidth], copy=False
+            )
+            if self.params.sampwidth == 3:
+                samples = samples.reshape(-1, 1).view(np.uint8)[:, :3]
+            self._frames = np.ascontiguousarray(samples).tobytes()
+        return self._frames
 
 
 def _getData(file_path):
-    """Create WavData object from file path to wav file."""
+    """Create WavData object from file path to wav file.
+
+    Large files are memory mapped, so only the parts that are used are read. Other
+    sounds are kept in source_cache, so reading the same file again is free until
+    it changes. The result is shared and must not be modified.
+    """
+    if os.path.getsize(file_path) >= MMAP_THRESHOLD:
+        try:
+            return mapWav(file_path)
+        except (ValueError, OSError):
+            # not something mapWav understands, so let the wave module try
+            pass
+    return source_cache.get(file_path, _loadSource)
+
+
+def _loadSource(file_path):
+    """Read a wav file for source_cache, decoding the samples up front so that the
+    memory they use is counted."""
+    data = _readWav(file_path)
+    data.samples
+    return data
+
+
+def _readWav(file_path):
+    """Create WavData object from file path to wav file, without the cache."""
     with wave.open(file_path, "rb") as wr:
-        return WavData(wr.readframes(wr.getnframes()), wr.getparams())
+        return WavData.fromBytes(wr.readframes(wr.getnframes()), wr.getparams())
+
+
+def mapWav(file_path):
+    """Create a WavData object backed by a read only memory map of a wav file.
+
+    Nothing is read until the samples are used, and then only the pages holding the
+    frames that are used are read.
+
+    Args:
+        file_path: String path to a PCM wav file.
+
+    Raises:
+        ValueError: The file isn't a PCM wav file.
+    """
+    header = readWavHeader(file_path)
+    with open(file_path, "rb") as file:
+        memory_map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    frame_size = header.params.sampwidth * header.params.nchannels
+    raw = np.frombuffer(
+        memory_map,
+        dtype=np.uint8,
+        count=header.nframes * frame_size,
+        offset=header.data_offset,
+    )
+    return WavData.fromRaw(raw.reshape(-1, frame_size), header.params)
+
+
+def _sampleRange(sampwidth):
+    """Smallest and largest sample value for a sample width, as floats."""
+    if sampwidth == 1:
+        return 0.0, 255.0
+    bits = 8 * sampwidth
+    return float(-(2 ** (bits - 1))), float(2 ** (bits - 1) - 1)
 
 
 def edit(file_paths, options):
@@ -33,147 +225,520 @@ def edit(file_paths, options):
         file_path: String List file path to wav file.
         options: PlaybackOptions object.
     """
-    sounds = [_editSound(file_path, options) for file_path in file_paths]
+    sounds = renderSounds(file_paths, options)
     if options.parallel:
-        return _overlay(sounds)
-    return _concatenate(sounds)
+        return _overlay(sounds, options.mix)
+    return _concatenate(sounds, options.gap_ms, options.crossfade_ms)
 
 
-def _editSound(file_path, options):
-    """Applies audio effects to wav file at file_path.
+def renderSounds(file_paths, options):
+    """Applies audio effects to each wav file without combining them.
+
+    If options.workers allows more than one process and the effects do more than
+    crop or reverse, the sounds are rendered in a process pool. Each file is only
+    rendered once, even if it appears several times.
 
     Args:
-        file_path: String file path to wav file.
+        file_paths: String List file path to wav file.
         options: PlaybackOptions object.
+
+    Returns:
+        A List of WavData objects, one for each file path.
     """
-    data = _getData(file_path)
-    if options.start_sec is not None or options.end_sec is not None:
-        options.start_percent, options.end_percent = _calculatePercent(
-            data,
-            options.start_sec,
-            options.end_sec,
-        )
-    # If changing how edit functions are applied, make sure that you consider the
-    # effects of speeding up or reversing before cropping the sound.
-    for edit in [_cropSound, _speed, _volume, _reverse, _transpose]:
-        data = edit(data, options)
+    plan = compilePlan(options)
+    unique_paths = list(dict.fromkeys(file_paths))
+    workers = options.workers
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(unique_paths))
+    rendered = None
+    if workers > 1 and plan.passes() > 0:
+        executor = _getExecutor(workers)
+        try:
+            results = executor.map(
+                _renderFile, unique_paths, [plan] * len(unique_paths)
+            )
+            rendered = dict(zip(unique_paths, results))
+        except BrokenProcessPool:
+            # a worker died (or processes can't be started here), so render serially
+            _shutdownExecutor(executor)
+    if rendered is None:
+        rendered = {path: _renderFile(path, plan) for path in unique_paths}
+    return [rendered[path] for path in file_paths]
+
+
+def _renderFile(file_path, plan):
+    """Apply an EffectPlan to the wav file at file_path. Runs in a worker process
+    when renderSounds uses a process pool."""
+    return applyPlan(_getData(file_path), plan)
+
+
+def _getExecutor(workers):
+    """Process pool with [workers] processes, kept between renders so that the
+    processes (and their source caches) are reused.
+
+    Pools are never replaced while they work, since another thread may be using
+    them, so a pool is kept for each number of workers asked for.
+    """
+    with _executors_lock:
+        executor = _executors.get(workers)
+        if executor is None:
+            executor = ProcessPoolExecutor(max_workers=workers)
+            _executors[workers] = executor
+        return executor
+
+
+def _shutdownExecutor(executor):
+    """Shut down a broken pool, so that the next render starts a new one."""
+    with _executors_lock:
+        for workers, pool in list(_executors.items()):
+            if pool is executor:
+                del _executors[workers]
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def applyPlan(data, plan):
+    """Carry out each stage of an EffectPlan (see effect_plan.py).
+
+    Args:
+        data: WavData object.
+        plan: EffectPlan object.
+
+    Returns:
+        A WavData object.
+    """
+    for stage in plan:
+        data = _STAGE_FUNCTIONS[stage.name](data, **stage.args)
     return data
 
 
-def _speed(data, options):
-    speed = options.speed
-    if speed is None:
+def _changeTempo(data, speed):
+    """Speed a sound up or slow it down without changing its pitch.
+
+    This uses WSOLA (waveform similarity overlap-add): the output is built from
+    windows of the input that overlap by half, taken every speed half windows
+    instead of every half window. Each window may be moved a little so that it
+    lines up with the input that followed the last window, which keeps the
+    waveform continuous. Finding those positions is done one window at a time,
+    since each depends on the last; the windows are then cut out and added
+    together in batches.
+
+    Args:
+        data: WavData object.
+        speed: Float speed, where values above 1 speed the sound up.
+
+    Returns:
+        A WavData object.
+    """
+    framerate = data.params.framerate
+    nframes = data.params.nframes
+    decimation = _TEMPO_DECIMATION
+    half = max(int(framerate * TEMPO_WINDOW_SECONDS / 2) // decimation, 1) * decimation
+    window_frames = 2 * half
+    search = max(int(framerate * TEMPO_SEARCH_SECONDS) // decimation, 1) * decimation
+    out_frames = int(round(nframes / speed))
+    nwindows = out_frames // half + 2
+
+    # pad so that every window and search stays inside the samples
+    pad = window_frames + search + decimation + int(2 * half * speed)
+    # Channels come first so that every channel of a window is a contiguous run of
+    # samples.
+    samples = np.zeros((data.params.nchannels, nframes + 2 * pad), dtype=np.float32)
+    samples[:, pad : pad + nframes] = _toFloat(data).T
+    mono = samples.sum(axis=0)
+    ncoarse = len(mono) // decimation
+    coarse = sum(mono[i::decimation][:ncoarse] for i in range(decimation)) / decimation
+
+    # Each window has to line up with the one chosen before it, so the positions
+    # are found one after another (running the search on every window at once and
+    # repeating until nothing moves gives the same result, but takes about
+    # nwindows / 3 rounds). Everything that doesn't depend on the previous window
+    # is worked out up front, to keep the loop short.
+    nominal = pad - half + np.round(np.arange(nwindows) * half * speed).astype(int)
+    starts = ((nominal - search) // decimation).tolist()
+    coarse_half = half // decimation
+    region_frames = (2 * search + half) // decimation
+    positions = [pad - half]
+    target = positions[0] + half
+    for start in starts[1:]:
+        # the input that followed the last window, which this one should match
+        scores = np.correlate(
+            coarse[start : start + region_frames],
+            coarse[target // decimation : target // decimation + coarse_half],
+            "valid",
+        )
+        best = (start + int(scores.argmax()) - 1) * decimation
+        # refine to the exact frame
+        refined = np.correlate(
+            mono[best : best + 2 * decimation + half],
+            mono[target : target + half],
+            "valid",
+        )
+        position = best + int(refined.argmax())
+        positions.append(position)
+        target = position + half
+
+    # Windows overlap by half, so each half window of output is the second half of
+    # one window plus the first half of the next.
+    halves = sliding_window_view(samples, half, axis=1)
+    window = np.hanning(window_frames + 1)[:window_frames].astype(np.float32)
+    res = np.zeros((data.params.nchannels, nwindows + 1, half), dtype=np.float32)
+    positions = np.array(positions)
+    for first in range(0, nwindows, _TEMPO_BATCH_WINDOWS):
+        batch = positions[first : first + _TEMPO_BATCH_WINDOWS]
+        end = first + len(batch)
+        for offset, faded in [(0, window[:half]), (1, window[half:])]:
+            windows = halves[:, batch + offset * half]
+            windows *= faded
+            res[:, first + offset : end + offset] += windows
+    res = res.reshape(data.params.nchannels, -1).T
+    # the first window started half a window before the sound
+    return _fromFloat(res[half : half + out_frames], data.params)
+
+
+def _scaleVolume(data, volume):
+    if volume == 1:
         return data
-    # source: https://stackoverflow.com/questions/74136596/how-do-i-change-the-speed-of-an-audio-file-in-python-like-in-audacity-without
-    audio = AudioSegment(
-        data=data.frames,
-        sample_width=data.params.sampwidth,
-        frame_rate=data.params.framerate,
-        channels=data.params.nchannels,
+    low, high = _sampleRange(data.params.sampwidth)
+    if data.params.sampwidth == 1:
+        # 8 bit samples are centered on 128
+        scaled = (data.samples - 128.0) * volume + 128.0
+    else:
+        scaled = data.samples * float(volume)
+    np.clip(scaled, low, high, out=scaled)
+    np.floor(scaled, out=scaled)
+    return WavData(scaled.astype(data.samples.dtype), data.params)
+
+
+def _reverseSamples(data):
+    return data.slice(step=-1)
+
+
+def _pitchShift(data, semitones, volume=1, chunk_frames=PITCH_CHUNK_FRAMES):
+    """Transpose a sound without changing its length.
+
+    Every channel is shifted at once, at the sound's own frame rate. Long sounds
+    are shifted a chunk at a time so that librosa's working memory stays bounded.
+    Each chunk is shifted with PITCH_CHUNK_CONTEXT extra frames on both sides, so
+    the edges don't sound different from the middle, and neighbouring chunks are
+    lined up and fade into each other over PITCH_CHUNK_FADE frames.
+
+    Args:
+        data: WavData object.
+        semitones: Number of semitones to transpose by.
+        volume: Float volume, applied when the result is turned back into integer
+            samples.
+        chunk_frames: Int number of frames to shift at a time.
+
+    Returns:
+        A WavData object.
+    """
+    nframes = data.params.nframes
+    framerate = data.params.framerate
+    res = np.empty((nframes, data.params.nchannels), dtype=data.samples.dtype)
+    tail = None
+    for start in range(0, nframes, chunk_frames):
+        end = min(start + chunk_frames, nframes)
+        keep_start = start if tail is None else start - len(tail)
+        context_start = max(keep_start - PITCH_CHUNK_CONTEXT, 0)
+        context_end = min(end + PITCH_CHUNK_CONTEXT, nframes)
+        y = _toFloat(data.slice(context_start, context_end)).T
+        shifted = librosa.effects.pitch_shift(y, sr=framerate, n_steps=semitones).T
+        offset = keep_start - context_start
+        if tail is not None:
+            # The chunks aren't in phase with each other, so line this one up with
+            # the end of the last one before fading between them.
+            low = -min(PITCH_CHUNK_ALIGN, offset)
+            high = min(PITCH_CHUNK_ALIGN, context_end - end)
+            candidates = shifted[offset + low : offset + len(tail) + high]
+            offset += low + _bestLag(tail, candidates)
+        shifted = shifted[offset : offset + end - keep_start]
+        if tail is not None:
+            shifted[: len(tail)] = _blend(tail, shifted[: len(tail)])
+        # hold back the end of the chunk to fade it into the next one
+        write_end = end
+        if end < nframes:
+            write_end = max(end - PITCH_CHUNK_FADE, keep_start)
+        tail = shifted[write_end - keep_start :]
+        res[keep_start:write_end] = _fromFloat(
+            shifted[: write_end - keep_start], data.params, volume
+        ).samples
+    return WavData(res, data.params)
+
+
+def _bestLag(reference, candidates):
+    """Index into candidates (float samples) where the samples are most like
+    reference, which is shorter."""
+    correlation = np.correlate(candidates.sum(axis=1), reference.sum(axis=1), "valid")
+    return int(np.argmax(correlation))
+
+
+def _blend(fade_out, fade_in):
+    """Fade from one float sound to another of the same length.
+
+    Even lined up, the chunks that _pitchShift fades between aren't quite in phase,
+    and a plain linear fade between signals that partly cancel out dips in the
+    middle. So the fade is scaled by how correlated they are: not at all if they
+    match, and up to an equal power fade if they are unrelated.
+    """
+    weight = ((np.arange(len(fade_in)) + 0.5) / len(fade_in))[:, np.newaxis]
+    power = np.sqrt(np.sum(fade_out**2) * np.sum(fade_in**2))
+    correlation = 1.0 if power == 0 else np.sum(fade_out * fade_in) / power
+    correlation = min(max(correlation, 0.0), 1.0)
+    gain = np.sqrt(
+        (1 - weight) ** 2 + weight**2 + 2 * correlation * weight * (1 - weight)
     )
-    if speed > 1:
-        audio = speedup(audio, playback_speed=speed)
+    return (fade_out * (1 - weight) + fade_in * weight) / gain
+
+
+def _resample(data, speed, semitones, volume):
+    """Change the speed of a sound like a tape (varispeed) and transpose it with a
+    single resample.
+
+    Changing the speed by [speed] is a resample by 1 / speed. Transposing by [semitones]
+    is a time stretch by the pitch ratio followed by a resample by its inverse, so
+    the two resamples are combined into one. The volume is applied when the result
+    is turned back into integer samples.
+
+    Args:
+        data: WavData object.
+        speed: Float speed, where values below 1 slow the sound down (and lower
+            its pitch).
+        semitones: Number of semitones to transpose by.
+        volume: Float volume.
+    """
+    framerate = data.params.framerate
+    if semitones == 0:
+        # a plain resample, which soxr does for every channel at once
+        y = soxr.resample(_toFloat(data), framerate * speed, framerate)
+        return _fromFloat(y, data.params, volume)
+    y = _toFloat(data).T
+    ratio = 2 ** (semitones / 12)
+    y = librosa.effects.time_stretch(y, rate=1 / ratio)
+    if ratio * speed != 1:
+        y = librosa.resample(y, orig_sr=framerate * ratio * speed, target_sr=framerate)
+    return _fromFloat(y.T, data.params, volume)
+
+
+def _toFloat(data):
+    """The samples of data as float32, scaled to [-1, 1)."""
+    if data.params.sampwidth == 1:
+        return (data.samples.astype(np.float32) - 128) / 128
+    # a plain int scale above 2 ** 16 would make numpy return float64
+    scale = np.float32(2 ** (8 * data.params.sampwidth - 1))
+    return data.samples.astype(np.float32) / scale
+
+
+def _fromFloat(samples, params, volume=1):
+    """Turn float samples in [-1, 1) back into a WavData object with params.
+
+    The samples are multiplied by volume, clipped to the range of the sample width
+    and rounded down.
+    """
+    low, high = _sampleRange(params.sampwidth)
+    # float32 can't hold the largest 32 bit sample, so scale in float64
+    samples = samples.astype(np.float64)
+    if params.sampwidth == 1:
+        scaled = samples * (128.0 * volume) + 128.0
     else:
-        altered_audio = audio._spawn(
-            audio.raw_data, overrides={"frame_rate": int(audio.frame_rate * speed)}
-        )
-        audio = altered_audio.set_frame_rate(audio.frame_rate)
-    return _audioSegmentToWavData(audio)
+        scaled = samples * (2.0 ** (8 * params.sampwidth - 1) * volume)
+    np.clip(scaled, low, high, out=scaled)
+    np.floor(scaled, out=scaled)
+    return WavData(scaled.astype(_SAMPLE_DTYPES[params.sampwidth]), params)
 
 
-def _volume(data, options):
-    volume = options.volume
-    if volume is None:
+def _crop(data, start, end):
+    """Crop data to the part from [start] to [end], as fractions of its length.
+
+    The result is a view of the original samples, so nothing is copied.
+    """
+    if start == 0 and end == 1:
         return data
-    new_data = audioop.mul(data.frames, data.params.sampwidth, volume)
-    return WavData(new_data, data.params)
+    start_index = int(start * data.params.nframes)
+    stop_index = int(end * data.params.nframes)
+    return data.slice(start_index, stop_index)
 
 
-def _reverse(data, options):
-    if not options.reverse:
-        return data
-    new_data = audioop.reverse(data.frames, data.params.sampwidth)
-    return WavData(new_data, data.params)
+def _cropSeconds(data, start, end):
+    """Crop data to the part from [start] to [end] seconds (either can be None)."""
+    return _crop(data, *_calculatePercent(data, start, end))
 
 
-def _transpose(data, options):
-    if options.transpose is None or options.transpose == 0:
-        return data
-    with tempfile.TemporaryDirectory() as temp_dir:
-        path = str(Path(temp_dir, "sound.wav"))
-        with wave.open(path, mode="wb") as wav_file:
-            wav_file.setparams(data.params)
-            wav_file.writeframes(data.frames)
-        y, sr = librosa.load(path)
-        new_y = librosa.effects.pitch_shift(y, sr=sr, n_steps=options.transpose)
-        soundfile.write(path, new_y, sr)
-        return _getData(path)
-
-
-def _cropSound(data, options):
-    """Returns modified audio data for the cropped sound starting at start_percent and ending at end_percent.
-
-    Make the buffer size a multiple of bytes-per-sample and the number of channels.
-    """
-    start_percent = options.start_percent
-    end_percent = options.end_percent
-    # Reset null positions
-    if start_percent is None:
-        start_percent = 0
-    if end_percent is None:
-        end_percent = 1
-
-    if start_percent == 0 and end_percent == 1:
-        return data
+def _concatenate(sounds, gap_ms=0, crossfade_ms=DEFAULT_CROSSFADE_MS):
+    """Join sounds one after another.
 
-    # Calculate start and end indices
-    def calculate_index(percent):
-        return int(
-            percent * len(data.frames) / (data.params.sampwidth * data.params.nchannels)
-        ) * (data.params.sampwidth * data.params.nchannels)
-
-    start_index = calculate_index(start_percent)
-    stop_index = calculate_index(end_percent)
-    new_data = data.frames[start_index:stop_index]
-    return WavData(new_data, data.params)
-
-
-def _concatenate(sounds):
-    sounds = [
-        AudioSegment(
-            data=sound.frames,
-            sample_width=sound.params.sampwidth,
-            frame_rate=sound.params.framerate,
-            channels=sound.params.nchannels,
-        )
-        for sound in sounds
-    ]
-    res = sounds[0]
-    for sound in sounds[1:]:
-        res = res.append(sound)
-    return _audioSegmentToWavData(res)
-
-
-def _overlay(sounds):
-    sounds = [
-        AudioSegment(
-            data=sound.frames,
-            sample_width=sound.params.sampwidth,
-            frame_rate=sound.params.framerate,
-            channels=sound.params.nchannels,
+    The sounds are first converted to a common format (see _commonParams). The
+    output is allocated once and each sound is copied into place once, so joining n
+    sounds takes time proportional to their total length.
+
+    Args:
+        sounds: List of WavData objects.
+        gap_ms: Float milliseconds of silence between sounds.
+        crossfade_ms: Float milliseconds that each sound overlaps the next, fading
+            linearly from one to the other. A crossfade is never longer than the
+            sounds it joins.
+
+    Returns:
+        A WavData object.
+    """
+    params = _commonParams(sounds)
+    parts = [_convertFormat(sound, params) for sound in sounds]
+    if len(parts) == 1:
+        return WavData(parts[0], params)
+    gap = int(gap_ms * params.framerate / 1000)
+    crossfade = int(crossfade_ms * params.framerate / 1000)
+    fades = [min(crossfade, len(a), len(b)) for a, b in zip(parts, parts[1:])]
+    total = sum(map(len, parts)) + gap * (len(parts) - 1) - sum(fades)
+
+    dtype = _SAMPLE_DTYPES[params.sampwidth]
+    res = np.full((total, params.nchannels), _silence(params), dtype=dtype)
+    position = 0
+    for i, part in enumerate(parts):
+        fade = 0
+        if i > 0:
+            position += gap
+            fade = fades[i - 1]
+        if fade > 0:
+            start = position - fade
+            res[start:position] = _crossfade(res[start:position], part[:fade], params)
+        res[position : position + len(part) - fade] = part[fade:]
+        position += len(part) - fade
+    return WavData(res, params)
+
+
+def _silence(params):
+    """Value of a silent sample (8 bit samples are unsigned)."""
+    return 128 if params.sampwidth == 1 else 0
+
+
+def _crossfade(previous, part, params):
+    """Samples that fade linearly from previous out to part in.
+
+    Args:
+        previous: Numpy array of samples that fade out.
+        part: Numpy array of samples that fade in, as long as previous.
+        params: wave params namedtuple describing both.
+
+    Returns:
+        A Numpy array of samples.
+    """
+    fade = len(previous)
+    silence = _silence(params)
+    fade_in = ((np.arange(fade) + 0.5) / fade)[:, np.newaxis]
+    mixed = (previous.astype(np.float64) - silence) * (1 - fade_in) + (
+        part - silence
+    ) * fade_in
+    low, high = _sampleRange(params.sampwidth)
+    return np.clip(np.floor(mixed + silence), low, high)
+
+
+def _commonParams(sounds):
+    """Format that every sound can be converted to without losing anything: the
+    most channels, highest frame rate and widest samples of any of them."""
+    return sounds[0].params._replace(
+        nchannels=max(sound.params.nchannels for sound in sounds),
+        framerate=max(sound.params.framerate for sound in sounds),
+        sampwidth=max(sound.params.sampwidth for sound in sounds),
+        nframes=0,
+    )
+
+
+def _convertFormat(data, params):
+    """Samples of data converted to the format described by params.
+
+    Returns data.samples itself if nothing needs to change.
+
+    Raises:
+        ValueError: The channels can't be converted (only mono sounds can be given
+            more channels).
+    """
+    samples = data.samples
+    if data.params.framerate != params.framerate:
+        resampled = soxr.resample(
+            _toFloat(data), data.params.framerate, params.framerate
         )
-        for sound in sounds
-    ]
-    res = sounds[0]
-    for sound in sounds[1:]:
-        # we need to check the length because if the overlayed sound is longer
-        # than the original, it is truncated
-        if len(res) >= len(sound):
-            res = res.overlay(sound)
-        else:
-            res = sound.overlay(res)
+        samples = _fromFloat(resampled, params).samples
+    elif data.params.sampwidth != params.sampwidth:
+        samples = _widenSamples(samples, data.params.sampwidth, params.sampwidth)
+    if data.params.nchannels != params.nchannels:
+        if data.params.nchannels != 1:
+            raise ValueError(
+                f"Can't convert {data.params.nchannels} channels to {params.nchannels}"
+            )
+        samples = np.repeat(samples, params.nchannels, axis=1)
+    return samples
+
+
+def _widenSamples(samples, sampwidth, new_sampwidth):
+    """Convert samples to a wider sample width without losing anything."""
+    shifted = samples.astype(np.int64)
+    if sampwidth == 1:
+        # 8 bit samples are unsigned
+        shifted -= 128
+    shifted <<= 8 * (new_sampwidth - sampwidth)
+    if new_sampwidth == 1:
+        shifted += 128
+    return shifted.astype(_SAMPLE_DTYPES[new_sampwidth])
+
+
+def _overlay(sounds, mix=DEFAULT_MIX):
+    """Play sounds at the same time.
+
+    The sounds are converted to a common format (see _commonParams) and summed into
+    one preallocated array of 64 bit integers, so overlaying n sounds takes one
+    pass over each of them no matter how many there are. The result is as long as
+    the longest sound.
+
+    Args:
+        sounds: List of WavData objects.
+        mix: String way to fit the sum in the sample range (see _quantize).
+
+    Returns:
+        A WavData object.
+    """
+    params = _commonParams(sounds)
+    parts = [_convertFormat(sound, params) for sound in sounds]
+    total = np.zeros((max(map(len, parts)), params.nchannels), dtype=np.int64)
+    for part in parts:
+        _addSamples(total, part, params.sampwidth)
+    return WavData(_quantize(total, params, mix), params)
+
+
+def _addSamples(total, samples, sampwidth):
+    """Add samples to the start of total, an int64 array centered on 0."""
+    total[: len(samples)] += samples
+    if sampwidth == 1:
+        # 8 bit samples are centered on 128
+        total[: len(samples)] -= 128
 
-    return _audioSegmentToWavData(res)
+
+def _quantize(total, params, mix=DEFAULT_MIX):
+    """Turn summed samples (see _addSamples) back into samples of params' format.
+
+    Args:
+        total: int64 numpy array. It may be modified.
+        params: wave params namedtuple.
+        mix: "clip" to clip samples that are out of range (like pydub's overlay),
+            "limit" to scale the whole sound down only if some sample is out of
+            range, or "normalize" to scale it so the loudest sample is as loud as
+            possible.
+
+    Returns:
+        A numpy array of samples.
+    """
+    low, high = map(int, _sampleRange(params.sampwidth))
+    if params.sampwidth == 1:
+        low, high = low - 128, high - 128
+    if mix not in ("clip", "limit", "normalize"):
+        raise ValueError(f"Unknown mix mode {mix}")
+    if mix != "clip" and total.size > 0:
+        peak = int(np.abs(total).max())
+        if peak > 0 and (mix == "normalize" or peak > high):
+            total = np.rint(total * (high / peak)).astype(np.int64)
+    np.clip(total, low, high, out=total)
+    if params.sampwidth == 1:
+        total += 128
+    return total.astype(_SAMPLE_DTYPES[params.sampwidth])
 
 
 def _calculatePercent(
@@ -185,9 +750,7 @@ def _calculatePercent(
 
     start_percent and end_percent will both be returned as floats, even if they are not None.
     """
-    total_duration_seconds = len(data.frames) / (
-        data.params.framerate * data.params.sampwidth * data.params.nchannels
-    )
+    total_duration_seconds = data.params.nframes / data.params.framerate
 
     # Calculate start percent
     if start_sec is None:
@@ -204,20 +767,13 @@ def _calculatePercent(
     return start_percent, end_percent
 
 
-def _audioSegmentToWavData(audio):
-    # if we directly export this as a wav, it's somehow corrupted when we tried to read
-    # it back and play it.
-    # But, if we export it as a mp3, load it, export it as a wav, and then play that,
-    # everything works as intended 💯😁
-
-    # We originally wanted to use tempfile.NamedTemporaryFile but that has issues
-    # on windows. See discussion on stack overflow here:
-    # https://stackoverflow.com/questions/23212435/permission-denied-to-write-to-my-temporary-file
-    with tempfile.TemporaryDirectory() as temp_dir:
-        mp3_path = str(Path(temp_dir, "mp3_sound.mp3"))
-        wav_path = str(Path(temp_dir, "wav_sound.wav"))
-        with open(mp3_path, "w+"), open(wav_path, "w+"):
-            audio.export(mp3_path, format="mp3")
-            audio = AudioSegment.from_mp3(mp3_path)
-            audio.export(wav_path, format="wav")
-            return _getData(wav_path)
+# Functions that carry out each kind of EffectPlan stage.
+_STAGE_FUNCTIONS = {
+    "crop": _crop,
+    "crop_seconds": _cropSeconds,
+    "tempo": _changeTempo,
+    "volume": _scaleVolume,
+    "reverse": _reverseSamples,
+    "transpose": _pitchShift,
+    "resample": _resample,
+}
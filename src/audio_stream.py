@@ -0,0 +1,451 @@
+"""This module renders edited sounds block by block and feeds the blocks to a sink
+as they are produced, so playback can start before the whole render is done.
+
+streamEdit turns sounds and PlaybackOptions into a BlockStream. Effects that work on
+one sample at a time (crop, reverse, volume and slowing down without transposing)
+are applied to each block as it is needed, so the first block is ready after a
+constant amount of work no matter how long the sounds are. Effects that need the
+whole sound (changing the tempo and transposing) render that sound first.
+Sounds that can't be streamed are rendered with audio_edits.renderSounds, which can
+use several processes. Sounds played one after another or together are joined or
+mixed block by block too, unless they have different formats or the mix needs the
+loudest sample of the whole mix.
+
+A sink is anything with open(params), write(block) and close() methods. close
+returns once everything written has been played. NullSink and FileSink are useful
+for tests, SounddeviceSink plays blocks as they arrive through sounddevice, and
+SimpleaudioSink plays through simpleaudio when sounddevice can't be used.
+simpleaudio can only play whole buffers, and starting a new one leaves a gap, so
+SimpleaudioSink plays the whole render as one buffer once it is done.
+
+stopAll stops every sink that is playing.
+"""
+
+import importlib.util
+import itertools
+import threading
+import time
+import wave
+import numpy as np
+import soxr
+from audio_edits import (
+    WavData,
+    _SAMPLE_DTYPES,
+    _addSamples,
+    _crop,
+    _cropSeconds,
+    _crossfade,
+    _fromFloat,
+    _getData,
+    _quantize,
+    _reverseSamples,
+    _scaleVolume,
+    _silence,
+    _toFloat,
+    edit,
+    renderSounds,
+)
+from effect_plan import compilePlan
+
+# 4096 frames is under 0.1 seconds at 44.1kHz
+DEFAULT_BLOCK_FRAMES = 4096
+# sounddevice needs the PortAudio library, so it is only imported when it is used.
+HAS_SOUNDDEVICE = importlib.util.find_spec("sounddevice") is not None
+# Stages that streamEdit applies block by block.
+_VIEW_STAGES = {"crop": _crop, "crop_seconds": _cropSeconds, "reverse": _reverseSamples}
+
+# Incremented by stopAll. Sinks opened before the last stopAll are stopped.
+_stop_count = 0
+# Held while stopping, and while a sink starts playing so it can't miss a stop.
+_stop_lock = threading.Lock()
+
+
+def stopAll():
+    """Stop every sink that is playing or waiting for blocks. Blocks that haven't
+    been played yet are thrown away."""
+    global _stop_count
+    with _stop_lock:
+        _stop_count += 1
+        if SimpleaudioSink.used:
+            import simpleaudio as sa
+
+            sa.stop_all()
+
+
+class BlockStream:
+    """Blocks of a sound that are rendered as they are iterated over.
+
+    Attributes:
+        params: wave params namedtuple describing every block (nframes is 0, since
+            the length may not be known until the end).
+    """
+
+    def __init__(self, params, blocks):
+        self.params = params._replace(nframes=0)
+        self._blocks = blocks
+
+    def __iter__(self):
+        return iter(self._blocks)
+
+
+def streamData(data, block_frames=DEFAULT_BLOCK_FRAMES):
+    """Make a BlockStream that splits an already rendered WavData object."""
+    return BlockStream(data.params, _split(data, block_frames))
+
+
+def streamEdit(file_paths, options, block_frames=DEFAULT_BLOCK_FRAMES):
+    """Apply audio effects to sounds, rendering the result a block at a time.
+
+    The blocks sound the same as audio_edits.edit(file_paths, options).
+
+    Args:
+        file_paths: String List file paths to wav files.
+        options: PlaybackOptions object.
+        block_frames: Int number of frames per block.
+
+    Returns:
+        A BlockStream whose blocks are WavData objects.
+    """
+    if len(file_paths) > 1 and options.parallel and options.mix != "clip":
+        # limiting and normalizing need the loudest sample of the whole mix
+        return streamData(edit(file_paths, options), block_frames)
+    plan = compilePlan(options)
+    if all(_isStreamable(stage) for stage in plan):
+        streams = [_streamSound(path, plan, block_frames) for path in file_paths]
+    else:
+        sounds = renderSounds(file_paths, options)
+        streams = [streamData(sound, block_frames) for sound in sounds]
+    if len(streams) == 1:
+        return streams[0]
+    formats = {
+        (s.params.nchannels, s.params.framerate, s.params.sampwidth) for s in streams
+    }
+    if len(formats) > 1:
+        # sounds of different formats are converted as a whole
+        return streamData(edit(file_paths, options), block_frames)
+    params = streams[0].params
+    if not options.parallel:
+        return BlockStream(
+            params, _join(streams, params, options.gap_ms, options.crossfade_ms)
+        )
+    return BlockStream(
+        params, _mix([_reblock(stream, block_frames) for stream in streams], params)
+    )
+
+
+def _streamSound(file_path, plan, block_frames):
+    """Make a BlockStream for one sound with an EffectPlan that only has stages
+    that can be streamed applied."""
+    data = _getData(file_path)
+    # Cropping and reversing are views, and reversing commutes with the others, so
+    # they are applied to the whole sound up front.
+    volume = 1
+    resample = None
+    for stage in plan:
+        if stage.name in _VIEW_STAGES:
+            data = _VIEW_STAGES[stage.name](data, **stage.args)
+        elif stage.name == "volume":
+            volume = stage.args["volume"]
+        else:
+            resample = stage
+    if resample is None:
+        blocks = (_scaleVolume(block, volume) for block in _split(data, block_frames))
+        return BlockStream(data.params, blocks)
+    return BlockStream(
+        data.params,
+        _resampleBlocks(
+            data, resample.args["speed"], resample.args["volume"], block_frames
+        ),
+    )
+
+
+def _isStreamable(stage):
+    if stage.name == "resample":
+        return stage.args["semitones"] == 0
+    return stage.name in _VIEW_STAGES or stage.name == "volume"
+
+
+def _split(data, block_frames):
+    """Yield consecutive blocks of data (views, so nothing is copied)."""
+    for start in range(0, data.params.nframes, block_frames):
+        yield data.slice(start, start + block_frames)
+
+
+def _resampleBlocks(data, speed, volume, block_frames):
+    """Yield blocks of data slowed down by a factor of speed (see _resample)."""
+    framerate = data.params.framerate
+    resampler = soxr.ResampleStream(
+        framerate * speed, framerate, data.params.nchannels, dtype="float32"
+    )
+    blocks = list(_split(data, block_frames)) or [data]
+    for i, block in enumerate(blocks):
+        last = i == len(blocks) - 1
+        resampled = resampler.resample_chunk(_toFloat(block), last=last)
+        if len(resampled) > 0:
+            yield _fromFloat(resampled, data.params, volume)
+
+
+def _reblock(stream, block_frames):
+    """Yield the samples of a stream in blocks of exactly block_frames frames (but
+    the last one may be shorter)."""
+    pending = []
+    pending_frames = 0
+    for block in stream:
+        pending.append(block.samples)
+        pending_frames += len(block.samples)
+        if pending_frames < block_frames:
+            continue
+        samples = np.concatenate(pending)
+        end = len(samples) - len(samples) % block_frames
+        for start in range(0, end, block_frames):
+            yield samples[start : start + block_frames]
+        pending = [samples[end:]]
+        pending_frames = len(samples) - end
+    if pending_frames > 0:
+        yield np.concatenate(pending)
+
+
+def _join(streams, params, gap_ms, crossfade_ms):
+    """Yield blocks of streams played one after another, joined the same way as
+    audio_edits._concatenate joins whole sounds.
+
+    A stream can only fade into the last crossfade_ms of what came before it, so
+    only that much is held back until the next stream starts.
+    """
+    gap = int(gap_ms * params.framerate / 1000)
+    crossfade = int(crossfade_ms * params.framerate / 1000)
+    dtype = _SAMPLE_DTYPES[params.sampwidth]
+    empty = np.zeros((0, params.nchannels), dtype=dtype)
+    held = empty
+    previous_frames = 0
+    for i, stream in enumerate(streams):
+        blocks = (block.samples for block in stream)
+        fade = 0
+        if i > 0:
+            # read enough of this stream to know how long the crossfade is
+            head = []
+            head_frames = 0
+            for samples in blocks:
+                head.append(samples)
+                head_frames += len(samples)
+                if head_frames >= crossfade:
+                    break
+            head = np.concatenate(head) if head else empty
+            fade = min(crossfade, previous_frames, len(head))
+            silence = np.full((gap, params.nchannels), _silence(params), dtype=dtype)
+            held = np.concatenate([held, silence])
+            if fade > 0:
+                start = len(held) - fade
+                held[start:] = _crossfade(held[start:], head[:fade], params)
+            blocks = itertools.chain([head[fade:]], blocks)
+        frames = fade
+        for samples in blocks:
+            frames += len(samples)
+            held = np.concatenate([held, samples])
+            if len(held) > crossfade:
+                end = len(held) - crossfade
+                yield WavData(held[:end], params)
+                held = held[end:]
+        previous_frames = frames
+    if len(held) > 0:
+        yield WavData(held, params)
+
+
+def _mix(sample_streams, params):
+    """Yield blocks that are the sum of the blocks of each stream, clipped.
+
+    Streams that end early are treated as silence.
+    """
+    iterators = [iter(stream) for stream in sample_streams]
+    while True:
+        blocks = []
+        for iterator in iterators:
+            block = next(iterator, None)
+            if block is not None:
+                blocks.append(block)
+        if len(blocks) == 0:
+            return
+        mixed = np.zeros((max(map(len, blocks)), params.nchannels), dtype=np.int64)
+        for block in blocks:
+            _addSamples(mixed, block, params.sampwidth)
+        yield WavData(_quantize(mixed, params, "clip"), params)
+
+
+def play(stream, sink, keep_blocks=False):
+    """Write every block of a stream to a sink and wait until it has been played.
+
+    Args:
+        stream: BlockStream object.
+        sink: A sink, such as a NullSink.
+        keep_blocks: Whether to return the blocks (for joinBlocks).
+
+    Returns:
+        A list of the blocks that were played if keep_blocks is True, else None.
+    """
+    blocks = [] if keep_blocks else None
+    sink.open(stream.params)
+    try:
+        for block in stream:
+            sink.write(block)
+            if keep_blocks:
+                blocks.append(block)
+    finally:
+        sink.close()
+    return blocks
+
+
+def joinBlocks(params, blocks):
+    """Join blocks from a BlockStream into one WavData object."""
+    if len(blocks) == 0:
+        dtype = _SAMPLE_DTYPES[params.sampwidth]
+        return WavData(np.zeros((0, params.nchannels), dtype=dtype), params)
+    return WavData(np.concatenate([block.samples for block in blocks]), params)
+
+
+class NullSink:
+    """Sink that throws blocks away. Useful for tests and timing renders.
+
+    Attributes:
+        params: The params the sink was opened with.
+        frames: Int number of frames written.
+        blocks: Int number of blocks written.
+        first_block_time: Float seconds from open to the first write, or None.
+    """
+
+    def __init__(self):
+        self.params = None
+        self.frames = 0
+        self.blocks = 0
+        self.first_block_time = None
+        self._opened = None
+
+    def open(self, params):
+        self.params = params
+        self._opened = time.perf_counter()
+
+    def write(self, block):
+        if self.first_block_time is None:
+            self.first_block_time = time.perf_counter() - self._opened
+        self.frames += block.params.nframes
+        self.blocks += 1
+
+    def close(self):
+        pass
+
+
+class FileSink:
+    """Sink that writes blocks to a wav file.
+
+    Attributes:
+        path: String path to the wav file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._wav_file = None
+
+    def open(self, params):
+        self._wav_file = wave.open(str(self.path), "wb")
+        self._wav_file.setparams(params)
+
+    def write(self, block):
+        self._wav_file.writeframes(block.frames)
+
+    def close(self):
+        self._wav_file.close()
+
+
+class SimpleaudioSink:
+    """Sink that plays blocks with simpleaudio.
+
+    simpleaudio can only play whole buffers, with a gap between one buffer and the
+    next, so blocks are gathered and played as one buffer when the sink is closed.
+
+    Attributes:
+        used: Class-wide bool - whether any SimpleaudioSink has played something.
+    """
+
+    used = False
+
+    def __init__(self):
+        self._params = None
+        self._pending = []
+        self._stop_count = None
+
+    def open(self, params):
+        self._params = params
+        self._pending = []
+        self._stop_count = _stop_count
+
+    def write(self, block):
+        if not self._stopped():
+            self._pending.append(block.frames)
+
+    def close(self):
+        import simpleaudio as sa
+
+        frames = b"".join(self._pending)
+        self._pending = []
+        with _stop_lock:
+            if self._stopped() or len(frames) == 0:
+                return
+            SimpleaudioSink.used = True
+            play_obj = sa.play_buffer(
+                frames,
+                self._params.nchannels,
+                self._params.sampwidth,
+                self._params.framerate,
+            )
+        play_obj.wait_done()
+
+    def _stopped(self):
+        return self._stop_count != _stop_count
+
+
+class SounddeviceSink:
+    """Sink that plays blocks without gaps through the sounddevice package.
+
+    Raises:
+        ImportError: sounddevice isn't installed (see HAS_SOUNDDEVICE).
+    """
+
+    _DTYPES = {1: "uint8", 2: "int16", 3: "int24", 4: "int32"}
+
+    def __init__(self):
+        self._stream = None
+        self._stop_count = None
+
+    def open(self, params):
+        import sounddevice
+
+        self._stream = sounddevice.RawOutputStream(
+            samplerate=params.framerate,
+            channels=params.nchannels,
+            dtype=self._DTYPES[params.sampwidth],
+        )
+        self._stop_count = _stop_count
+        self._stream.start()
+
+    def write(self, block):
+        if self._stop_count == _stop_count:
+            self._stream.write(block.frames)
+
+    def close(self):
+        if self._stop_count == _stop_count:
+            # stop waits for everything written to be played
+            self._stream.stop()
+        else:
+            self._stream.abort()
+        self._stream.close()
+
+
+def defaultSink():
+    """Make the best sink available for playing sounds."""
+    if HAS_SOUNDDEVICE:
+        try:
+            import sounddevice
+        except OSError:
+            # sounddevice is installed, but the PortAudio library it uses isn't
+            return SimpleaudioSink()
+        return SounddeviceSink()
+    return SimpleaudioSink()
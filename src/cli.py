@@ -2,16 +2,24 @@
 
 import argparse
 import pathlib
+from archive_client import DEFAULT_SERVER_ADDRESS, ArchiveClient, ServerUnavailable
+from effect_plan import compilePlan
+from playback_options import DEFAULT_CROSSFADE_MS, DEFAULT_MIX, MIX_MODES, SPEED_MODES
 from playback_options import PlaybackOptions
-from pydub.exceptions import CouldntDecodeError
 from commander import *
+from storage_commander import findSoundFiles
+
+
+# Commands that can be sent to a server with --server. The others always run here.
+SERVER_COMMANDS = {"play", "list", "find", "search", "add", "tag"}
 
 
 class Cli:
     """CLI for the audio archive.
 
     Attributes:
-        commander: A Commander object, such as the one in commander.py.
+        commander: A Commander object, such as the one in commander.py, or an
+            archive_client.ArchiveClient for the commands in SERVER_COMMANDS.
     """
 
     def __init__(self, commander):
@@ -24,6 +32,16 @@ class Cli:
         """
         self.commander = commander
         self.parser = argparse.ArgumentParser(description="Audio archive")
+        self.parser.add_argument(
+            "--server",
+            action="store_true",
+            help=f"send {', '.join(sorted(SERVER_COMMANDS))} commands to an archive server started with the serve command",
+        )
+        self.parser.add_argument(
+            "--address",
+            default=DEFAULT_SERVER_ADDRESS,
+            help=f"host:port or unix://path of the server used with --server (default: {DEFAULT_SERVER_ADDRESS})",
+        )
         # since we want to have subself.commander, we create a subparser
         # by specifying dest="command", args.command will now hold the name of
         # the command
@@ -42,7 +60,13 @@ class Cli:
             "-s",
             "--speed",
             type=float,
-            help="float playback speed for audio (default: 1.0). NOTE: You must have FFmpeg installed in order to change the speed",
+            help="float playback speed for audio (default: 1.0)",
+        )
+
+        play_parser.add_argument(
+            "--speed-mode",
+            choices=SPEED_MODES,
+            help="varispeed changes the speed like a tape, which changes the pitch too; tempo keeps the pitch (default: keep the pitch when speeding up, and not when slowing down)",
         )
 
         play_parser.add_argument(
@@ -90,6 +114,41 @@ class Cli:
             "-t", "--transpose", type=int, help="transposes the sound by n semitones"
         )
 
+        play_parser.add_argument(
+            "--gap",
+            type=float,
+            default=0,
+            help="milliseconds of silence between sounds played one after another (default: 0)",
+        )
+
+        play_parser.add_argument(
+            "--crossfade",
+            type=float,
+            default=None,
+            help=f"milliseconds that sounds played one after another overlap (default: {DEFAULT_CROSSFADE_MS}, or 0 with --gap)",
+        )
+
+        play_parser.add_argument(
+            "--mix",
+            choices=MIX_MODES,
+            default=DEFAULT_MIX,
+            help=f"how sounds played with -p are kept from getting too loud: clip the loud parts, limit the whole mix only if it is too loud, or normalize it (default: {DEFAULT_MIX})",
+        )
+
+        play_parser.add_argument(
+            "-j",
+            "--workers",
+            type=int,
+            default=1,
+            help="number of processes to apply effects to the sounds with (default: 1)",
+        )
+
+        play_parser.add_argument(
+            "--explain",
+            action="store_true",
+            help="print the steps that will be used to apply the effects",
+        )
+
         # nargs='+' means that we expect at least one argument
         play_parser.add_argument(
             "names", type=str, nargs="+", help="names of sounds to play"
@@ -103,6 +162,24 @@ class Cli:
             "-n", "--name", type=str, help="name of sound", default=None
         )
 
+        import_parser = subparsers.add_parser(
+            "import",
+            description="Add every sound file in a directory (and its subdirectories) to the audio archive. Sounds are named after their files, and files whose name is already in the archive are skipped",
+        )
+        import_parser.add_argument(
+            "directory", type=pathlib.Path, help="directory to import"
+        )
+        import_parser.add_argument(
+            "-a", "--author", type=str, help="author of the sounds", default=None
+        )
+        import_parser.add_argument(
+            "-j",
+            "--workers",
+            type=int,
+            help="number of files to convert at once (default: one per CPU core)",
+            default=None,
+        )
+
         remove_parser = subparsers.add_parser(
             "remove",
             description="Remove sounds from the audio archive. NOTE: This is permanent and cannot be undone",
@@ -133,7 +210,29 @@ class Cli:
             help="Shows all sounds by default - specify tags to show sounds with tags",
         )
         list_parser.add_argument(
-            "tags", type=str, nargs="*", help="Show sounds with tags"
+            "tags", type=str, nargs="*", help="Show sounds with any of these tags"
+        )
+        list_parser.add_argument(
+            "-m",
+            "--match-all",
+            action="store_true",
+            help="only show sounds that have every one of the tags",
+        )
+        list_parser.add_argument(
+            "-x",
+            "--exclude",
+            type=str,
+            nargs="+",
+            default=[],
+            help="hide sounds with any of these tags",
+        )
+        list_parser.add_argument(
+            "-s",
+            "--sort",
+            type=str,
+            choices=["name", "date_added"],
+            default="name",
+            help="order to list sounds in (default: name)",
         )
 
         rename_parser = subparsers.add_parser(
@@ -153,6 +252,29 @@ class Cli:
             help="Maximum number of results to return (default: 10)",
         )
 
+        search_parser = subparsers.add_parser(
+            "search",
+            description="Keyword search for sounds by name, author and tags. Words match the start of words in the searched fields",
+        )
+        search_parser.add_argument(
+            "words", type=str, nargs="+", help="Words to search for"
+        )
+        search_parser.add_argument(
+            "-f",
+            "--fields",
+            type=str,
+            nargs="+",
+            choices=["name", "author", "tags"],
+            default=["name", "author", "tags"],
+            help="Fields to search (default: all of them)",
+        )
+        search_parser.add_argument(
+            "-n",
+            type=int,
+            default=10,
+            help="Maximum number of results to return (default: 10)",
+        )
+
         rename_parser.add_argument("name", type=str, help="name of sound")
         rename_parser.add_argument("new_name", type=str, help="new name for sound")
 
@@ -160,19 +282,54 @@ class Cli:
             "clean",
             description="Remove all sounds from archive that do not have an associated file",
         )
+        clean_parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="list the sounds that would be removed without removing them",
+        )
+
+        cache_parser = subparsers.add_parser(
+            "cache",
+            description="Show how many edited sounds are kept for replaying, and how much space they use",
+        )
+        cache_parser.add_argument(
+            "--clear", action="store_true", help="delete all kept edited sounds"
+        )
 
-    def executeCommand(self):
+        serve_parser = subparsers.add_parser(
+            "serve",
+            description="Keep the archive open and answer commands sent with --server, which makes them start much faster",
+        )
+        # without an address, the one given with --address is used
+        serve_parser.add_argument(
+            "address",
+            nargs="?",
+            default=argparse.SUPPRESS,
+            help=f"host:port or unix://path to listen on (default: {DEFAULT_SERVER_ADDRESS})",
+        )
+
+    def executeCommand(self, args=None):
         """Parses arguments and calls appropriate function to handle command.
 
         This uses a dynamic dispatch by using getattr() to find the function from
         the command name.
+
+        Args:
+            args: Parsed arguments, or None to parse the command line.
         """
-        args = self.parser.parse_args()
+        if args is None:
+            args = self.parser.parse_args()
+        if args.command is None:
+            self.parser.print_help()
+            return
         method_name = f"_handle{args.command.capitalize()}"
         handle_function = getattr(self, method_name)
         handle_function(args)
 
     def _handlePlay(self, args):
+        crossfade = args.crossfade
+        if crossfade is None:
+            crossfade = 0 if args.gap > 0 else DEFAULT_CROSSFADE_MS
         try:
             playback_options = PlaybackOptions(
                 speed=args.speed,
@@ -185,7 +342,14 @@ class Cli:
                 save=args.save,
                 transpose=args.transpose,
                 parallel=args.parallel,
+                workers=args.workers,
+                gap_ms=args.gap,
+                crossfade_ms=crossfade,
+                mix=args.mix,
+                speed_mode=args.speed_mode,
             )
+            if args.explain:
+                print(compilePlan(playback_options).explain())
             self.commander.playAudio(args.names, playback_options)
 
         except ValueError as e:
@@ -200,12 +364,13 @@ class Cli:
             )
 
     def _handleList(self, args):
-        # TODO: Consider a better way to handle filtering by tags.
-        if len(args.tags) == 0:
-            sounds = self.commander.storage.getAll()
-        else:
-            sounds = self.commander.storage.getByTags(args.tags)
-
+        # print sounds as they're loaded instead of waiting for the whole archive
+        sounds = self.commander.storage.iterSounds(
+            order_by=args.sort,
+            tags=args.tags,
+            match_all=args.match_all,
+            exclude=args.exclude,
+        )
         for sound in sounds:
             print(sound)
 
@@ -214,6 +379,13 @@ class Cli:
         for sound in sounds:
             print(sound)
 
+    def _handleSearch(self, args):
+        sounds = self.commander.storage.search(
+            " ".join(args.words), fields=args.fields, limit=args.n
+        )
+        for sound in sounds:
+            print(sound)
+
     def _handleRename(self, args):
         try:
             self.commander.storage.rename(str(args.name), str(args.new_name))
@@ -223,6 +395,9 @@ class Cli:
             print(f"There is already a sound named {str(args.new_name)} in the archive")
 
     def _handleAdd(self, args):
+        # pydub is slow to import, so only commands that decode sounds import it
+        from pydub.exceptions import CouldntDecodeError
+
         try:
             self.commander.storage.addSound(args.filename, args.name)
         except NameExists:
@@ -234,6 +409,10 @@ class Cli:
                 print(f"There is already a sound named {str(args.name)} in the archive")
         except FileNotFoundError:
             print(f"{args.filename} is not a valid path to a file")
+        except FileExistsError as e:
+            print(
+                f"{e}, but isn't in the archive. Move it away, or choose another name with -n or --name"
+            )
         except ValueError as e:
             print(e)
         except CouldntDecodeError:
@@ -241,6 +420,26 @@ class Cli:
                 f"Error: Unsupported file format. ffmpeg is required for many file formats"
             )
 
+    def _handleImport(self, args):
+        if not args.directory.is_dir():
+            print(f"{args.directory} is not a directory")
+            return
+        if args.workers is not None and args.workers < 1:
+            print("The number of workers must be at least 1")
+            return
+        try:
+            report = self.commander.storage.addSounds(
+                findSoundFiles(args.directory), args.author, args.workers
+            )
+        except ValueError as e:
+            print(e)
+            return
+        for path, error in report.failed:
+            print(f"Couldn't add {path}: {error}")
+        print(
+            f"Added {len(report.added)} sounds, skipped {len(report.skipped)}, {len(report.failed)} failed"
+        )
+
     def _handleRemove(self, args):
         try:
             self.commander.storage.removeSound(args.name)
@@ -259,16 +458,57 @@ class Cli:
         except ValueError as e:
             print(e)
 
-    def _handleClean(self, _args):
-        self.commander.storage.clean()
+    def _handleClean(self, args):
+        removed_sounds = self.commander.storage.clean(dry_run=args.dry_run)
+        for sound in removed_sounds:
+            print(f"{sound.name}: {sound.file_path} is missing")
+        if args.dry_run:
+            print(f"Would remove {len(removed_sounds)} sounds")
+        else:
+            print(f"Removed {len(removed_sounds)} sounds")
+
+    def _handleServe(self, args):
+        from server import serve
+
+        serve(self.commander, args.address)
+
+    def _handleCache(self, args):
+        render_cache = self.commander.render_cache
+        if render_cache is None:
+            print("Edited sounds are not being kept")
+            return
+        if args.clear:
+            render_cache.clear()
+        stats = render_cache.stats()
+        print(
+            f"{stats['entries']} edited sounds using {stats['bytes'] / 2**20:.1f} MiB "
+            f"of {render_cache.max_bytes / 2**20:.0f} MiB in {render_cache.directory}"
+        )
+
+
+def main():
+    cli = Cli(None)
+    args = cli.parser.parse_args()
+    if args.server and args.command in SERVER_COMMANDS:
+        try:
+            cli.commander = ArchiveClient(args.address)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+    else:
+        try:
+            cli.commander = Commander(render_cache_directory="render_cache/")
+        except FileNotFoundError as f:
+            print(f"Error: {f}")
+            print("See README.md for initialization instructions")
+            return
+    try:
+        cli.executeCommand(args)
+    except ServerUnavailable as e:
+        print(f"Error: {e}. Start it with `python src/cli.py serve`")
+    finally:
+        cli.commander.close()
 
 
 if __name__ == "__main__":
-    try:
-        commander = Commander()
-    except FileNotFoundError as f:
-        print(f"Error: {f}")
-        print("See README.md for initialization instructions")
-    else:
-        cli = Cli(commander)
-        cli.executeCommand()
+    main()
@@ -2,12 +2,12 @@
 sounds, adding sounds to the archive, renaming them, etc.
 """
 
-from audio_edits import edit
-import simpleaudio as sa
 import tempfile
 import wave
 from pathlib import Path
 
+from play_stats import PlayStatsRecorder
+from render_cache import RenderCache
 from storage_commander import StorageCommander
 from sqlite_storage import Sqlite
 
@@ -27,24 +27,48 @@ class Commander:
 
     Attributes:
         storage: A Storage object.
+        play_stats: PlayStatsRecorder that play counts are recorded through. Call
+            play_stats.flush() to write them before reading them back.
     """
 
-    def __init__(self, sounds_directory="sounds/", database_path="audio_archive.db"):
+    def __init__(
+        self,
+        sounds_directory="sounds/",
+        database_path="audio_archive.db",
+        render_cache_directory=None,
+        output=None,
+    ):
         """Constructor. Creates a storage object.
 
         Args:
             sounds_directory: String path to directory containing archive sounds.
             database_path: String name of database file.
+            render_cache_directory: String path to a directory to keep edited sounds
+                in so that they can be replayed without applying the effects again,
+                or None to not keep them.
+            output: Function that returns a new sink to play each sound through
+                (see audio_stream.py), or None for audio_stream.defaultSink.
 
         Raises:
             FileNotFoundError: Not able to connect to the database.
         """
         self.storage = StorageCommander(Sqlite(database_path), sounds_directory)
+        self.render_cache = None
+        if render_cache_directory is not None:
+            self.render_cache = RenderCache(render_cache_directory)
+        self.output = output
+        self.play_stats = PlayStatsRecorder(self.storage)
 
     # getter method required to use fuzzy search in Luke's search screen GUI
     def fetchStorageCommander(self):
         return self.storage
 
+    def close(self):
+        """Write any play statistics that are left and release the storage's
+        database connections."""
+        self.play_stats.close()
+        self.storage.close()
+
     def playAudio(self, names, options):
         """Play a audio files after applying audio effects to them.
 
@@ -61,6 +85,51 @@ class Commander:
             ValueError: options.save is longer than the maximum length for a sound.
             FileNotFoundError: The file path associated with a name is not a valid file.
         """
+        # audio_stream imports numpy, librosa and pydub, which take a while, so
+        # they are only imported once a sound is played.
+        from audio_stream import defaultSink, joinBlocks, play
+
+        file_paths = self._filePaths(names)
+        # written to the database in the background (see play_stats.py)
+        self.play_stats.record(names)
+
+        # Blocks are played as soon as they are rendered. The whole render is only
+        # put together afterwards if it needs to be cached or saved.
+        key, stream = self._stream(file_paths, options)
+        keep_blocks = key is not None or options.save is not None
+        output = defaultSink if self.output is None else self.output
+        blocks = play(stream, output(), keep_blocks)
+
+        if keep_blocks:
+            self._keep(joinBlocks(stream.params, blocks), key, options)
+
+    def renderAudio(self, names, options):
+        """Apply audio effects to sounds like playAudio does, without playing them.
+
+        Args:
+            names: String List names of sounds.
+            options: A playback_options object.
+
+        Returns:
+            A WavData object.
+
+        Raises:
+            The same exceptions as playAudio.
+        """
+        from audio_stream import joinBlocks
+
+        key, stream = self._stream(self._filePaths(names), options)
+        wav_data = joinBlocks(stream.params, list(stream))
+        self._keep(wav_data, key, options)
+        return wav_data
+
+    def _filePaths(self, names):
+        """String paths to the files of the sounds called names.
+
+        Raises:
+            NameMissing: A sound does not exist in storage.
+            FileNotFoundError: The file path associated with a name is not a valid file.
+        """
         file_paths = []
         for name in names:
             audio = self.storage.getByName(name)
@@ -68,29 +137,33 @@ class Commander:
             if not file_path.is_file():
                 raise FileNotFoundError(f"Path not found: {str(file_path)}")
             file_paths.append(str(file_path))
+        return file_paths
 
-        for name in names:
-            self.storage.updateLastPlayed(name)
-            self.storage.incrementPlayCount(name)
-
-        wav_data = edit(file_paths, options)
-
-        wave_obj = sa.WaveObject(
-            wav_data.frames,
-            wav_data.params.nchannels,
-            wav_data.params.sampwidth,
-            wav_data.params.framerate,
-        )
-        play_obj = wave_obj.play()
+    def _stream(self, file_paths, options):
+        """Find the render of file_paths with options in the render cache, or start
+        rendering it.
 
+        Returns:
+            The render cache key to store the render under (None if it is already
+            stored or there is no render cache) and a BlockStream.
+        """
+        from audio_stream import streamData, streamEdit
+
+        if self.render_cache is None:
+            return None, streamEdit(file_paths, options)
+        key = self.render_cache.key(file_paths, options)
+        cached = self.render_cache.get(key)
+        if cached is not None:
+            return None, streamData(cached)
+        return key, streamEdit(file_paths, options)
+
+    def _keep(self, wav_data, key, options):
+        """Store a render in the render cache under key (unless key is None) and
+        save it as a new sound if options.save is set."""
+        if key is not None:
+            self.render_cache.put(key, wav_data)
         if options.save is not None:
-            try:
-                self._saveWavData(wav_data, options.save)
-            except Exception as e:
-                play_obj.wait_done()
-                raise e
-
-        play_obj.wait_done()
+            self._saveWavData(wav_data, options.save)
 
     def _saveWavData(self, wav_data, name):
         """Saves the edited sound to a file and to the database.
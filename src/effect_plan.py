@@ -0,0 +1,173 @@
+"""This module turns PlaybackOptions into an EffectPlan: the list of steps needed to
+apply the options to a sound.
+
+Applying every effect in a fixed order means walking over the samples once per
+effect, even for effects that do nothing. compilePlan instead:
+    * leaves out effects that don't change the sound (speed 1, volume 1, ...),
+    * crops first so that the other effects only see the part that is kept,
+    * combines a slow down (or any speed change in varispeed mode) and a transpose
+      into one resampling step, since changing the speed like a tape is itself a
+      resample,
+    * and folds the volume into the step that turns floating point samples back
+      into integers when there is one, instead of giving it its own pass.
+
+The steps themselves are carried out by audio_edits. Use EffectPlan.explain to see
+what a plan will do.
+"""
+
+# Stages that only return a view of the samples, so they cost nothing.
+_VIEW_STAGES = {"crop", "crop_seconds", "reverse"}
+
+
+class Stage:
+    """One step of an EffectPlan.
+
+    Attributes:
+        name: String name of the step (see audio_edits for what each one does).
+        args: Dictionary of keyword arguments for the step.
+    """
+
+    def __init__(self, name, **args):
+        self.name = name
+        self.args = args
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, Stage)
+            and self.name == other.name
+            and self.args == other.args
+        )
+
+    def __repr__(self):
+        args = ", ".join(f"{key}={value!r}" for key, value in self.args.items())
+        return f"Stage({self.name!r}, {args})" if args else f"Stage({self.name!r})"
+
+    def describe(self):
+        """Short human readable description of the step."""
+        args = self.args
+        if self.name == "crop":
+            return f"crop from {args['start']:.1%} to {args['end']:.1%} (view)"
+        if self.name == "crop_seconds":
+            start = 0 if args["start"] is None else args["start"]
+            end = "the end" if args["end"] is None else f"{args['end']}s"
+            return f"crop from {start}s to {end} (view)"
+        if self.name == "reverse":
+            return "reverse (view)"
+        if self.name == "tempo":
+            return f"change tempo x{args['speed']}, keeping the pitch (WSOLA)"
+        if self.name == "volume":
+            return f"volume x{args['volume']}"
+        parts = []
+        if args.get("speed", 1) < 1:
+            parts.append(f"slow down x{args['speed']}")
+        elif args.get("speed", 1) > 1:
+            parts.append(f"speed up x{args['speed']}")
+        if args.get("semitones", 0) != 0:
+            parts.append(f"transpose {args['semitones']:+} semitones")
+        if args.get("volume", 1) != 1:
+            parts.append(f"volume x{args['volume']}")
+        return f"{self.name}: {', '.join(parts)}"
+
+
+class EffectPlan:
+    """The steps needed to apply a PlaybackOptions object to a sound.
+
+    Attributes:
+        stages: List of Stage objects, in the order they are applied.
+        skipped: String list of the options that were left out because they don't
+            change the sound.
+    """
+
+    def __init__(self, stages, skipped=()):
+        self.stages = list(stages)
+        self.skipped = list(skipped)
+
+    def __len__(self):
+        return len(self.stages)
+
+    def __iter__(self):
+        return iter(self.stages)
+
+    def passes(self):
+        """Number of steps that go over every sample (views are free)."""
+        return sum(1 for stage in self.stages if stage.name not in _VIEW_STAGES)
+
+    def explain(self):
+        """Describe the plan, one step per line."""
+        if len(self.stages) == 0:
+            lines = ["play the sound as it is"]
+        else:
+            lines = [
+                f"{i}. {stage.describe()}" for i, stage in enumerate(self.stages, 1)
+            ]
+        lines.append(f"{self.passes()} pass(es) over the samples")
+        if len(self.skipped) > 0:
+            lines.append(f"skipped: {', '.join(self.skipped)}")
+        return "\n".join(lines)
+
+
+def compilePlan(options):
+    """Turn a PlaybackOptions object into an EffectPlan.
+
+    The result sounds the same as applying the effects one at a time in the order
+    crop, speed, volume, reverse, transpose. The only differences are that the
+    volume may be applied after a later effect (so clipping happens once, at the
+    end), and that slowing down is done with a higher quality resampler.
+
+    Args:
+        options: PlaybackOptions object. It isn't modified.
+
+    Returns:
+        An EffectPlan.
+    """
+    stages = []
+    skipped = []
+
+    if options.start_sec is not None or options.end_sec is not None:
+        if options.start_sec in (None, 0) and options.end_sec is None:
+            skipped.append("crop")
+        else:
+            stages.append(
+                Stage("crop_seconds", start=options.start_sec, end=options.end_sec)
+            )
+    else:
+        start = 0 if options.start_percent is None else options.start_percent
+        end = 1 if options.end_percent is None else options.end_percent
+        if start == 0 and end == 1:
+            skipped.append("crop")
+        else:
+            stages.append(Stage("crop", start=start, end=end))
+
+    speed = 1 if options.speed is None else options.speed
+    volume = 1 if options.volume is None else options.volume
+    semitones = 0 if options.transpose is None else options.transpose
+    if speed == 1:
+        skipped.append("speed")
+    if volume == 1:
+        skipped.append("volume")
+    if semitones == 0:
+        skipped.append("transpose")
+    if not options.reverse:
+        skipped.append("reverse")
+
+    mode = options.speed_mode
+    if (speed < 1 and mode is None) or (speed != 1 and mode == "varispeed"):
+        # Changing the speed like a tape is a resample, so a transpose can share it.
+        # Reversing commutes with both, so it can wait until after.
+        stages.append(
+            Stage("resample", speed=speed, semitones=semitones, volume=volume)
+        )
+        if options.reverse:
+            stages.append(Stage("reverse"))
+        return EffectPlan(stages, skipped)
+
+    if speed != 1:
+        # what is left is a speed up, or a tempo change asked for with --speed-mode
+        stages.append(Stage("tempo", speed=speed))
+    if volume != 1 and semitones == 0:
+        stages.append(Stage("volume", volume=volume))
+    if options.reverse:
+        stages.append(Stage("reverse"))
+    if semitones != 0:
+        stages.append(Stage("transpose", semitones=semitones, volume=volume))
+    return EffectPlan(stages, skipped)
@@ -0,0 +1,240 @@
+"""This module holds the parts of fuzzy name search that don't depend on storage.
+
+Sound names are indexed by their trigrams (every substring of length 3 after padding
+the name on both sides). One edit (insertion, deletion or substitution) changes at
+most 3 of a name's trigrams, so the number of trigrams two names share gives a lower
+bound on their edit distance. The storage uses this to only compute edit distances
+for the names that could possibly be among the closest results.
+See https://en.wikipedia.org/wiki/N-gram#n-grams_for_approximate_matching
+
+The rest of the module holds the edit distance kernels and TopK, which keeps track of
+the closest results while the candidates are scored.
+"""
+
+from collections import Counter
+import heapq
+import importlib.util
+
+TRIGRAM_SIZE = 3
+# The padding only needs to be the same for every name, so it doesn't matter if a
+# name happens to contain these characters.
+_START_PADDING = "^" * (TRIGRAM_SIZE - 1)
+_END_PADDING = "$" * (TRIGRAM_SIZE - 1)
+# Smallest number of candidates worth handing to batchEditDistance.
+MIN_BATCH_SIZE = 32
+# batchEditDistance is only used if numpy is available. It is imported when first
+# needed so that importing this module stays cheap.
+HAS_NUMPY = importlib.util.find_spec("numpy") is not None
+
+
+def trigrams(word):
+    """Count the trigrams in word.
+
+    Returns:
+        A Counter mapping each trigram to the number of times it appears in word.
+        The counts always add up to len(word) + 2.
+    """
+    padded = f"{_START_PADDING}{word}{_END_PADDING}"
+    return Counter(
+        padded[i : i + TRIGRAM_SIZE] for i in range(len(padded) - TRIGRAM_SIZE + 1)
+    )
+
+
+def distanceLowerBound(length1, length2, shared):
+    """Lowest possible edit distance between two words given their shared trigrams.
+
+    Args:
+        length1: Int length of the first word.
+        length2: Int length of the second word.
+        shared: Int number of trigrams the words have in common (counting repeats).
+
+    Returns:
+        An int that is never larger than the edit distance between the words.
+    """
+    most = max(length1, length2) + TRIGRAM_SIZE - 1
+    # ceiling division
+    return max(-(-(most - shared) // TRIGRAM_SIZE), abs(length1 - length2))
+
+
+def editDistance(word1, word2, max_distance=None):
+    """Find edit distance from word1 to word2, giving up once it exceeds max_distance.
+
+    Only the two most recent rows of the dynamic programming table are kept, and only
+    the cells within max_distance of the diagonal are filled in (Ukkonen's band),
+    since any path through the other cells already costs more than max_distance.
+
+    Args:
+        word1: String.
+        word2: String.
+        max_distance: Int or None. If None, the exact distance is always computed.
+
+    Returns:
+        The edit distance if it is at most max_distance, otherwise max_distance + 1.
+    """
+    # common prefixes and suffixes never change the distance
+    start = 0
+    while start < len(word1) and start < len(word2) and word1[start] == word2[start]:
+        start += 1
+    end1, end2 = len(word1), len(word2)
+    while end1 > start and end2 > start and word1[end1 - 1] == word2[end2 - 1]:
+        end1 -= 1
+        end2 -= 1
+    word1, word2 = word1[start:end1], word2[start:end2]
+    n, m = len(word1), len(word2)
+    if max_distance is None:
+        max_distance = max(n, m)
+    over = max_distance + 1
+    if abs(n - m) > max_distance:
+        return over
+    if n == 0 or m == 0:
+        return max(n, m)
+
+    previous = [j if j <= max_distance else over for j in range(m + 1)]
+    current = [over] * (m + 1)
+    for i in range(1, n + 1):
+        low = max(1, i - max_distance)
+        high = min(m, i + max_distance)
+        current[low - 1] = i if low == 1 else over
+        row_min = current[low - 1]
+        char = word1[i - 1]
+        for j in range(low, high + 1):
+            cost = previous[j - 1] + (char != word2[j - 1])
+            if previous[j] + 1 < cost:
+                cost = previous[j] + 1
+            if current[j - 1] + 1 < cost:
+                cost = current[j - 1] + 1
+            current[j] = cost
+            if cost < row_min:
+                row_min = cost
+        if row_min > max_distance:
+            return over
+        # the next row reads one cell past the band, which must count as too far
+        if high < m:
+            current[high + 1] = over
+        previous, current = current, previous
+    return min(previous[m], over)
+
+
+def batchEditDistance(target, words):
+    """Find the edit distance from every word to target at once with numpy.
+
+    The words are padded into one array so that each row of the dynamic programming
+    table is computed for all words together. Within a row, insertions are handled
+    with a running minimum instead of a loop over the characters.
+
+    Args:
+        target: String.
+        words: String list.
+
+    Returns:
+        A numpy int array with the edit distance from each word to target.
+
+    Raises:
+        ImportError: numpy isn't installed (see HAS_NUMPY).
+    """
+    import numpy as np
+
+    lengths = np.fromiter((len(word) for word in words), dtype=np.int32)
+    width = int(lengths.max(initial=0))
+    # -1 never matches a character, so the padding can't lower any distance
+    codes = np.full((len(words), width), -1, dtype=np.int32)
+    for row, word in enumerate(words):
+        codes[row, : len(word)] = [ord(char) for char in word]
+    columns = np.arange(width + 1, dtype=np.int32)
+    previous = np.broadcast_to(columns, (len(words), width + 1))
+    for i, char in enumerate(target, start=1):
+        current = np.empty_like(previous)
+        current[:, 0] = i
+        current[:, 1:] = np.minimum(
+            previous[:, :-1] + (codes != ord(char)), previous[:, 1:] + 1
+        )
+        # current[j] = min(current[k] + (j - k)) for k <= j
+        current = np.minimum.accumulate(current - columns, axis=1) + columns
+        previous = current
+    return previous[np.arange(len(words)), lengths]
+
+
+def scoreCandidates(best, target, candidates):
+    """Compute edit distances to target and add the results to best.
+
+    Candidates whose lower bound rules them out are skipped. Large groups of
+    candidates are scored together with batchEditDistance when numpy is available,
+    and the rest use editDistance, which gives up as soon as a candidate can't make
+    it into best.
+
+    Args:
+        best: TopK object.
+        target: String to compare to.
+        candidates: List of (item, name, lower bound on distance) tuples.
+    """
+    candidates = [candidate for candidate in candidates if best.accepts(candidate[2])]
+    if HAS_NUMPY and len(candidates) >= MIN_BATCH_SIZE:
+        names = [name for _, name, _ in candidates]
+        distances = batchEditDistance(target, names)
+        for (item, name, _), distance in zip(candidates, distances):
+            best.push(int(distance), name, item)
+        return
+    for item, name, _ in candidates:
+        best.push(editDistance(name, target, best.maxDistance()), name, item)
+
+
+class _Ranked:
+    """Heap entry for TopK, ordered so that the worst result is at the top."""
+
+    def __init__(self, distance, name, item):
+        self.distance = distance
+        self.name = name
+        self.item = item
+
+    def __lt__(self, other):
+        return (self.distance, self.name) > (other.distance, other.name)
+
+
+class TopK:
+    """Keep the k closest results seen so far.
+
+    Results are ranked by edit distance and then by name, and the k best are kept in
+    a heap so that adding a result costs O(log k).
+
+    Attributes:
+        k: Int maximum number of results.
+    """
+
+    def __init__(self, k):
+        self.k = k
+        self._heap = []
+
+    def __len__(self):
+        return len(self._heap)
+
+    def isFull(self):
+        return len(self._heap) >= self.k
+
+    def maxDistance(self):
+        """Largest edit distance a new result could have and still be kept.
+
+        Returns None if any distance would do (there are fewer than k results).
+        """
+        if not self.isFull():
+            return None
+        return self._heap[0].distance
+
+    def accepts(self, lower_bound):
+        """Whether a result with distance of at least lower_bound could be kept."""
+        max_distance = self.maxDistance()
+        return max_distance is None or lower_bound <= max_distance
+
+    def push(self, distance, name, item):
+        """Add a result, dropping the worst one if there are more than k."""
+        if self.k <= 0:
+            return
+        ranked = _Ranked(distance, name, item)
+        if not self.isFull():
+            heapq.heappush(self._heap, ranked)
+        elif self._heap[0] < ranked:
+            heapq.heapreplace(self._heap, ranked)
+
+    def results(self):
+        """List of (distance, name, item) tuples, closest first."""
+        ranked = sorted(self._heap, reverse=True)
+        return [(result.distance, result.name, result.item) for result in ranked]
@@ -1,7 +1,7 @@
 from kivy.app import App
 from kivy.uix.gridlayout import GridLayout
 from kivy.uix.button import Button
-import simpleaudio as sa
+from audio_stream import stopAll
 from threading import Thread
 from kivy.config import Config
 from kivy.core.window import Window
@@ -47,7 +47,7 @@ class MyGridLayout(GridLayout):
         else:
             self.stopRestart.text = "Play"
             self.stopRestart.background_color = self.colorOptions[1]
-            sa.stop_all()
+            stopAll()
         self.paused = not self.paused
         return None
 
@@ -67,7 +67,7 @@ class PlayMenuApp(App):
         keyboard, keycode, text, modifiers = args[:4]
         # Check if the pressed key is the escape key (keycode 27)
         if keycode == 27:
-            sa.stop_all()
+            stopAll()
 
     def build(self):
         Window.bind(on_key_down=self.on_key_down)
@@ -80,4 +80,4 @@ def playMenu(names, commander, options, customThreadClass=None):
         customThreadClass.setThreadedValue(menuApp)
     menuApp.run()
     # on window close
-    sa.stop_all()
+    stopAll()
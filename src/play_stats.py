@@ -0,0 +1,193 @@
+"""This module records when sounds are played without making playback wait for the
+database.
+
+PlayStatsRecorder keeps play events in memory and a background thread writes them
+to storage in batches: one statement and one commit for every sound played since the
+last batch, however many times each was played. Events are written at the latest
+flush_interval seconds after they are recorded, and any that are left are written
+by close. Events that are left when a recorder is garbage collected or the
+interpreter exits are written too, but neither the background thread nor that
+clean up keeps a recorder alive.
+"""
+
+from collections import Counter
+import sys
+import threading
+import time
+import weakref
+
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+
+class _PendingPlays:
+    """Play events waiting to be written to storage.
+
+    They are kept apart from PlayStatsRecorder so that they can be written after
+    the recorder is gone.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+        # name -> number of plays and time of the last one
+        self.counts = Counter()
+        self.times = {}
+        self.lock = threading.Lock()
+        # held while a batch is written, so write can wait for one in progress
+        self.write_lock = threading.Lock()
+
+    def add(self, names, play_time):
+        """Add events, returning whether there were none before."""
+        with self.lock:
+            was_empty = len(self.counts) == 0
+            for name in names:
+                self.counts[name] += 1
+                self.times[name] = max(self.times.get(name, 0), play_time)
+        return was_empty
+
+    def write(self):
+        """Write every event now, waiting until they are committed. If writing
+        fails, the events are kept to be written next time."""
+        with self.write_lock:
+            plays = self._take()
+            if len(plays) == 0:
+                return
+            try:
+                self.storage.recordPlays(plays)
+            except BaseException:
+                self._putBack(plays)
+                raise
+
+    def _take(self):
+        """Remove and return the events as recordPlays tuples."""
+        with self.lock:
+            plays = [
+                (name, count, self.times[name]) for name, count in self.counts.items()
+            ]
+            self.counts.clear()
+            self.times.clear()
+        return plays
+
+    def _putBack(self, plays):
+        """Merge events taken by _take back in with any recorded since."""
+        with self.lock:
+            for name, count, play_time in plays:
+                self.counts[name] += count
+                self.times[name] = max(self.times.get(name, 0), play_time)
+
+
+def _finish(pending, has_events, closing):
+    """Stop a recorder's background thread and write what it left. Called by close,
+    and when a recorder that wasn't closed is garbage collected or the interpreter
+    exits."""
+    closing.set()
+    has_events.set()
+    pending.write()
+
+
+def _flushInBackground(recorder_ref, has_events, closing, flush_interval):
+    """Body of a recorder's background thread. It only holds the recorder while
+    writing, so an unused recorder can still be garbage collected."""
+    while not closing.is_set():
+        has_events.wait()
+        # let more events arrive so they are written together
+        closing.wait(flush_interval)
+        has_events.clear()
+        recorder = recorder_ref()
+        if recorder is None:
+            return
+        try:
+            recorder.flush()
+        except Exception as e:
+            # keep the thread alive so later plays are still written
+            print(f"Couldn't write play statistics: {e}", file=sys.stderr)
+        del recorder
+
+
+class PlayStatsRecorder:
+    """Write-behind buffer of play events for a StorageCommander.
+
+    It is safe to use from several threads.
+
+    Attributes:
+        storage: StorageCommander (or anything with a recordPlays method) to write
+            to.
+        flush_interval: Float most seconds an event waits before being written.
+    """
+
+    def __init__(self, storage, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.storage = storage
+        self.flush_interval = flush_interval
+        self._pending = _PendingPlays(storage)
+        self._lock = threading.Lock()
+        # set when there are events to write, and when closing
+        self._has_events = threading.Event()
+        self._closing = threading.Event()
+        self._thread = None
+        self._closed = False
+        # weakref.finalize runs at exit too, so the recorder isn't kept alive to be
+        # closed then
+        self._finalizer = weakref.finalize(
+            self, _finish, self._pending, self._has_events, self._closing
+        )
+
+    def record(self, names, play_time=None):
+        """Remember that sounds were played. Returns without touching the database.
+
+        Args:
+            names: String list of names of the sounds that were played.
+            play_time: Integer seconds since epoch, or None for now.
+
+        Raises:
+            RuntimeError: close has been called.
+        """
+        if play_time is None:
+            play_time = int(time.time())
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Play statistics recorder has been closed")
+            if self._pending.add(names, play_time):
+                self._has_events.set()
+            if self._thread is None:
+                # the thread is only started once something is played, so commands
+                # that don't play anything don't pay for it
+                self._thread = threading.Thread(
+                    target=_flushInBackground,
+                    args=(
+                        weakref.ref(self),
+                        self._has_events,
+                        self._closing,
+                        self.flush_interval,
+                    ),
+                    name="play-stats",
+                    daemon=True,
+                )
+                self._thread.start()
+
+    def flush(self):
+        """Write every recorded event now, waiting until they are committed.
+
+        Raises:
+            Whatever storage.recordPlays raises. The events are kept, and written
+            by the next flush.
+        """
+        self._pending.write()
+
+    def close(self):
+        """Stop the background thread and write anything left. Safe to call more
+        than once."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+        self._closing.set()
+        self._has_events.set()
+        if thread is not None:
+            thread.join()
+        # writes what is left, and unregisters the clean up at exit
+        self._finalizer()
+
+    def pending(self):
+        """Int number of sounds with plays that haven't been written yet."""
+        with self._pending.lock:
+            return len(self._pending.counts)
@@ -1,3 +1,15 @@
+# Sounds played one after another overlap by this much by default.
+DEFAULT_CROSSFADE_MS = 100
+# Ways to keep sounds played at the same time from going out of range (see
+# audio_edits._quantize).
+MIX_MODES = ("clip", "limit", "normalize")
+DEFAULT_MIX = "clip"
+# Ways to change the speed of a sound: "varispeed" resamples it like a tape, which
+# also changes its pitch, and "tempo" keeps the pitch. None speeds sounds up
+# without changing their pitch and slows them down like a tape.
+SPEED_MODES = ("varispeed", "tempo")
+
+
 class PlaybackOptions:
     def __init__(
         self,
@@ -11,6 +23,11 @@ class PlaybackOptions:
         save,
         transpose,
         parallel,
+        workers=1,
+        gap_ms=0,
+        crossfade_ms=DEFAULT_CROSSFADE_MS,
+        mix=DEFAULT_MIX,
+        speed_mode=None,
     ):
         """Constructor.
 
@@ -21,6 +38,12 @@ class PlaybackOptions:
             start_percent/end_percent: float, 0 <= start_percent < end_percent < 1
             start_sec/end_sec: float >= 0
             parallel: bool (if true, the sounds will be overlayed, else they will be concatenated)
+            workers: int >= 1, number of processes to render sounds with, or None for
+                one per CPU core
+            gap_ms/crossfade_ms: float >= 0, milliseconds of silence or overlap between
+                sounds that are played one after another (only one can be nonzero)
+            mix: one of MIX_MODES, how sounds played at the same time are kept in range
+            speed_mode: one of SPEED_MODES or None, how the speed is changed
 
         Raises:
             ValueError: invalid option.
@@ -33,7 +56,7 @@ class PlaybackOptions:
             start_percent is not None and end_percent is not None
         ) and start_percent >= end_percent:
             raise ValueError("start_percent must be less than end_percent")
-        if (start_sec is not None and end_sec is not None) and start_sec <= end_sec:
+        if (start_sec is not None and end_sec is not None) and start_sec >= end_sec:
             raise ValueError("start_sec must be less than end_sec")
         if (start_percent is not None and (start_percent < 0 or start_percent > 1)) or (
             end_percent is not None and (end_percent < 0 or end_percent > 1)
@@ -43,6 +66,16 @@ class PlaybackOptions:
             end_sec is not None and end_sec < 0
         ):
             raise ValueError("Start/end second must be nonnegative")
+        if workers is not None and workers < 1:
+            raise ValueError("The number of workers must be at least 1")
+        if gap_ms < 0 or crossfade_ms < 0:
+            raise ValueError("Gap and crossfade lengths must be nonnegative")
+        if gap_ms > 0 and crossfade_ms > 0:
+            raise ValueError("Sounds can either have a gap or a crossfade, not both")
+        if mix not in MIX_MODES:
+            raise ValueError(f"Mix must be one of {', '.join(MIX_MODES)}")
+        if speed_mode is not None and speed_mode not in SPEED_MODES:
+            raise ValueError(f"Speed mode must be one of {', '.join(SPEED_MODES)}")
         num_percent_fields = int(start_percent is not None) + int(
             end_percent is not None
         )
@@ -59,3 +92,8 @@ class PlaybackOptions:
         self.save = save
         self.transpose = transpose
         self.parallel = parallel
+        self.workers = workers
+        self.gap_ms = gap_ms
+        self.crossfade_ms = crossfade_ms
+        self.mix = mix
+        self.speed_mode = speed_mode
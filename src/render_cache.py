@@ -0,0 +1,212 @@
+"""This module holds a cache of edited sounds on disk, so that playing the same
+sounds with the same effects again doesn't have to apply the effects again.
+
+Renders are keyed by the contents of the source files, the EffectPlan compiled from
+the playback options (so options that do the same thing share a render), and the
+code that applies the effects. Changing any of these gives a new key, so stale
+renders are never used; they are just evicted eventually. When the cache grows past
+its size limit, the least recently used renders are deleted.
+"""
+
+from collections import OrderedDict
+import hashlib
+import json
+import os
+from pathlib import Path
+import tempfile
+import threading
+import wave
+import effect_plan
+from effect_plan import compilePlan
+
+# Bump this to drop every existing render when effects change in a way that editing
+# the modules in _codeVersion wouldn't catch (like upgrading librosa).
+RENDER_CACHE_VERSION = 1
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+_HASH_CHUNK_SIZE = 1024 * 1024
+# Most source file hashes remembered, so a long running server doesn't keep one for
+# every file it has ever played.
+_MAX_FILE_HASHES = 4096
+
+
+class RenderCache:
+    """Size bounded, least recently used cache of edited sounds.
+
+    It is safe to use from several threads, and several processes can share a
+    directory.
+
+    Attributes:
+        directory: Path to the directory the renders are stored in. It is created
+            when the first render is stored.
+        max_bytes: Int largest total size of the stored renders.
+        hits: Int number of times get found a render.
+        misses: Int number of times get didn't find a render.
+        evictions: Int number of renders deleted to stay under max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # path -> (mtime, size, content hash), so unchanged files aren't read again,
+        # least recently used first
+        self._file_hashes = OrderedDict()
+        self._code_version = None
+        self._lock = threading.Lock()
+
+    def key(self, file_paths, options):
+        """Find the cache key for playing file_paths with options.
+
+        Args:
+            file_paths: String list of paths to wav files.
+            options: PlaybackOptions object.
+
+        Returns:
+            A hex string.
+        """
+        plan = compilePlan(options)
+        description = {
+            "code": self._codeVersion(),
+            "sources": [self._fileHash(file_path) for file_path in file_paths],
+            "plan": [[stage.name, stage.args] for stage in plan],
+            "parallel": bool(options.parallel) and len(file_paths) > 1,
+        }
+        if len(file_paths) > 1 and not options.parallel:
+            description["join"] = [options.gap_ms, options.crossfade_ms]
+        elif len(file_paths) > 1:
+            description["mix"] = options.mix
+        encoded = json.dumps(description, sort_keys=True).encode()
+        return hashlib.sha256(encoded).hexdigest()
+
+    def get(self, key):
+        """Find a stored render.
+
+        Returns:
+            A WavData object, or None if there is no render for key.
+        """
+        # audio_edits imports numpy and librosa, so wait until a sound is played
+        from audio_edits import _readWav
+
+        path = self._path(key)
+        try:
+            data = _readWav(str(path))
+            # mark the render as recently used
+            os.utime(path)
+        except (FileNotFoundError, EOFError, wave.Error):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key, data):
+        """Store a render, evicting the least recently used ones if needed.
+
+        Args:
+            key: String from key().
+            data: WavData object.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        # write to a temporary file of its own so that a partial render is never
+        # read, even when other threads or processes store the same render
+        fd, partial_name = tempfile.mkstemp(suffix=".partial", dir=self.directory)
+        partial_path = Path(partial_name)
+        try:
+            with os.fdopen(fd, "wb") as file, wave.open(file, "wb") as wav_file:
+                wav_file.setparams(data.params)
+                wav_file.writeframes(data.frames)
+            os.replace(partial_path, path)
+        finally:
+            partial_path.unlink(missing_ok=True)
+        self._evict()
+
+    def clear(self):
+        """Delete every stored render."""
+        for path, _ in self._entries():
+            path.unlink(missing_ok=True)
+
+    def stats(self):
+        """Dictionary with the counters and the number and total size of renders."""
+        entries = self._entries()
+        with self._lock:
+            counters = {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+        return {
+            **counters,
+            "entries": len(entries),
+            "bytes": sum(stat.st_size for _, stat in entries),
+        }
+
+    def _path(self, key):
+        return self.directory / f"{key}.wav"
+
+    def _entries(self):
+        """List of (Path, os.stat_result) for every stored render."""
+        if not self.directory.is_dir():
+            return []
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if entry.name.endswith(".wav"):
+                    try:
+                        entries.append((Path(entry.path), entry.stat()))
+                    except FileNotFoundError:
+                        # removed by another process
+                        pass
+        return entries
+
+    def _evict(self):
+        """Delete the least recently used renders until they fit in max_bytes."""
+        entries = sorted(self._entries(), key=lambda entry: entry[1].st_mtime_ns)
+        total = sum(stat.st_size for _, stat in entries)
+        for path, stat in entries:
+            if total <= self.max_bytes:
+                break
+            total -= stat.st_size
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                # evicted by another thread or process
+                continue
+            with self._lock:
+                self.evictions += 1
+
+    def _fileHash(self, file_path):
+        path = os.path.abspath(file_path)
+        stat = os.stat(path)
+        with self._lock:
+            entry = self._file_hashes.get(path)
+            if entry is not None and entry[:2] == (stat.st_mtime_ns, stat.st_size):
+                self._file_hashes.move_to_end(path)
+                return entry[2]
+        digest = hashlib.sha256()
+        with open(path, "rb") as file:
+            while chunk := file.read(_HASH_CHUNK_SIZE):
+                digest.update(chunk)
+        content_hash = digest.hexdigest()
+        with self._lock:
+            self._file_hashes[path] = (stat.st_mtime_ns, stat.st_size, content_hash)
+            self._file_hashes.move_to_end(path)
+            while len(self._file_hashes) > _MAX_FILE_HASHES:
+                self._file_hashes.popitem(last=False)
+        return content_hash
+
+    def _codeVersion(self):
+        """Hash of the code that renders sounds, along with RENDER_CACHE_VERSION."""
+        if self._code_version is None:
+            import audio_edits
+            import audio_stream
+            import wav_reader
+
+            digest = hashlib.sha256(str(RENDER_CACHE_VERSION).encode())
+            for module in [audio_edits, audio_stream, effect_plan, wav_reader]:
+                digest.update(Path(module.__file__).read_bytes())
+            self._code_version = digest.hexdigest()
+        return self._code_version
@@ -43,7 +43,16 @@ class SearchScreenLayout(BoxLayout):
 
     def search_sound(self, instance):
         storage = self.commander.fetchStorageCommander()
-        res = storage.fuzzySearch(self.query, n=5)
+        fields = []
+        if self.boxes.name:
+            fields.append("name")
+        if self.boxes.tag:
+            fields.append("tags")
+        res = [] if len(fields) == 0 else storage.search(self.query, fields, limit=5)
+        # keyword search only finds whole words, so fill in with fuzzy search on names
+        if self.boxes.name and len(res) < 5:
+            close_names = storage.fuzzySearch(self.query, n=5)
+            res += [sound for sound in close_names if sound not in res][: 5 - len(res)]
         popup = Popup(title="Search Results", size_hint=(None, None), size=(1200, 800))
         search_results = SearchResults(results=res, popup_instance=popup)
         popup.content = search_results
@@ -0,0 +1,227 @@
+"""This module runs the audio archive as a long running local server with an
+HTTP/JSON API.
+
+One Commander is shared by every request, so its database connections, decoded
+sound cache and render cache stay warm between commands, and the audio libraries
+are only imported once. archive_client.ArchiveClient talks to it, and
+`python src/cli.py --server [address] ...` uses that client.
+
+Endpoints:
+    GET /sounds?sort=&tag=&match_all=&exclude=  list sounds (see iterSounds)
+    GET /sounds/find?name=&n=                   fuzzy search by name
+    GET /sounds/search?q=&field=&limit=         keyword search
+    POST /sounds {file_path, name, author}      add a sound
+    PUT /tags {name, tag}, DELETE /tags         add or remove a tag
+    POST /play {names, options}                 play sounds on the server
+    POST /render {names, options}               return the edited sounds as a wav
+
+Errors are returned as {"error": exception name, "message": string}.
+
+The server is meant for the local machine only: it can read any file the user can
+(through POST /sounds), so don't listen on a public address.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import io
+import os
+import socket
+import wave
+from flask import Flask, Response, jsonify, request
+from pydub.exceptions import CouldntDecodeError
+from werkzeug.serving import BaseWSGIServer
+from archive_client import (
+    DEFAULT_SERVER_ADDRESS,
+    optionsFromDict,
+    parseAddress,
+    soundToDict,
+)
+from storage_exceptions import *
+
+# Number of requests handled at once. Each worker thread keeps its own database
+# connection, so this also bounds the number of open connections.
+SERVER_WORKERS = 8
+
+# HTTP status for each exception a command may raise.
+_ERROR_STATUSES = {
+    NameMissing: 404,
+    FileNotFoundError: 404,
+    NameExists: 409,
+    # a file that isn't in the archive is in the way
+    FileExistsError: 409,
+    ValueError: 400,
+    # a required field is missing from the request
+    KeyError: 400,
+    CouldntDecodeError: 415,
+}
+
+
+def createApp(commander):
+    """Make a Flask app that runs commands with commander.
+
+    Args:
+        commander: A Commander object. It must be usable from several threads.
+
+    Returns:
+        A Flask object.
+    """
+    app = Flask(__name__)
+    storage = commander.storage
+
+    for exception, status in _ERROR_STATUSES.items():
+        app.register_error_handler(exception, _errorHandler(status))
+
+    @app.get("/sounds")
+    def listSounds():
+        sounds = storage.iterSounds(
+            order_by=request.args.get("sort", "name"),
+            tags=request.args.getlist("tag"),
+            match_all=request.args.get("match_all", "0") == "1",
+            exclude=request.args.getlist("exclude"),
+        )
+        return jsonify([soundToDict(sound) for sound in sounds])
+
+    @app.get("/sounds/find")
+    def findSounds():
+        sounds = storage.fuzzySearch(request.args.get("name", ""), _intArg("n", 10))
+        return jsonify([soundToDict(sound) for sound in sounds])
+
+    @app.get("/sounds/search")
+    def searchSounds():
+        fields = request.args.getlist("field") or ["name", "author", "tags"]
+        sounds = storage.search(
+            request.args.get("q", ""), fields=fields, limit=_intArg("limit", 10)
+        )
+        return jsonify([soundToDict(sound) for sound in sounds])
+
+    @app.post("/sounds")
+    def addSound():
+        body = _jsonBody()
+        storage.addSound(body["file_path"], body.get("name"), body.get("author"))
+        return jsonify({}), 201
+
+    @app.put("/tags")
+    def addTag():
+        body = _jsonBody()
+        storage.addTag(body["name"], body["tag"])
+        return jsonify({})
+
+    @app.delete("/tags")
+    def removeTag():
+        body = _jsonBody()
+        storage.removeTag(body["name"], body["tag"])
+        return jsonify({})
+
+    @app.post("/play")
+    def play():
+        body = _jsonBody()
+        commander.playAudio(body["names"], optionsFromDict(body["options"]))
+        return jsonify({})
+
+    @app.post("/render")
+    def render():
+        body = _jsonBody()
+        wav_data = commander.renderAudio(
+            body["names"], optionsFromDict(body["options"])
+        )
+        wav_file = io.BytesIO()
+        with wave.open(wav_file, "wb") as wav_write:
+            wav_write.setparams(wav_data.params)
+            wav_write.writeframes(wav_data.frames)
+        return Response(wav_file.getvalue(), mimetype="audio/wav")
+
+    return app
+
+
+class _PooledWSGIServer(BaseWSGIServer):
+    """WSGI server that handles requests in a fixed pool of threads.
+
+    werkzeug's threaded server starts a new thread for every request instead.
+    """
+
+    def __init__(self, host, port, app, workers):
+        super().__init__(host, port, app)
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="archive-server"
+        )
+
+    def process_request(self, request, client_address):
+        self._executor.submit(self._handleRequest, request, client_address)
+
+    def _handleRequest(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self._executor.shutdown()
+
+
+def makeServer(commander, address=DEFAULT_SERVER_ADDRESS, workers=SERVER_WORKERS):
+    """Make a server for createApp(commander) that handles requests in a pool of
+    threads.
+
+    Call serve_forever on the result to run it, and shutdown to stop it.
+
+    Args:
+        commander: A Commander object.
+        address: String "host:port" or "unix://path" (see
+            archive_client.parseAddress).
+        workers: Int number of requests handled at once.
+    """
+    host, port = parseAddress(address)
+    return _PooledWSGIServer(host, port, createApp(commander), workers)
+
+
+def serve(commander, address=DEFAULT_SERVER_ADDRESS):
+    """Run a server until it is interrupted."""
+    # import the audio libraries now rather than on the first request
+    import audio_stream
+
+    server = makeServer(commander, address)
+    print(f"Serving the audio archive on {address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if server.address_family == getattr(socket, "AF_UNIX", None):
+            os.unlink(server.server_address)
+
+
+def _errorHandler(status):
+    def handle(error):
+        return jsonify({"error": type(error).__name__, "message": str(error)}), status
+
+    return handle
+
+
+def _jsonBody():
+    """The JSON object the request was sent with.
+
+    Raises:
+        ValueError: The body isn't a JSON object.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        raise ValueError("Expected a JSON object")
+    return body
+
+
+def _intArg(name, default):
+    """Int query parameter.
+
+    Raises:
+        ValueError: The parameter isn't an int.
+    """
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer")
@@ -0,0 +1,100 @@
+"""This module holds an in-memory cache of decoded sounds, so that a long running
+process (like the GUI) doesn't read the same wav file again every time it is played.
+
+Entries are keyed by path and remember the file's modification time and size, so a
+file that changed on disk is read again. The cache has a memory budget, and the least
+recently used sounds are dropped when it is exceeded.
+"""
+
+from collections import OrderedDict
+import os
+import threading
+
+DEFAULT_MAX_BYTES = 128 * 1024 * 1024
+
+
+class SourceCache:
+    """Memory bounded, least recently used cache of decoded sounds.
+
+    It is safe to use from several threads.
+
+    Attributes:
+        max_bytes: Int largest total size of the cached sounds (see resize).
+        hits: Int number of times get found an up to date sound.
+        misses: Int number of times get had to load a sound.
+        evictions: Int number of sounds dropped to stay under max_bytes.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # path -> (mtime, size, data, bytes used), least recently used first
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, file_path, load):
+        """Find the decoded sound at file_path, loading it if needed.
+
+        Args:
+            file_path: String path to a file.
+            load: Function that takes file_path and returns a WavData object.
+
+        Returns:
+            A WavData object. It is shared, so it must not be modified.
+        """
+        path = os.path.abspath(file_path)
+        stat = os.stat(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[:2] == (stat.st_mtime_ns, stat.st_size):
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+        data = load(file_path)
+        size = data.nbytes()
+        with self._lock:
+            self._remove(path)
+            if size <= self.max_bytes:
+                self._entries[path] = (stat.st_mtime_ns, stat.st_size, data, size)
+                self._bytes += size
+                self._evict()
+        return data
+
+    def resize(self, max_bytes):
+        """Change max_bytes, dropping sounds if they no longer fit."""
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        """Drop every cached sound."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Dictionary with the counters and the number and total size of sounds."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _remove(self, path):
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self._bytes -= entry[3]
+
+    def _evict(self):
+        while self._bytes > self.max_bytes:
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry[3]
+            self.evictions += 1
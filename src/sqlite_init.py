@@ -1,6 +1,7 @@
 """
 This module is in charge of initializing the sqlite database to store information about
-sounds in the audio archive.  It should only need to be called once.
+sounds in the audio archive.  It should only need to be called once, but it is safe to
+call again on an existing database to add anything that is missing from the schema.
 Design notes: I chose to make the file_path field a VARCHAR(260) because the maximum
 path length is 260 on Windows.
 See https://learn.microsoft.com/en-us/windows/win32/fileio/maximum-file-path-limitation?tabs=registry
@@ -9,6 +10,11 @@ See https://learn.microsoft.com/en-us/windows/win32/fileio/maximum-file-path-lim
 import sqlite3
 
 from constants import *
+from fuzzy_search import trigrams
+
+# Stored in PRAGMA user_version. Bump it when the schema gains something that has to
+# be filled in for sounds that are already in the archive (see create_db).
+SCHEMA_VERSION = 2
 
 
 def create_db(db_name="audio_archive.db"):
@@ -38,10 +44,103 @@ def create_db(db_name="audio_archive.db"):
             FOREIGN KEY (sound_id) REFERENCES sounds (id)
                 ON DELETE CASCADE
             );"""
+    # The primary key of tags can only be searched by tag, so looking up the tags of
+    # a sound needs its own index.
+    create_tags_index_query = (
+        "CREATE INDEX IF NOT EXISTS tags_sound_id ON tags (sound_id);"
+    )
+    # Trigrams of every sound name, used to narrow down fuzzy searches. count is the
+    # number of times the trigram appears in the name. See fuzzy_search.py.
+    create_trigrams_table_query = """CREATE TABLE IF NOT EXISTS name_trigrams (
+            trigram TEXT NOT NULL,
+            sound_id INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (trigram, sound_id),
+            FOREIGN KEY (sound_id) REFERENCES sounds (id)
+                ON DELETE CASCADE
+            ) WITHOUT ROWID;"""
+    create_trigrams_index_query = (
+        "CREATE INDEX IF NOT EXISTS name_trigrams_sound_id ON name_trigrams (sound_id);"
+    )
+    # lets fuzzy search find names within a range of lengths without a full scan
+    create_name_length_index_query = (
+        "CREATE INDEX IF NOT EXISTS sounds_name_length ON sounds (length(name));"
+    )
+    # Full text index over names, authors and tags for keyword search. The sound ID
+    # is used as the rowid. The triggers below keep it in sync with the sounds and
+    # tags tables, and prefix indexes make prefix queries (ex: "cof*") fast.
+    create_fts_table_query = """CREATE VIRTUAL TABLE IF NOT EXISTS sounds_fts USING fts5(
+            name,
+            author,
+            tags,
+            prefix = '2 3'
+            );"""
+    fts_tags_query = "(SELECT group_concat(tag, ' ') FROM tags WHERE sound_id = {id})"
+    create_fts_trigger_queries = [
+        """CREATE TRIGGER IF NOT EXISTS sounds_fts_insert AFTER INSERT ON sounds BEGIN
+            INSERT INTO sounds_fts (rowid, name, author, tags)
+            VALUES (new.id, new.name, new.author, '');
+        END;""",
+        """CREATE TRIGGER IF NOT EXISTS sounds_fts_update
+        AFTER UPDATE OF name, author ON sounds BEGIN
+            UPDATE sounds_fts SET name = new.name, author = new.author
+            WHERE rowid = new.id;
+        END;""",
+        """CREATE TRIGGER IF NOT EXISTS sounds_fts_delete AFTER DELETE ON sounds BEGIN
+            DELETE FROM sounds_fts WHERE rowid = old.id;
+        END;""",
+        f"""CREATE TRIGGER IF NOT EXISTS tags_fts_insert AFTER INSERT ON tags BEGIN
+            UPDATE sounds_fts SET tags = {fts_tags_query.format(id="new.sound_id")}
+            WHERE rowid = new.sound_id;
+        END;""",
+        f"""CREATE TRIGGER IF NOT EXISTS tags_fts_delete AFTER DELETE ON tags BEGIN
+            UPDATE sounds_fts SET tags = {fts_tags_query.format(id="old.sound_id")}
+            WHERE rowid = old.sound_id;
+        END;""",
+    ]
     cur.execute(create_sounds_table_query)
     cur.execute(create_tags_table_query)
+    cur.execute(create_tags_index_query)
+    cur.execute(create_trigrams_table_query)
+    cur.execute(create_trigrams_index_query)
+    cur.execute(create_name_length_index_query)
+    cur.execute(create_fts_table_query)
+    for query in create_fts_trigger_queries:
+        cur.execute(query)
+
+    version = cur.execute("PRAGMA user_version;").fetchone()[0]
+    if version < 1:
+        cur.execute("DELETE FROM name_trigrams;")
+        sounds = cur.execute("SELECT id, name FROM sounds;").fetchall()
+        for sound_id, name in sounds:
+            add_name_trigrams(cur, sound_id, name)
+    if version < 2:
+        # +s.id keeps sqlite using tags_sound_id (see _SELECT_SOUNDS in sqlite_storage)
+        cur.execute("DELETE FROM sounds_fts;")
+        cur.execute(
+            f"""INSERT INTO sounds_fts (rowid, name, author, tags)
+            SELECT s.id, s.name, s.author, {fts_tags_query.format(id="+s.id")}
+            FROM sounds s;"""
+        )
+    if version < SCHEMA_VERSION:
+        cur.execute(f"PRAGMA user_version = {SCHEMA_VERSION};")
+    con.commit()
     con.close()
 
 
+def add_name_trigrams(cur, sound_id, name):
+    """Add the trigrams of a sound's name to the fuzzy search index.
+
+    Args:
+        cur: sqlite3 cursor. The caller is responsible for committing.
+        sound_id: Int ID of the sound.
+        name: String name of the sound.
+    """
+    query = "INSERT INTO name_trigrams (trigram, sound_id, count) VALUES (?, ?, ?);"
+    cur.executemany(
+        query, [(gram, sound_id, count) for gram, count in trigrams(name).items()]
+    )
+
+
 if __name__ == "__main__":
     create_db()
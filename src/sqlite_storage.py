@@ -1,16 +1,73 @@
 """This module provides functions for working with a Sqlite database."""
 
+import json
 from pathlib import Path
+import re
 import sqlite3
+import threading
+import weakref
 from audio_metadata import AudioMetadata
+from fuzzy_search import TopK, distanceLowerBound, scoreCandidates, trigrams
+from sqlite_init import add_name_trigrams, create_db
 from storage_exceptions import *
 
+# Negative cache sizes are in KiB, so this gives each connection a 64 MiB page cache.
+CACHE_SIZE_KIB = 64 * 1024
+MMAP_SIZE = 256 * 1024 * 1024
+# Number of compiled statements each connection keeps around for reuse.
+CACHED_STATEMENTS = 256
+# Fields that keyword search can look in, with how much a match in each counts
+# towards the ranking.
+SEARCH_FIELDS = {"name": 10.0, "author": 2.0, "tags": 5.0}
+# Fuzzy search candidates are fetched and scored this many at a time.
+CANDIDATE_BATCH_SIZE = 256
+
+# WAL lets readers keep going while a write is in progress, and synchronous=NORMAL
+# is still safe in WAL mode while skipping the fsync on every commit.
+_PRAGMAS = [
+    "PRAGMA journal_mode = WAL;",
+    "PRAGMA synchronous = NORMAL;",
+    "PRAGMA foreign_keys = ON;",
+    "PRAGMA temp_store = MEMORY;",
+    f"PRAGMA cache_size = -{CACHE_SIZE_KIB};",
+    f"PRAGMA mmap_size = {MMAP_SIZE};",
+]
+
+# Every column of sounds followed by the sound's tags joined into one string, so that
+# a whole result set can be turned into AudioMetadata objects without querying the
+# tags of each sound separately. Tags are joined with the ASCII unit separator
+# (char(31)) because tags may contain commas and spaces.
+# The tags are gathered with a subquery rather than a JOIN and GROUP BY so that
+# sqlite can still walk an index for the WHERE and ORDER BY clauses and stop at the
+# LIMIT.
+# Note: tags.sound_id is declared without a type, so comparing it to the INTEGER
+# s.id would apply numeric affinity to sound_id and keep sqlite from using the
+# tags_sound_id index. The unary + on s.id avoids that.
+_TAG_SEPARATOR = "\x1f"
+_SELECT_SOUNDS = """SELECT s.id, s.file_path, s.name, s.duration, s.date_added,
+    s.last_played, s.play_count, s.author,
+    (SELECT group_concat(t.tag, char(31)) FROM tags t WHERE t.sound_id = +s.id)
+FROM sounds s
+{where}
+{order_by};"""
+# Position of some of the columns in rows selected with _SELECT_SOUNDS.
+_COLUMN_INDEXES = {"id": 0, "name": 2}
+# Unique, indexed columns that iterSounds can order by. Sounds get increasing IDs as
+# they are added, so ordering by id is the same as ordering by date added.
+_ORDER_KEYS = {"name": "name", "date_added": "id", "id": "id"}
+
 
 class Sqlite:
     """Interact with sqlite database for audio archive.
 
+    Connections are long-lived: each thread that uses the object gets its own
+    connection the first time it runs a query, and keeps it until it exits or close()
+    is called.
     Commands that directly interact with the database use the SqliteManager
-    context manager.
+    context manager on top of that connection.
+
+    Sqlite objects can be used as context managers, which closes every connection
+    on exit.
 
     Attributes:
         db_name: String name of the database (representing path to sqlite db file).
@@ -27,7 +84,30 @@ class Sqlite:
         """
         if not Path(db_name).exists():
             raise FileNotFoundError("No database file found")
+        # bring archives created by older versions up to date with the schema
+        create_db(db_name)
         self.db_name = db_name
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_args):
+        self.close()
+
+    def close(self):
+        """Close every connection opened by this object.
+
+        Any further query raises a DatabaseException.
+        """
+        with self._lock:
+            self._closed = True
+            for con in self._connections:
+                con.close()
+            self._connections.clear()
 
     def addSound(self, file_path, name, duration, cur_time, author=None):
         """Adds a sound to the database if there is not already a sound with the given name.
@@ -44,12 +124,52 @@ class Sqlite:
         """
         query = """INSERT INTO sounds (file_path, name, duration, date_added, author)
         VALUES (?, ?, ?, ?, ?);"""
-        with SqliteManager(self.db_name) as m:
+        with SqliteManager(self._connection()) as m:
             try:
                 m.cur.execute(query, (file_path, name, duration, cur_time, author))
-                m.con.commit()
             except sqlite3.IntegrityError as e:
                 raise NameExists(f"{name} already exists in database\n{e}")
+            add_name_trigrams(m.cur, m.cur.lastrowid, name)
+            m.con.commit()
+
+    def addSounds(self, sounds):
+        """Adds many sounds to the database in a single transaction.
+
+        Either every sound is added or none are.
+
+        Args:
+            sounds: List of (file_path, name, duration, cur_time, author) tuples, as
+                passed to addSound.
+
+        Raises:
+            NameExists: One of the names already exists in the database, or appears
+                twice in sounds.
+        """
+        query = """INSERT INTO sounds (file_path, name, duration, date_added, author)
+        VALUES (?, ?, ?, ?, ?);"""
+        with SqliteManager(self._connection()) as m:
+            try:
+                m.cur.executemany(query, sounds)
+            except sqlite3.IntegrityError as e:
+                raise NameExists(f"A name already exists in database\n{e}")
+            for name in [sound[1] for sound in sounds]:
+                m.cur.execute("SELECT id FROM sounds WHERE name = ?", (name,))
+                add_name_trigrams(m.cur, m.cur.fetchone()[0], name)
+            m.con.commit()
+
+    def getExistingNames(self, names):
+        """Find which of the given names are already used by sounds.
+
+        Args:
+            names: Iterable of strings.
+
+        Returns:
+            A set of the names that exist in the database.
+        """
+        query = "SELECT name FROM sounds WHERE name IN (SELECT value FROM json_each(?))"
+        with SqliteManager(self._connection()) as m:
+            m.cur.execute(query, (json.dumps(list(names)),))
+            return {row[0] for row in m.cur.fetchall()}
 
     def removeByName(self, name):
         """Remove a sound from the database.
@@ -61,12 +181,30 @@ class Sqlite:
             NameMissing: [name] does not exist in the database.
         """
         query = "DELETE FROM sounds WHERE name = ?;"
-        with SqliteManager(self.db_name) as m:
+        with SqliteManager(self._connection()) as m:
             m.cur.execute(query, (name,))
             if m.cur.rowcount == 0:
                 raise NameMissing(f"{name} does not exist in database")
             m.con.commit()
 
+    def removeByNames(self, names):
+        """Remove many sounds from the database with a single statement.
+
+        Their tags and trigrams go with them (ON DELETE CASCADE). Names that don't
+        exist are skipped.
+
+        Args:
+            names: Iterable of string names of sounds.
+
+        Returns:
+            Int number of sounds removed.
+        """
+        query = "DELETE FROM sounds WHERE name IN (SELECT value FROM json_each(?));"
+        with SqliteManager(self._connection()) as m:
+            m.cur.execute(query, (json.dumps(list(names)),))
+            m.con.commit()
+            return m.cur.rowcount
+
     def getByName(self, name):
         """Retrieve a sound from the database.
 
@@ -79,13 +217,10 @@ class Sqlite:
         Raises:
             NameMissing: [name] does not exist in the database.
         """
-        query = "SELECT * FROM sounds WHERE name = ?;"
-        with SqliteManager(self.db_name) as m:
-            res = m.cur.execute(query, (name,))
-            data = res.fetchone()
-        if data is None:
+        sounds = self._selectSounds("WHERE s.name = ?", (name,))
+        if len(sounds) == 0:
             raise NameMissing(f"{name} does not exist in database")
-        return self._recordToAudioMetadata(data)
+        return sounds[0]
 
     def updateLastPlayed(self, name, play_time):
         """Sets the last played time for a sound.
@@ -100,7 +235,7 @@ class Sqlite:
         query = """UPDATE sounds
         SET last_played = ?
         WHERE name = ?;"""
-        with SqliteManager(self.db_name) as m:
+        with SqliteManager(self._connection()) as m:
             m.cur.execute(query, (play_time, name))
             if m.cur.rowcount == 0:
                 raise NameMissing(f"{name} does not exist in database")
@@ -116,38 +251,104 @@ class Sqlite:
             NameMissing: [name] does not exist in the database.
         """
         query = """UPDATE sounds
-        SET play_count = (SELECT play_count FROM sounds WHERE name = ?) + 1
+        SET play_count = play_count + 1
         WHERE name = ?;"""
-        with SqliteManager(self.db_name) as m:
-            m.cur.execute(query, (name, name))
+        with SqliteManager(self._connection()) as m:
+            m.cur.execute(query, (name,))
             if m.cur.rowcount == 0:
                 raise NameMissing(f"{name} does not exist in database")
             m.con.commit()
 
-    def getByTags(self, tags):
+    def recordPlays(self, plays):
+        """Update the play count and last played time of many sounds at once, in
+        a single statement.
+
+        Sounds that no longer exist are skipped.
+
+        Args:
+            plays: List of (name, number of plays, last play time) tuples, with each
+                name at most once. Times are integer seconds since epoch.
+
+        Returns:
+            Int number of sounds updated.
+        """
+        query = """UPDATE sounds
+        SET play_count = play_count + json_extract(p.value, '$[1]'),
+            last_played = max(
+                coalesce(last_played, 0), json_extract(p.value, '$[2]')
+            )
+        FROM json_each(?) AS p
+        WHERE sounds.name = json_extract(p.value, '$[0]');"""
+        with SqliteManager(self._connection()) as m:
+            m.cur.execute(query, (json.dumps(plays),))
+            m.con.commit()
+            return m.cur.rowcount
+
+    def getByTags(self, tags, match_all=False, exclude=()):
         """Get all sounds associated with the given tags.
 
         Args:
             tags: String list of tags. Tags should not begin or end with whitespace.
+                If empty, every sound matches (apart from the excluded ones).
+            match_all: Bool - if True, a sound must have every tag in [tags],
+                otherwise having any of them is enough.
+            exclude: String list of tags. Sounds with any of these tags are left out.
 
         Returns:
-            A list AudioMetadata objects for all sounds associated with the given tags.
+            A list AudioMetadata objects for all sounds associated with the given tags,
+            ordered by name.
         """
-        tags = ", ".join(tags)
-        query = """SELECT *
-        FROM sounds s
-        LEFT JOIN tags t ON s.id = t.sound_id
-        WHERE t.tag IN (?);"""
-        with SqliteManager(self.db_name) as m:
-            sounds = m.cur.execute(query, (tags,)).fetchall()
-        return [self._recordToAudioMetadata(row) for row in sounds]
+        conditions, params = _tagConditions(tags, match_all, exclude)
+        where = "" if len(conditions) == 0 else "WHERE " + " AND ".join(conditions)
+        return self._selectSounds(where, params, order_by="ORDER BY s.name")
 
     def getAll(self):
         """Get all sounds from the database (as AudioMetadata objects)."""
-        query = "SELECT * FROM sounds ORDER BY name;"
-        with SqliteManager(self.db_name) as m:
-            res = m.cur.execute(query).fetchall()
-        return [self._recordToAudioMetadata(row) for row in res]
+        return self._selectSounds(order_by="ORDER BY s.name")
+
+    def iterSounds(
+        self, order_by="name", batch_size=500, tags=(), match_all=False, exclude=()
+    ):
+        """Iterate over sounds without loading all of them at once.
+
+        Sounds are fetched [batch_size] at a time. Each batch starts right after the
+        last sound of the previous one (keyset pagination) rather than using OFFSET,
+        so every batch is a quick index lookup no matter how far into the archive it
+        is. Sounds added or removed during iteration may or may not show up.
+
+        Args:
+            order_by: String - one of "name", "date_added" or "id".
+            batch_size: Int number of sounds to fetch per query.
+            tags, match_all, exclude: Optionally only include sounds with certain tags
+                (see getByTags).
+
+        Yields:
+            AudioMetadata objects in order.
+
+        Raises:
+            ValueError: Unknown [order_by].
+        """
+        if order_by not in _ORDER_KEYS:
+            raise ValueError(f"Sounds can only be ordered by {', '.join(_ORDER_KEYS)}")
+        column = _ORDER_KEYS[order_by]
+        conditions, params = _tagConditions(tags, match_all, exclude)
+        order = f"ORDER BY s.{column} LIMIT ?"
+        last = None
+        while True:
+            batch_conditions = list(conditions)
+            batch_params = list(params)
+            if last is not None:
+                batch_conditions.append(f"s.{column} > ?")
+                batch_params.append(last)
+            where = ""
+            if len(batch_conditions) > 0:
+                where = "WHERE " + " AND ".join(batch_conditions)
+            rows = self._selectRows(where, batch_params + [batch_size], order)
+            for row in rows:
+                yield _recordToAudioMetadata(row)
+            if len(rows) < batch_size:
+                return
+            last = rows[-1][_COLUMN_INDEXES[column]]
 
     def fuzzySearch(self, target, n):
         """Get n sounds with smallest edit distance when compared to target.
@@ -161,15 +362,115 @@ class Sqlite:
             from target. If there are fewer than n sounds in the archive, all sounds
             will be returned.
         """
-        # create a list of (edit distance, sound) tuples to sort
-        # I chose to do this rather than providing a key for the sort function to avoid
-        # calling _editDistance for every comparison.
-        sounds = [(_editDistance(sound.name, target), sound) for sound in self.getAll()]
-        sounds.sort(key=lambda sound: sound[0])
-        sounds = [sound[1] for sound in sounds]  # change tuple back to sound
-        if len(sounds) <= n:
-            return sounds
-        return sounds[:n]
+        if n <= 0:
+            return []
+        best = TopK(n)
+        visited = set()
+        target_trigrams = trigrams(target)
+        values = ", ".join(["(?, ?)"] * len(target_trigrams))
+        params = [value for item in target_trigrams.items() for value in item]
+        # Sounds that share the most trigrams with the target come first.
+        candidates_query = f"""WITH target (trigram, count) AS (VALUES {values})
+        SELECT s.id, s.name, c.shared
+        FROM (
+            SELECT n.sound_id, SUM(MIN(n.count, target.count)) AS shared
+            FROM target
+            JOIN name_trigrams n ON n.trigram = target.trigram
+            GROUP BY n.sound_id
+        ) c
+        JOIN sounds s ON s.id = c.sound_id
+        ORDER BY c.shared DESC;"""
+        by_length_query = "SELECT id, name FROM sounds WHERE length(name) IN (?, ?);"
+        longest_query = "SELECT max(length(name)) FROM sounds;"
+        with SqliteManager(self._connection()) as m:
+            m.cur.execute(candidates_query, params)
+            finished = False
+            while not finished:
+                rows = m.cur.fetchmany(CANDIDATE_BATCH_SIZE)
+                if len(rows) == 0:
+                    break
+                candidates = []
+                for sound_id, name, shared in rows:
+                    # every sound after this one shares at most [shared] trigrams
+                    if not best.accepts(
+                        distanceLowerBound(len(target), len(target), shared)
+                    ):
+                        finished = True
+                        break
+                    visited.add(sound_id)
+                    lower_bound = distanceLowerBound(len(name), len(target), shared)
+                    candidates.append((sound_id, name, lower_bound))
+                scoreCandidates(best, target, candidates)
+
+            # Sounds that share no trigrams with the target, closest lengths first.
+            # Their edit distance is at least the difference in length.
+            longest = m.cur.execute(longest_query).fetchone()[0] or 0
+            no_shared_bound = distanceLowerBound(len(target), len(target), 0)
+            difference = 0
+            while difference <= max(longest, len(target)) and best.accepts(
+                max(difference, no_shared_bound)
+            ):
+                lengths = (len(target) - difference, len(target) + difference)
+                rows = m.cur.execute(by_length_query, lengths).fetchall()
+                candidates = [
+                    (sound_id, name, difference)
+                    for sound_id, name in rows
+                    if sound_id not in visited
+                ]
+                scoreCandidates(best, target, candidates)
+                difference += 1
+
+        closest = best.results()
+        ids = [sound_id for _, _, sound_id in closest]
+        placeholders = ", ".join(["?"] * len(ids))
+        sounds = {
+            sound.name: sound
+            for sound in self._selectSounds(f"WHERE s.id IN ({placeholders})", ids)
+        }
+        return [sounds[name] for _, name, _ in closest]
+
+    def search(self, query, fields, limit):
+        """Keyword search over sound names, authors and tags.
+
+        Every word in the query must match the start of a word in one of the fields,
+        so "cof slu" matches "coffee-slurp-2".
+
+        Args:
+            query: String with the words to search for.
+            fields: String list of fields to search - any of "name", "author", "tags".
+            limit: Int maximum number of sounds to return.
+
+        Returns:
+            A list of AudioMetadata objects, best match first.
+
+        Raises:
+            ValueError: [fields] is empty or has an unknown field.
+        """
+        if len(fields) == 0 or not set(fields) <= set(SEARCH_FIELDS):
+            raise ValueError(
+                f"Search fields must be some of {', '.join(SEARCH_FIELDS)}"
+            )
+        words = re.findall(r"\w+", query)
+        if len(words) == 0 or limit <= 0:
+            return []
+        # quote every word so that it can't be read as an FTS5 operator
+        terms = " AND ".join(f'"{word}"*' for word in words)
+        match = f"{{{' '.join(fields)}}} : ({terms})"
+        weights = ", ".join(str(weight) for weight in SEARCH_FIELDS.values())
+        search_query = f"""SELECT rowid, name
+        FROM sounds_fts
+        WHERE sounds_fts MATCH ?
+        ORDER BY bm25(sounds_fts, {weights})
+        LIMIT ?;"""
+        with SqliteManager(self._connection()) as m:
+            matches = m.cur.execute(search_query, (match, limit)).fetchall()
+        ids = [sound_id for sound_id, _ in matches]
+        placeholders = ", ".join(["?"] * len(ids))
+        sounds = {
+            sound.name: sound
+            for sound in self._selectSounds(f"WHERE s.id IN ({placeholders})", ids)
+        }
+        return [sounds[name] for _, name in matches]
 
     def rename(self, old_name, new_name, new_path):
         """Rename a sound.
@@ -186,13 +487,18 @@ class Sqlite:
         query = """UPDATE sounds
         SET name = ?, file_path = ?
         WHERE name = ?;"""
-        with SqliteManager(self.db_name) as m:
+        id_query = "SELECT id FROM sounds WHERE name = ?;"
+        remove_trigrams_query = "DELETE FROM name_trigrams WHERE sound_id = ?;"
+        with SqliteManager(self._connection()) as m:
             try:
                 m.cur.execute(query, (new_name, new_path, old_name))
             except sqlite3.IntegrityError:
                 raise NameExists(f"{new_name} already in database")
             if m.cur.rowcount == 0:
                 raise NameMissing(f"{old_name} does not exist in database")
+            sound_id = m.cur.execute(id_query, (new_name,)).fetchone()[0]
+            m.cur.execute(remove_trigrams_query, (sound_id,))
+            add_name_trigrams(m.cur, sound_id, new_name)
             m.con.commit()
 
     def addTag(self, name, tag):
@@ -207,7 +513,7 @@ class Sqlite:
         """
         sound_id = self._getSoundID(name)
         query = "INSERT INTO tags (tag, sound_id) VALUES (?, ?);"
-        with SqliteManager(self.db_name) as m:
+        with SqliteManager(self._connection()) as m:
             m.cur.execute(query, (tag, sound_id))
             m.con.commit()
 
@@ -223,24 +529,10 @@ class Sqlite:
         """
         sound_id = self._getSoundID(name)
         query = "DELETE FROM tags WHERE sound_id = ? AND tag = ?;"
-        with SqliteManager(self.db_name) as m:
+        with SqliteManager(self._connection()) as m:
             m.cur.execute(query, (sound_id, tag))
             m.con.commit()
 
-    def _getTags(self, id):
-        """Get all tags associated with a sound ID.
-
-        Args:
-            id: Int sound ID.
-
-        Returns:
-            A list of AudioMetadata objects associated with the ID.
-        """
-        query = "SELECT tag FROM tags WHERE sound_id = ?;"
-        with SqliteManager(self.db_name) as m:
-            res = m.cur.execute(query, (id,)).fetchall()
-        return {data[0] for data in res}
-
     def _getSoundID(self, name):
         """Get the ID associated with a sound.
 
@@ -254,59 +546,141 @@ class Sqlite:
             NameMissing: [name] isn't in the database.
         """
         query = "SELECT id FROM sounds WHERE name = ?"
-        with SqliteManager(self.db_name) as m:
+        with SqliteManager(self._connection()) as m:
             res = m.cur.execute(query, (name,)).fetchone()
-            if len(res) == 0:
-                raise NameMissing(f"{name} does not exist in database")
+        if res is None:
+            raise NameMissing(f"{name} does not exist in database")
         return res[0]
 
-    def _recordToAudioMetadata(self, record):
-        """Convert one row from the sounds table to an AudioMetadata object."""
-        tags = self._getTags(record[0])
-        return AudioMetadata(
-            file_path=record[1],
-            name=record[2],
-            duration=record[3],
-            date_added=record[4],
-            last_played=record[5],
-            play_count=record[6],
-            author=record[7],
-            tags=tags,
+    def _connection(self):
+        """Get the connection for the calling thread, opening it if needed.
+
+        Raises:
+            DatabaseException: close() has already been called.
+        """
+        con = getattr(self._local, "con", None)
+        if con is not None and not self._closed:
+            return con
+        with self._lock:
+            if self._closed:
+                raise DatabaseException(f"{self.db_name} has been closed")
+            # check_same_thread is off so that close() can close every thread's
+            # connection, but each connection is still only used by one thread.
+            con = sqlite3.connect(
+                self.db_name,
+                check_same_thread=False,
+                cached_statements=CACHED_STATEMENTS,
+            )
+            for pragma in _PRAGMAS:
+                con.execute(pragma)
+            self._connections.append(con)
+        self._local.con = con
+        # a thread's connection is closed once the thread is gone, so code that
+        # starts a thread per command doesn't pile up open connections
+        finalizer = weakref.finalize(
+            threading.current_thread(), self._dropConnection, con
+        )
+        # leave the connections of threads still running at exit to close()
+        finalizer.atexit = False
+        return con
+
+    def _dropConnection(self, con):
+        """Close a connection whose thread has exited."""
+        with self._lock:
+            if con in self._connections:
+                self._connections.remove(con)
+                con.close()
+
+    def _selectSounds(self, where="", params=(), order_by=""):
+        """Load sounds together with their tags in a single query.
+
+        Args:
+            where: String WHERE clause on the sounds table (aliased as s).
+            params: Tuple of values for the placeholders in [where] and [order_by].
+            order_by: String ORDER BY (and LIMIT) clause.
+
+        Returns:
+            A list of AudioMetadata objects.
+        """
+        rows = self._selectRows(where, params, order_by)
+        return [_recordToAudioMetadata(row) for row in rows]
+
+    def _selectRows(self, where="", params=(), order_by=""):
+        """Same as _selectSounds but returns the raw rows from _SELECT_SOUNDS."""
+        query = _SELECT_SOUNDS.format(where=where, order_by=order_by)
+        with SqliteManager(self._connection()) as m:
+            return m.cur.execute(query, params).fetchall()
+
+
+def _tagConditions(tags, match_all, exclude):
+    """Build the WHERE conditions for filtering sounds by tag.
+
+    See getByTags for the meaning of the arguments.
+
+    Returns:
+        A tuple of a list of String conditions (to be ANDed) and a list of parameters.
+    """
+    tags = list(set(tags))
+    exclude = list(set(exclude))
+    # The primary key of tags is (tag, sound_id), so each condition only reads
+    # the index entries for the tags involved.
+    conditions = []
+    params = []
+    if len(tags) > 0:
+        placeholders = ", ".join(["?"] * len(tags))
+        if match_all:
+            conditions.append(
+                f"""s.id IN (SELECT sound_id FROM tags
+                WHERE tag IN ({placeholders})
+                GROUP BY sound_id
+                HAVING COUNT(*) = ?)"""
+            )
+            params += tags + [len(tags)]
+        else:
+            conditions.append(
+                f"s.id IN (SELECT sound_id FROM tags WHERE tag IN ({placeholders}))"
+            )
+            params += tags
+    if len(exclude) > 0:
+        placeholders = ", ".join(["?"] * len(exclude))
+        conditions.append(
+            f"s.id NOT IN (SELECT sound_id FROM tags WHERE tag IN ({placeholders}))"
         )
+        params += exclude
+    return conditions, params
+
+
+def _recordToAudioMetadata(record):
+    """Convert one row selected with _SELECT_SOUNDS to an AudioMetadata object."""
+    tags = set() if record[8] is None else set(record[8].split(_TAG_SEPARATOR))
+    return AudioMetadata(
+        file_path=record[1],
+        name=record[2],
+        duration=record[3],
+        date_added=record[4],
+        last_played=record[5],
+        play_count=record[6],
+        author=record[7],
+        tags=tags,
+    )
 
 
 class SqliteManager:
-    """Provide context manager for working with sqlite database."""
+    """Provide context manager for working with a sqlite connection.
 
-    def __init__(self, db_name):
-        self.db_name = db_name
+    The connection stays open after the block. Changes must be committed inside the
+    block; if the block raises, anything uncommitted is rolled back so the connection
+    can be reused.
+    """
+
+    def __init__(self, con):
+        self.con = con
 
     def __enter__(self):
-        self.con = sqlite3.connect(self.db_name)
         self.cur = self.con.cursor()
         return self
 
-    def __exit__(self, *_args):
-        self.con.close()
-
-
-def _editDistance(word1, word2):
-    """Find edit distance from word1 to word2.
-
-    Copy and pasted from https://leetcode.com/problems/edit-distance/submissions/904968575/
-    because why write your own tests when they're there for you 😀
-    """
-    n, m = len(word1), len(word2)
-    dp = [[0] * (m + 1) for _ in range(n + 1)]
-    for i in range(n + 1):
-        dp[i][0] = i
-    for i in range(m + 1):
-        dp[0][i] = i
-
-    for i in range(1, n + 1):
-        for j in range(1, m + 1):
-            if word1[i - 1] == word2[j - 1]:
-                dp[i][j] = dp[i - 1][j - 1]
-            else:
-                dp[i][j] = min(dp[i - 1][j], dp[i][j - 1], dp[i - 1][j - 1]) + 1
-    return dp[-1][-1]
+    def __exit__(self, exc_type, *_args):
+        self.cur.close()
+        if exc_type is not None and self.con.in_transaction:
+            self.con.rollback()
@@ -1,22 +1,64 @@
 """Manage interactions with storage for the audio archive.
 """
 
-import tempfile
+import filecmp
+import os
 from pathlib import Path
-import soundfile
-from pydub import AudioSegment
+import subprocess
 from shutil import copyfile, move
 import time
 import wave
 from constants import *
 from storage_exceptions import *
 
+# File extensions that findSoundFiles picks up. Anything other than .wav is
+# converted, which needs ffmpeg for most formats.
+SOUND_FILE_EXTENSIONS = {".wav", ".mp3", ".flac", ".ogg", ".aiff", ".aif", ".m4a"}
+# Number of threads clean uses to look for files outside the base directory.
+CLEAN_WORKERS = 8
+# Number of frames converted at a time by _convertToWav.
+CONVERSION_BLOCK_FRAMES = 64 * 1024
+
 
 def _processTag(tag):
     """Strip whitespace and turn to lowercase."""
     return tag.lower().strip()
 
 
+def findSoundFiles(directory):
+    """Find every sound file in a directory and its subdirectories.
+
+    Args:
+        directory: String or Path to the directory to search.
+
+    Returns:
+        A sorted list of Paths to files with an extension in SOUND_FILE_EXTENSIONS.
+    """
+    paths = []
+    for root, _dirs, files in os.walk(directory):
+        for file in files:
+            path = Path(root, file)
+            if path.suffix.lower() in SOUND_FILE_EXTENSIONS:
+                paths.append(path)
+    return sorted(paths)
+
+
+class ImportReport:
+    """Outcome of StorageCommander.addSounds.
+
+    Attributes:
+        added: String list of names of the sounds that were added.
+        skipped: List of (Path, String reason) tuples for files that were left alone
+            because a sound with their name is already in the archive.
+        failed: List of (Path, String error) tuples for files that couldn't be added.
+    """
+
+    def __init__(self):
+        self.added = []
+        self.skipped = []
+        self.failed = []
+
+
 class StorageCommander:
     """Manage interactions with audio archive storage
 
@@ -79,23 +121,81 @@ class StorageCommander:
             raise NameExists(f"{name} already exists")
 
         new_path = self.base_directory / f"{name}.wav"
-
-        if new_path != path:
-            if path.suffix != ".wav":
-                self._convertToWavAndAdd(path, new_path)
-            elif (
-                path.parent != self.base_directory
-            ):  # copy file if we're adding it from outside sounds/
-                copyfile(path, new_path)
-            else:  # if it's already in the sounds/ directory, move the file
-                move(path, new_path)
-
-        with wave.open(str(new_path), "rb") as wave_read:
-            duration = int(wave_read.getnframes() / wave_read.getframerate())
+        duration = _placeSound(path, new_path)
         cur_time = int(time.time())
-        self.database.addSound(str(new_path), name, duration, cur_time, author)
+        try:
+            self.database.addSound(str(new_path), name, duration, cur_time, author)
+        except NameExists:
+            _unplaceSound(path, new_path)
+            raise
         return True
 
+    def addSounds(self, file_paths, author=None, workers=None, batch_size=500):
+        """Add many sounds at once, named after their files.
+
+        Files are copied or converted in a pool of worker processes and then added
+        to the database in batches, with one transaction per batch. A file that
+        can't be added is reported instead of stopping the import. Sounds whose name
+        is already in the archive are skipped, so an interrupted import can simply be
+        run again: a file it left in base_directory without a database row is
+        added as it is, once it has been checked to be the same sound. Other files
+        already in base_directory are never written over, and files placed for
+        sounds that then couldn't be added are removed again.
+
+        Args:
+            file_paths: List of Strings or Paths to sounds (see findSoundFiles).
+            author: Either a string with the name of the author or None.
+            workers: Int number of worker processes, or None to use every core.
+                With 1, everything happens in this process.
+            batch_size: Int number of sounds to add to the database per transaction.
+
+        Returns:
+            An ImportReport.
+
+        Raises:
+            ValueError: [author] is too long.
+        """
+        if author is not None and len(author) > MAX_AUTHOR_LENGTH:
+            raise ValueError(
+                f"Author name must be less than {MAX_AUTHOR_LENGTH} characters."
+            )
+        report = ImportReport()
+        paths = [Path(file_path) for file_path in file_paths]
+        existing = self.database.getExistingNames([path.stem for path in paths])
+        jobs = []
+        names = set()
+        for path in paths:
+            name = path.stem
+            if name in existing:
+                report.skipped.append((path, f"{name} already exists"))
+            elif name in names:
+                report.failed.append((path, f"another file is also named {name}"))
+            elif len(name) > MAX_SOUND_NAME_LENGTH:
+                report.failed.append(
+                    (path, f"name must be less than {MAX_SOUND_NAME_LENGTH} characters")
+                )
+            else:
+                names.add(name)
+                new_path = self.base_directory / f"{name}.wav"
+                # a file left by an interrupted import is adopted, not placed again
+                adopt = new_path != path and new_path.exists()
+                jobs.append((path, new_path, adopt))
+
+        batch = []
+        for (path, new_path, adopt), (duration, error) in zip(
+            jobs, _runImportJobs(jobs, workers)
+        ):
+            if error is not None:
+                report.failed.append((path, error))
+                continue
+            sound = (str(new_path), path.stem, duration, int(time.time()), author)
+            batch.append((path, sound, not adopt))
+            if len(batch) >= batch_size:
+                self._addBatch(batch, report)
+                batch = []
+        self._addBatch(batch, report)
+        return report
+
     def removeSound(self, name):
         """Remove a sound from the database.
 
@@ -151,24 +251,64 @@ class StorageCommander:
         """
         self.database.incrementPlayCount(name)
 
-    def getByTags(self, tags):
+    def recordPlays(self, plays):
+        """Update the play counts and last played times of many sounds at once (see
+        play_stats.PlayStatsRecorder).
+
+        Args:
+            plays: List of (name, number of plays, last play time) tuples, with each
+                name at most once.
+
+        Returns:
+            Int number of sounds updated. Sounds that no longer exist are skipped.
+        """
+        return self.database.recordPlays(plays)
+
+    def getByTags(self, tags, match_all=False, exclude=()):
         """Get all sounds associated with the given tags.
 
         Args:
-            tags: String list of tags.
+            tags: String list of tags. If empty, every sound matches (apart from
+                the excluded ones).
+            match_all: Bool - if True, only sounds with every tag in [tags] are
+                returned, otherwise sounds with any of them are.
+            exclude: String list of tags. Sounds with any of these tags are left out.
 
         Returns:
             A list AudioMetadata objects for all sounds associated with the given tags.
         """
         tags = [_processTag(tag) for tag in tags]
+        exclude = [_processTag(tag) for tag in exclude]
         # remove duplicates
         tags = list(set(tags))
-        return self.database.getByTags(tags)
+        exclude = list(set(exclude))
+        return self.database.getByTags(tags, match_all, exclude)
 
     def getAll(self):
         """Get all sounds from the storage (as AudioMetadata objects)."""
         return self.database.getAll()
 
+    def iterSounds(
+        self, order_by="name", batch_size=500, tags=(), match_all=False, exclude=()
+    ):
+        """Iterate over sounds in storage without loading them all into memory.
+
+        Args:
+            order_by: String - one of "name", "date_added" or "id".
+            batch_size: Int number of sounds to load at a time.
+            tags, match_all, exclude: Optionally only include sounds with certain tags
+                (see getByTags).
+
+        Yields:
+            AudioMetadata objects in order.
+
+        Raises:
+            ValueError: Unknown [order_by].
+        """
+        tags = list({_processTag(tag) for tag in tags})
+        exclude = list({_processTag(tag) for tag in exclude})
+        return self.database.iterSounds(order_by, batch_size, tags, match_all, exclude)
+
     def fuzzySearch(self, target, n):
         """Get n sounds with smallest edit distance when compared to target.
 
@@ -183,6 +323,25 @@ class StorageCommander:
         """
         return self.database.fuzzySearch(target, n)
 
+    def search(self, query, fields=("name", "author", "tags"), limit=10):
+        """Keyword search for sounds.
+
+        Each word in the query matches any word in the searched fields that starts
+        with it, so partially typed words work.
+
+        Args:
+            query: String with the words to search for.
+            fields: String list of fields to search - any of "name", "author", "tags".
+            limit: Int maximum number of sounds to return.
+
+        Returns:
+            A list of AudioMetadata objects, best match first.
+
+        Raises:
+            ValueError: [fields] is empty or has an unknown field.
+        """
+        return self.database.search(query, list(fields), limit)
+
     def rename(self, old_name, new_name):
         """Rename a sound.
 
@@ -238,20 +397,50 @@ class StorageCommander:
         tag = _processTag(tag)
         self.database.removeTag(name, tag)
 
-    def clean(self):
+    def clean(self, dry_run=False, workers=CLEAN_WORKERS):
         """Remove all sounds from the database without an associated file.
 
+        Files in base_directory are checked against a single listing of it, rather
+        than one stat call per sound. The few sounds stored elsewhere are checked
+        with a thread pool. Every missing sound is removed in one statement.
+
+        Args:
+            dry_run: Bool - if True, only find the sounds that would be removed.
+            workers: Int number of threads checking files outside base_directory.
+
         Returns:
-            A list of AudioMetadata objects that were removed.
+            A list of AudioMetadata objects that were (or, for a dry run, would be)
+            removed, ordered by name.
         """
-        sounds = self.getAll()
-        removed_sounds = []
+        sounds = list(self.iterSounds())
+        stored = _listFiles(self.base_directory)
+        base_directory = os.path.abspath(self.base_directory)
+        missing = []
+        elsewhere = []
         for sound in sounds:
-            if not sound.file_path.exists():
-                self.removeSound(sound.name)
-                removed_sounds.append(sound)
-
-        return removed_sounds
+            directory, file_name = os.path.split(os.path.abspath(sound.file_path))
+            if directory == base_directory:
+                if file_name not in stored:
+                    missing.append(sound)
+            else:
+                elsewhere.append(sound)
+        if len(elsewhere) > 0:
+            from concurrent.futures import ThreadPoolExecutor
+
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                found = executor.map(
+                    lambda sound: os.path.isfile(sound.file_path), elsewhere
+                )
+                missing += [sound for sound, ok in zip(elsewhere, found) if not ok]
+        missing.sort(key=lambda sound: sound.name)
+
+        if not dry_run and len(missing) > 0:
+            self.database.removeByNames(sound.name for sound in missing)
+        return missing
+
+    def close(self):
+        """Close the connection to the database."""
+        self.database.close()
 
     def _soundExists(self, name):
         """Returns if a sound exists in the database."""
@@ -261,18 +450,224 @@ class StorageCommander:
         except NameMissing:
             return False
 
-    def _convertToWavAndAdd(self, path, new_path):
-        """Converts a sound file to a wav and moves it to the base directory.
+    def _addBatch(self, batch, report):
+        """Add a batch of imported sounds to the database in one transaction.
 
-        ffmpeg is needed for most file formats.
+        If the batch can't be added as a whole, the sounds are added one at a time
+        so that only the ones at fault are reported as failures.
 
         Args:
-            path: Path object leading to sound.
-            new_path: New path to put sound at.
+            batch: List of (Path, (file path, name, duration, time, author), Bool
+                whether the file was placed by this import) tuples.
+            report: ImportReport to record the results in.
         """
-        audio = AudioSegment.from_file(path)
-        with tempfile.TemporaryDirectory() as temp_dir:
-            path = str(Path(temp_dir, "sound.wav"))
-            audio.export(path, format="wav")
-            data, samplerate = soundfile.read(path)
-            soundfile.write(str(new_path), data, samplerate)
+        if len(batch) == 0:
+            return
+        try:
+            self.database.addSounds([sound for _, sound, _ in batch])
+            report.added += [sound[1] for _, sound, _ in batch]
+            return
+        except NameExists:
+            pass
+        for path, sound, placed in batch:
+            try:
+                self.database.addSound(*sound)
+                report.added.append(sound[1])
+            except NameExists as e:
+                if placed:
+                    # the file was placed for a sound that isn't in the archive
+                    _unplaceSound(path, Path(sound[0]))
+                report.failed.append((path, str(e)))
+
+
+def _placeSound(path, new_path):
+    """Put a sound at new_path as a wav file.
+
+    If path is not in the same directory as new_path, the file is copied (or
+    converted) there. Otherwise, the file is moved to new_path. Copies are written
+    to a temporary name first so that an interrupted import never leaves a partial
+    file at new_path.
+
+    Args:
+        path: Path to the sound.
+        new_path: Path to a wav file in the base directory.
+
+    Returns:
+        The duration of the sound in seconds.
+
+    Raises:
+        pydub.exceptions.CouldntDecodeError: Unsupported file format.
+        FileExistsError: Another file is already at new_path.
+    """
+    if new_path == path:
+        return _wavDuration(new_path)
+    if new_path.exists():
+        # os.replace and move would silently overwrite it
+        raise FileExistsError(f"{new_path} already exists")
+    if path.suffix == ".wav" and path.parent == new_path.parent:
+        # if it's already in the sounds/ directory, move the file
+        move(path, new_path)
+        return _wavDuration(new_path)
+
+    partial_path = new_path.with_name(f".{new_path.stem}.partial.wav")
+    try:
+        if path.suffix != ".wav":
+            _convertToWav(path, partial_path)
+        else:
+            copyfile(path, partial_path)
+        duration = _wavDuration(partial_path)
+        os.replace(partial_path, new_path)
+    finally:
+        partial_path.unlink(missing_ok=True)
+    return duration
+
+
+def _adoptSound(path, new_path):
+    """Check that the file already at new_path is the sound at path, as left by an
+    interrupted import.
+
+    Wav files must be identical. Other files were converted, so the file at
+    new_path only has to be a readable wav file.
+
+    Returns:
+        The duration of the sound in seconds.
+
+    Raises:
+        FileExistsError: new_path holds a different sound.
+        wave.Error: new_path isn't a wav file.
+    """
+    if path.suffix == ".wav" and not filecmp.cmp(path, new_path, shallow=False):
+        raise FileExistsError(f"{new_path} already exists with different contents")
+    return _wavDuration(new_path)
+
+
+def _unplaceSound(path, new_path):
+    """Undo _placeSound: delete the copy at new_path, or move the file back to path
+    if it was moved."""
+    if new_path == path:
+        return
+    if path.exists():
+        new_path.unlink(missing_ok=True)
+    else:
+        move(new_path, path)
+
+
+def _wavDuration(path):
+    """Length of a wav file in whole seconds."""
+    with wave.open(str(path), "rb") as wave_read:
+        return int(wave_read.getnframes() / wave_read.getframerate())
+
+
+def _convertToWav(path, new_path):
+    """Converts a sound file to a 16-bit wav at new_path.
+
+    The sound is decoded once and written straight to new_path. Formats that
+    libsndfile can read (FLAC, OGG, AIFF, ...) are converted block by block with
+    soundfile, and everything else is handed to ffmpeg.
+
+    Args:
+        path: Path object leading to sound.
+        new_path: New path to put sound at.
+
+    Raises:
+        pydub.exceptions.CouldntDecodeError: Unsupported file format.
+    """
+    import soundfile
+
+    try:
+        source = soundfile.SoundFile(str(path))
+    except soundfile.LibsndfileError:
+        _convertWithFfmpeg(path, new_path)
+        return
+    with source, soundfile.SoundFile(
+        str(new_path),
+        "w",
+        samplerate=source.samplerate,
+        channels=source.channels,
+        subtype="PCM_16",
+        format="WAV",
+    ) as destination:
+        for block in source.blocks(CONVERSION_BLOCK_FRAMES, dtype="int16"):
+            destination.write(block)
+
+
+def _convertWithFfmpeg(path, new_path):
+    """Have ffmpeg decode a sound and write it to new_path as a 16-bit wav.
+
+    Raises:
+        pydub.exceptions.CouldntDecodeError: ffmpeg is missing or can't decode the
+            file.
+    """
+    from pydub import AudioSegment
+    from pydub.exceptions import CouldntDecodeError
+
+    command = [
+        AudioSegment.converter,
+        "-nostdin",
+        "-v",
+        "error",
+        "-y",
+        "-i",
+        str(path),
+        "-vn",
+        "-acodec",
+        "pcm_s16le",
+        "-f",
+        "wav",
+        str(new_path),
+    ]
+    try:
+        result = subprocess.run(command, capture_output=True)
+    except FileNotFoundError:
+        raise CouldntDecodeError(f"ffmpeg is needed to convert {path.name}")
+    if result.returncode != 0:
+        raise CouldntDecodeError(
+            f"Decoding failed. ffmpeg returned error code: {result.returncode}\n\n"
+            f"Output from ffmpeg:\n{result.stderr.decode(errors='replace')}"
+        )
+
+
+def _importJob(job):
+    """Place one sound for addSounds. Runs in a worker process.
+
+    Args:
+        job: (Path to sound, Path to put it at, Bool whether to adopt a file that
+            is already there) tuple.
+
+    Returns:
+        A (duration, None) tuple on success, or (None, String error) on failure.
+    """
+    path, new_path, adopt = job
+    try:
+        if adopt:
+            return _adoptSound(path, new_path), None
+        return _placeSound(path, new_path), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def _listFiles(directory):
+    """Set of the names of the files in a directory (empty if it doesn't exist)."""
+    try:
+        with os.scandir(directory) as entries:
+            return {entry.name for entry in entries if entry.is_file()}
+    except FileNotFoundError:
+        return set()
+
+
+def _runImportJobs(jobs, workers):
+    """Run _importJob on every job, in a process pool unless workers is 1.
+
+    Returns:
+        An iterator of the results, in the same order as jobs.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers == 1 or len(jobs) <= 1:
+        yield from map(_importJob, jobs)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunksize = max(1, min(64, len(jobs) // (4 * workers)))
+        yield from executor.map(_importJob, jobs, chunksize=chunksize)
@@ -0,0 +1,94 @@
+"""This module reads the header of a wav file, so that the frames can be used straight
+from a memory map of the file (see audio_edits.mapWav) instead of being read into
+memory.
+
+A wav file is a RIFF file: the 12 byte "RIFF" header followed by chunks, each with
+a 4 byte id, a 4 byte little endian size, the data and a pad byte if the size is
+odd. The "fmt " chunk describes the samples and the "data" chunk holds the frames.
+See http://soundfile.sapp.org/doc/WaveFormat/
+"""
+
+import os
+import struct
+import wave
+
+_WAVE_FORMAT_PCM = 0x0001
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+# first two bytes of the sub format GUID of WAVE_FORMAT_EXTENSIBLE PCM files
+_PCM_SUBFORMAT = b"\x01\x00"
+
+
+class WavHeader:
+    """What readWavHeader found in a wav file.
+
+    Attributes:
+        params: wave params namedtuple, as returned by wave's getparams.
+        data_offset: Int offset of the first frame from the start of the file.
+        nframes: Int number of frames.
+    """
+
+    def __init__(self, params, data_offset, nframes):
+        self.params = params
+        self.data_offset = data_offset
+        self.nframes = nframes
+
+
+def readWavHeader(file_path):
+    """Find the format of a PCM wav file and where its frames are.
+
+    Args:
+        file_path: String path to a wav file.
+
+    Returns:
+        A WavHeader object.
+
+    Raises:
+        ValueError: The file isn't a PCM wav file.
+    """
+    file_size = os.path.getsize(file_path)
+    with open(file_path, "rb") as file:
+        riff = file.read(12)
+        if len(riff) < 12 or riff[:4] != b"RIFF" or riff[8:] != b"WAVE":
+            raise ValueError(f"{file_path} is not a wav file")
+        fmt = None
+        while True:
+            chunk_header = file.read(8)
+            if len(chunk_header) < 8:
+                raise ValueError(f"{file_path} has no data chunk")
+            chunk_id, size = struct.unpack("<4sI", chunk_header)
+            if chunk_id == b"fmt ":
+                fmt = file.read(size)
+            elif chunk_id == b"data":
+                if fmt is None:
+                    raise ValueError(f"{file_path} has no fmt chunk before its data")
+                data_offset = file.tell()
+                break
+            else:
+                file.seek(size, os.SEEK_CUR)
+            # chunks are padded to an even length
+            file.seek(size % 2, os.SEEK_CUR)
+
+    if len(fmt) < 16:
+        raise ValueError(f"{file_path} has a malformed fmt chunk")
+    format_tag, nchannels, framerate, _, block_align, bits = struct.unpack(
+        "<HHIIHH", fmt[:16]
+    )
+    if format_tag == _WAVE_FORMAT_EXTENSIBLE:
+        # the sub format GUID is at the end of the 40 byte extensible fmt chunk
+        if len(fmt) < 26 or fmt[24:26] != _PCM_SUBFORMAT:
+            raise ValueError(f"{file_path} is not a PCM wav file")
+    elif format_tag != _WAVE_FORMAT_PCM:
+        raise ValueError(f"{file_path} is not a PCM wav file")
+    sampwidth = (bits + 7) // 8
+    if nchannels == 0 or sampwidth not in (1, 2, 3, 4):
+        raise ValueError(f"{file_path} has an unsupported sample format")
+    if block_align != sampwidth * nchannels:
+        raise ValueError(f"{file_path} has an unsupported frame layout")
+
+    # Files written by streaming programs may not know the real size, so never go
+    # past the end of the file.
+    nframes = min(size, file_size - data_offset) // block_align
+    params = wave._wave_params(
+        nchannels, sampwidth, framerate, nframes, "NONE", "not compressed"
+    )
+    return WavHeader(params, data_offset, nframes)
@@ -0,0 +1,19 @@
+from src.playback_options import PlaybackOptions
+
+
+def makeOptions(**kwargs):
+    """PlaybackOptions without any effects, apart from the ones given."""
+    fields = {
+        "speed": None,
+        "volume": None,
+        "reverse": False,
+        "start_percent": None,
+        "end_percent": None,
+        "start_sec": None,
+        "end_sec": None,
+        "save": None,
+        "transpose": None,
+        "parallel": False,
+    }
+    fields.update(kwargs)
+    return PlaybackOptions(**fields)
@@ -0,0 +1,303 @@
+from pathlib import Path
+import mmap
+from threading import Thread
+import time
+import unittest
+import wave
+import numpy as np
+from pydub import AudioSegment
+from src.audio_edits import *
+from src.audio_edits import _concatenate, _getData, _overlay
+from src.audio_edits import _changeTempo, _crop, _pitchShift, _readWav
+from src.audio_edits import _reverseSamples, _scaleVolume, _toFloat
+from src.wav_reader import readWavHeader
+import src.audio_edits as audio_edits
+from test.helpers import makeOptions
+
+COFFEE = str(Path("test", "test_sounds", "coffee.wav"))
+TOASTER = str(Path("test", "test_sounds", "toaster.wav"))
+MONO_TOASTER = str(Path("test", "test_sounds", "toaster-2.wav"))
+SLURP = str(Path("test", "test_sounds", "coffee-slurp-2.wav"))
+
+
+def toAudioSegment(data):
+    return AudioSegment(
+        data=data.frames,
+        sample_width=data.params.sampwidth,
+        frame_rate=data.params.framerate,
+        channels=data.params.nchannels,
+    )
+
+
+class AudioEditsTests(unittest.TestCase):
+    def test_toFloatIsFloat32(self):
+        # coffee.wav has 24 bit samples
+        samples = _toFloat(_getData(COFFEE))
+        self.assertEqual(samples.dtype, np.float32)
+        self.assertLessEqual(np.abs(samples).max(), 1)
+
+    def test_concatenate(self):
+        coffee, slurp = _getData(COFFEE), _getData(SLURP)
+        res = _concatenate([coffee, slurp], crossfade_ms=0)
+        self.assertEqual(res.frames, coffee.frames + slurp.frames)
+        self.assertEqual(res.params, coffee.params._replace(nframes=res.params.nframes))
+
+    def test_concatenateConvertsFormats(self):
+        mono, stereo = _getData(MONO_TOASTER), _getData(COFFEE)
+        res = _concatenate([mono, stereo], crossfade_ms=0)
+        self.assertEqual((res.params.nchannels, res.params.framerate), (2, 48000))
+        self.assertAlmostEqual(
+            res.params.nframes, mono.params.nframes + 45220 * 48000 / 44100, delta=1
+        )
+        # mono sounds are copied to every channel
+        start = res.samples[: mono.params.nframes]
+        self.assertTrue(np.array_equal(start[:, 0], mono.samples[:, 0]))
+        self.assertTrue(np.array_equal(start[:, 1], mono.samples[:, 0]))
+        params = wave._wave_params(1, 2, 1000, 0, "NONE", "not compressed")
+        narrow = WavData(np.array([[1], [-2]], dtype="<i2"), params)
+        wide = WavData(np.array([[3]], dtype="<i4"), params._replace(sampwidth=3))
+        res = _concatenate([narrow, wide], crossfade_ms=0)
+        self.assertListEqual(res.samples[:, 0].tolist(), [256, -512, 3])
+
+    def test_concatenateGap(self):
+        coffee = _getData(COFFEE)
+        res = _concatenate([coffee, coffee], gap_ms=10, crossfade_ms=0)
+        gap = coffee.params.framerate // 100
+        self.assertEqual(res.params.nframes, 2 * coffee.params.nframes + gap)
+        silence = res.samples[coffee.params.nframes : coffee.params.nframes + gap]
+        self.assertFalse(silence.any())
+        self.assertEqual(res.slice(coffee.params.nframes + gap).frames, coffee.frames)
+
+    def test_concatenateCrossfade(self):
+        params = wave._wave_params(1, 2, 1000, 0, "NONE", "not compressed")
+        first = WavData(np.full((20, 1), 1000, dtype="<i2"), params)
+        second = WavData(np.full((20, 1), -1000, dtype="<i2"), params)
+        res = _concatenate([first, second], crossfade_ms=10)
+        self.assertEqual(res.params.nframes, 30)
+        self.assertTrue((res.samples[:10] == 1000).all())
+        self.assertTrue((res.samples[20:] == -1000).all())
+        # the overlap fades from one to the other
+        overlap = res.samples[10:20, 0]
+        self.assertTrue((np.diff(overlap) < 0).all())
+        self.assertEqual(overlap[4] + overlap[5], -1)
+        # a crossfade longer than a sound is shortened to fit
+        self.assertEqual(
+            _concatenate([first, second], crossfade_ms=50).params.nframes, 20
+        )
+
+    def test_concatenateManySounds(self):
+        params = wave._wave_params(2, 2, 44100, 0, "NONE", "not compressed")
+        sound = WavData(np.ones((4410, 2), dtype="<i2"), params)
+        start = time.perf_counter()
+        res = _concatenate([sound] * 500)
+        self.assertLess(time.perf_counter() - start, 1)
+        self.assertEqual(res.params.nframes, 500 * 4410 - 499 * 4410)
+
+    def test_overlayIsExact(self):
+        # pydub turns 24 bit sounds into 32 bit ones, so compare 16 bit sounds
+        sounds = [_getData(COFFEE), _getData(SLURP)]
+        sounds = [
+            WavData(
+                (sound.samples >> 8).astype("<i2"), sound.params._replace(sampwidth=2)
+            )
+            for sound in sounds
+        ]
+        expected = toAudioSegment(sounds[1]).overlay(toAudioSegment(sounds[0]))
+        res = _overlay(sounds)
+        self.assertEqual(res.frames, expected.raw_data)
+        self.assertEqual(res.params.sampwidth, 2)
+
+    def test_overlayMixModes(self):
+        params = wave._wave_params(1, 2, 1000, 0, "NONE", "not compressed")
+        loud = WavData(np.array([[30000], [-30000], [1000]], dtype="<i2"), params)
+        quiet = WavData(np.array([[1000], [-1000]], dtype="<i2"), params)
+        self.assertListEqual(
+            _overlay([loud, loud], "clip").samples[:, 0].tolist(),
+            [32767, -32768, 2000],
+        )
+        self.assertListEqual(
+            _overlay([loud, loud], "limit").samples[:, 0].tolist(),
+            [32767, -32767, 1092],
+        )
+        # limiting only changes sounds that would clip
+        self.assertListEqual(
+            _overlay([quiet, quiet], "limit").samples[:, 0].tolist(), [2000, -2000]
+        )
+        self.assertListEqual(
+            _overlay([quiet, quiet], "normalize").samples[:, 0].tolist(),
+            [32767, -32767],
+        )
+        with self.assertRaises(ValueError):
+            _overlay([loud], "loud")
+
+    def test_overlay8Bit(self):
+        params = wave._wave_params(1, 1, 1000, 0, "NONE", "not compressed")
+        sound = WavData(np.array([[128], [200], [20]], dtype="u1"), params)
+        res = _overlay([sound, sound, sound])
+        self.assertListEqual(res.samples[:, 0].tolist(), [128, 255, 0])
+
+    def test_overlayManySounds(self):
+        params = wave._wave_params(2, 2, 44100, 0, "NONE", "not compressed")
+        sounds = [
+            WavData(np.full((4410 * (i + 1), 2), i, dtype="<i2"), params)
+            for i in range(50)
+        ]
+        start = time.perf_counter()
+        res = _overlay(sounds)
+        self.assertLess(time.perf_counter() - start, 1)
+        self.assertEqual(res.params.nframes, 50 * 4410)
+        self.assertEqual(res.samples[0, 0], sum(range(50)))
+        self.assertEqual(res.samples[-1, 0], 49)
+
+    def test_pitchShiftKeepsFormat(self):
+        for path in [COFFEE, MONO_TOASTER]:
+            data = _getData(path)
+            res = _pitchShift(data, 3)
+            self.assertEqual(res.params, data.params)
+            self.assertEqual(res.samples.shape, data.samples.shape)
+
+    def test_pitchShiftInChunks(self):
+        params = wave._wave_params(2, 2, 44100, 0, "NONE", "not compressed")
+        t = np.arange(44100) / 44100
+        sine = (np.sin(2 * np.pi * 440 * t) * 10000).astype("<i2")
+        data = WavData(np.stack([sine, sine // 2], axis=1), params)
+        res = _pitchShift(data, 12, chunk_frames=10000).samples.astype(np.float64)
+        self.assertEqual(len(res), len(sine))
+        # an octave up, in both channels
+        for channel in range(2):
+            spectrum = np.abs(np.fft.rfft(res[:, channel]))
+            self.assertEqual(np.argmax(spectrum), 880)
+        # no dips where the chunks are joined
+        envelope = [abs(res[i : i + 200, 0]).max() for i in range(4000, 40000, 200)]
+        self.assertGreater(min(envelope), 0.9 * max(envelope))
+
+    def test_changeTempoKeepsPitch(self):
+        params = wave._wave_params(2, 2, 44100, 0, "NONE", "not compressed")
+        t = np.arange(44100) / 44100
+        sine = (np.sin(2 * np.pi * 440 * t) * 10000).astype("<i2")
+        data = WavData(np.stack([sine, sine // 2], axis=1), params)
+        for speed in [0.5, 0.8, 1.25, 3]:
+            res = _changeTempo(data, speed).samples.astype(np.float64)
+            self.assertEqual(len(res), round(44100 / speed))
+            spectrum = np.abs(np.fft.rfft(res[:, 0]))
+            self.assertAlmostEqual(np.argmax(spectrum) * speed, 440, delta=1)
+            # the windows line up, so the level stays steady
+            middle = res[2000:-2000]
+            envelope = [
+                abs(middle[i : i + 300, 0]).max()
+                for i in range(0, len(middle) - 300, 300)
+            ]
+            self.assertGreater(min(envelope), 0.95 * max(envelope))
+            self.assertAlmostEqual(np.abs(middle[:, 1]).max(), 5000, delta=100)
+
+    def test_resultCanBeWritten(self):
+        data = _changeTempo(_getData(TOASTER), 1.5)
+        path = Path("test", "temp_edit.wav")
+        try:
+            with wave.open(str(path), "wb") as wav_file:
+                wav_file.setparams(data.params)
+                wav_file.writeframes(data.frames)
+            self.assertEqual(_getData(str(path)).frames, data.frames)
+        finally:
+            path.unlink(missing_ok=True)
+
+    def test_wavDataRoundTrip(self):
+        for sampwidth in [1, 2, 3, 4]:
+            frames = bytes(range(256)) * 6
+            params = wave._wave_params(2, sampwidth, 8000, 0, "NONE", "not compressed")
+            data = WavData.fromBytes(frames, params)
+            self.assertEqual(data.samples.shape[1], 2)
+            self.assertEqual(data.params.nframes, len(frames) // (2 * sampwidth))
+            # a copy of the samples has to be turned back into bytes
+            self.assertEqual(WavData(data.samples.copy(), params).frames, frames)
+
+    def test_24BitSamples(self):
+        frames = bytes([0xFF, 0xFF, 0xFF, 0x00, 0x00, 0x80, 0xFF, 0xFF, 0x7F])
+        params = wave._wave_params(1, 3, 8000, 3, "NONE", "not compressed")
+        data = WavData.fromBytes(frames, params)
+        self.assertListEqual(data.samples[:, 0].tolist(), [-1, -(2**23), 2**23 - 1])
+
+    def test_cropAndReverseAreViews(self):
+        frames = bytes(range(256)) * 40
+        params = wave._wave_params(2, 2, 8000, 0, "NONE", "not compressed")
+        data = WavData.fromBytes(frames, params)
+        cropped = _crop(data, 0.25, 0.5)
+        self.assertTrue(np.shares_memory(cropped.samples, data.samples))
+        self.assertEqual(cropped.params.nframes, 640)
+        self.assertEqual(cropped.frames, frames[2560:5120])
+        reversed_data = _reverseSamples(cropped)
+        self.assertTrue(np.shares_memory(reversed_data.samples, data.samples))
+        self.assertEqual(reversed_data.frames[-4:], cropped.frames[:4])
+
+    def test_mapWav(self):
+        data = mapWav(COFFEE)
+        expected = _readWav(COFFEE)
+        self.assertEqual(data.params, expected.params)
+        self.assertEqual(data.frames, expected.frames)
+        # cropping before using the samples only decodes the frames that are kept
+        cropped = _crop(data, 0.5, 1)
+        self.assertTrue(
+            np.array_equal(
+                cropped.samples, expected.samples[len(expected.samples) // 2 :]
+            )
+        )
+        reversed_data = _reverseSamples(cropped)
+        self.assertTrue(np.array_equal(reversed_data.samples, cropped.samples[::-1]))
+
+    def test_getDataMapsLargeFiles(self):
+        threshold = audio_edits.MMAP_THRESHOLD
+        audio_edits.MMAP_THRESHOLD = 0
+        try:
+            data = _getData(TOASTER)
+        finally:
+            audio_edits.MMAP_THRESHOLD = threshold
+        base = data._raw
+        while isinstance(base, np.ndarray):
+            base = base.base
+        self.assertIsInstance(base.obj, mmap.mmap)
+        self.assertEqual(data.frames, _readWav(TOASTER).frames)
+
+    def test_renderSoundsWithWorkers(self):
+        paths = [COFFEE, TOASTER, COFFEE]
+        serial = renderSounds(paths, makeOptions(volume=0.5, reverse=True))
+        parallel = renderSounds(paths, makeOptions(volume=0.5, reverse=True, workers=2))
+        self.assertListEqual(
+            [sound.frames for sound in parallel], [sound.frames for sound in serial]
+        )
+        # each file is only rendered once
+        self.assertIs(parallel[0], parallel[2])
+
+    def test_renderSoundsFromSeveralThreads(self):
+        paths = [COFFEE, TOASTER]
+        options = makeOptions(volume=0.5, reverse=True)
+        expected = [sound.frames for sound in renderSounds(paths, options)]
+        results = []
+
+        def render(workers):
+            options = makeOptions(volume=0.5, reverse=True, workers=workers)
+            sounds = renderSounds(paths, options)
+            results.append([sound.frames for sound in sounds])
+
+        # asking for different pool sizes at once must not shut down a pool in use
+        threads = [Thread(target=render, args=(workers,)) for workers in [2, 3] * 4]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [expected] * len(threads))
+
+    def test_readWavHeaderRejectsOtherFiles(self):
+        with self.assertRaises(ValueError):
+            readWavHeader(str(Path("README.md")))
+
+    def test_volume(self):
+        params = wave._wave_params(1, 2, 8000, 4, "NONE", "not compressed")
+        data = WavData(np.array([[1000], [-1000], [30000], [-3]], dtype="<i2"), params)
+        louder = _scaleVolume(data, 1.5)
+        # samples are clipped to the range of the sample width and rounded down
+        self.assertListEqual(louder.samples[:, 0].tolist(), [1500, -1500, 32767, -5])
+        self.assertEqual(louder.samples.dtype, data.samples.dtype)
+
+
+if __name__ == "__main__":
+    unittest.main()
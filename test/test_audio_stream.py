@@ -0,0 +1,135 @@
+from pathlib import Path
+import sys
+import types
+import unittest
+from unittest import mock
+import wave
+import numpy as np
+from src.audio_edits import _getData, _readWav, applyPlan, edit
+from src.audio_stream import *
+import src.audio_stream as audio_stream
+from src.effect_plan import compilePlan
+from test.helpers import makeOptions
+
+COFFEE = str(Path("test", "test_sounds", "coffee.wav"))
+TOASTER = str(Path("test", "test_sounds", "toaster.wav"))
+SLURP = str(Path("test", "test_sounds", "coffee-slurp-2.wav"))
+
+
+class _FakePlayObject:
+    def wait_done(self):
+        pass
+
+
+def fakeSimpleaudio(buffers):
+    """A stand-in for the simpleaudio module that records the buffers it plays."""
+    module = types.ModuleType("simpleaudio")
+    module.play_buffer = lambda frames, *params: (
+        buffers.append((frames, params)) or _FakePlayObject()
+    )
+    module.stop_all = lambda: None
+    return module
+
+
+def render(stream):
+    return joinBlocks(stream.params, list(stream))
+
+
+class AudioStreamTests(unittest.TestCase):
+    def test_streamMatchesPlan(self):
+        options = makeOptions(volume=0.6, reverse=True, start_percent=0.1)
+        stream = streamEdit([COFFEE], options, block_frames=1000)
+        blocks = list(stream)
+        self.assertTrue(all(block.params.nframes <= 1000 for block in blocks))
+        expected = applyPlan(_getData(COFFEE), compilePlan(options))
+        self.assertEqual(joinBlocks(stream.params, blocks).frames, expected.frames)
+
+    def test_streamSlowDown(self):
+        options = makeOptions(speed=0.5)
+        res = render(streamEdit([COFFEE], options, block_frames=1000))
+        expected = applyPlan(_getData(COFFEE), compilePlan(options))
+        self.assertAlmostEqual(res.params.nframes, expected.params.nframes, delta=2)
+        self.assertEqual(res.params.framerate, expected.params.framerate)
+
+    def test_streamVarispeed(self):
+        options = makeOptions(speed=1.5, volume=0.5, speed_mode="varispeed")
+        res = render(streamEdit([COFFEE], options, block_frames=1000))
+        expected = applyPlan(_getData(COFFEE), compilePlan(options))
+        self.assertAlmostEqual(res.params.nframes, expected.params.nframes, delta=2)
+        self.assertAlmostEqual(res.params.nframes, 45220 / 1.5, delta=2)
+
+    def test_streamNotStreamable(self):
+        # changing the tempo needs the whole sound
+        options = makeOptions(speed=2)
+        res = render(streamEdit([COFFEE], options))
+        expected = applyPlan(_getData(COFFEE), compilePlan(options))
+        self.assertEqual(res.frames, expected.frames)
+
+    def test_mix(self):
+        options = makeOptions(parallel=True)
+        res = render(streamEdit([COFFEE, SLURP], options, block_frames=777))
+        coffee, slurp = _getData(COFFEE).samples, _getData(SLURP).samples
+        expected = np.zeros((max(len(coffee), len(slurp)), 2), dtype=np.int64)
+        expected[: len(coffee)] += coffee
+        expected[: len(slurp)] += slurp
+        expected = np.clip(expected, -(2**23), 2**23 - 1)
+        self.assertTrue(np.array_equal(res.samples, expected))
+
+    def test_join(self):
+        for options in [
+            makeOptions(),
+            makeOptions(crossfade_ms=0, gap_ms=30),
+            makeOptions(speed=0.7, end_percent=0.3),
+        ]:
+            paths = [COFFEE, SLURP, COFFEE]
+            # the sounds are joined a block at a time, not rendered as a whole
+            with mock.patch.object(audio_stream, "edit", side_effect=AssertionError):
+                stream = streamEdit(paths, options, block_frames=500)
+                blocks = list(stream)
+            self.assertGreater(len(blocks), 1)
+            res = joinBlocks(stream.params, blocks)
+            self.assertEqual(res.frames, edit(paths, options).frames)
+
+    def test_sinks(self):
+        path = Path("test", "temp_stream.wav")
+        try:
+            play(streamEdit([TOASTER], makeOptions(volume=2)), FileSink(path))
+            null_sink = NullSink()
+            blocks = play(streamEdit([TOASTER], makeOptions(volume=2)), null_sink, True)
+            written = _readWav(str(path))
+            self.assertEqual(
+                written.frames, joinBlocks(null_sink.params, blocks).frames
+            )
+            self.assertEqual(null_sink.frames, written.params.nframes)
+            self.assertEqual(null_sink.blocks, len(blocks))
+            self.assertIsNotNone(null_sink.first_block_time)
+        finally:
+            path.unlink(missing_ok=True)
+
+    def test_simpleaudioSinkPlaysOneBuffer(self):
+        buffers = []
+        with mock.patch.dict(sys.modules, simpleaudio=fakeSimpleaudio(buffers)):
+            stream = streamEdit([TOASTER], makeOptions(), block_frames=1000)
+            play(stream, SimpleaudioSink())
+        self.assertEqual(len(buffers), 1)
+        frames, params = buffers[0]
+        self.assertEqual(frames, _getData(TOASTER).frames)
+        self.assertEqual(params, (2, 3, 48000))
+
+    def test_stopAllDropsPendingBlocks(self):
+        buffers = []
+        with mock.patch.dict(sys.modules, simpleaudio=fakeSimpleaudio(buffers)):
+            sink = SimpleaudioSink()
+            sink.open(streamData(_getData(TOASTER)).params)
+            sink.write(_getData(TOASTER))
+            stopAll()
+            sink.write(_getData(TOASTER))
+            sink.close()
+            self.assertEqual(buffers, [])
+            # sinks opened after stopping play as usual
+            play(streamEdit([TOASTER], makeOptions()), SimpleaudioSink())
+        self.assertEqual(len(buffers), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
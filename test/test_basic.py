@@ -1,8 +1,14 @@
 from pathlib import Path
 import shutil
+import soundfile
+from threading import Thread
 import unittest
+import wave
 from src.sqlite_init import create_db
 from src.commander import *
+from src.storage_commander import ImportReport, _placeSound, findSoundFiles
+from src.audio_stream import NullSink
+from src.playback_options import PlaybackOptions
 from src.constants import *
 from src.sqlite_init import *
 
@@ -24,6 +30,7 @@ class BasicTests(unittest.TestCase):
         )
 
     def tearDown(self):
+        self.commander.close()
         Path(self.db_name).unlink()
         shutil.rmtree(self.base_dir)
 
@@ -77,6 +84,35 @@ class BasicTests(unittest.TestCase):
         with self.assertRaises(NameExists):
             self.commander.storage.addSound(path)
 
+    def test_addSoundConvert(self):
+        wav_path = Path(self.base_dir, "coffee.wav")
+        flac_path = Path(self.base_dir, "flac_coffee.flac")
+        data, samplerate = soundfile.read(wav_path, dtype="int16")
+        soundfile.write(flac_path, data, samplerate)
+        self.commander.storage.addSound(flac_path)
+        sound = self.commander.storage.getByName("flac_coffee")
+        self.assertEqual(sound.file_path.suffix, ".wav")
+        converted, converted_rate = soundfile.read(sound.file_path, dtype="int16")
+        self.assertEqual(converted_rate, samplerate)
+        self.assertTrue((converted == data).all())
+        # no temporary files should be left behind
+        self.assertListEqual(list(self.base_dir.glob(".*")), [])
+
+    def test_playAudioSave(self):
+        sink = NullSink()
+        self.commander.output = lambda: sink
+        self.commander.storage.addSound(Path(self.base_dir, "coffee.wav"))
+        options = PlaybackOptions(
+            None, 0.5, True, None, None, None, None, "quiet_coffee", None, False
+        )
+        self.commander.playAudio(["coffee"], options)
+        self.commander.play_stats.flush()
+        sound = self.commander.storage.getByName("quiet_coffee")
+        self.assertTrue(sound.file_path.exists())
+        with wave.open(str(sound.file_path), "rb") as wave_read:
+            self.assertEqual(wave_read.getnframes(), sink.frames)
+        self.assertEqual(self.commander.storage.getByName("coffee").play_count, 1)
+
     def test_removeSoundSuccess(self):
         path = Path(self.base_dir, "coffee.wav")
         self.commander.storage.addSound(path)
@@ -116,6 +152,26 @@ class BasicTests(unittest.TestCase):
         audios = self.commander.storage.getByTags("example tag")
         self.assertEqual(len(audios), 0)
 
+    def test_getByTags(self):
+        addAllSounds(self.base_dir, self.commander)
+        self.commander.storage.addTag("coffee", "drink")
+        self.commander.storage.addTag("coffee", "hot")
+        self.commander.storage.addTag("coffee-slurp-2", "drink")
+        self.commander.storage.addTag("toaster", "hot")
+        storage = self.commander.storage
+        names = lambda sounds: [sound.name for sound in sounds]
+        self.assertListEqual(
+            names(storage.getByTags(["drink", "hot"])),
+            ["coffee", "coffee-slurp-2", "toaster"],
+        )
+        self.assertListEqual(
+            names(storage.getByTags(["drink", "hot"], match_all=True)), ["coffee"]
+        )
+        self.assertListEqual(
+            names(storage.getByTags(["drink"], exclude=["hot"])), ["coffee-slurp-2"]
+        )
+        self.assertEqual(len(storage.getByTags([], exclude=["drink", "hot"])), 7)
+
     def test_addTagTooLong(self):
         addAllSounds(self.base_dir, self.commander)
         with self.assertRaises(ValueError):
@@ -159,6 +215,34 @@ class BasicTests(unittest.TestCase):
             },
         )
 
+    def test_getSoundsWithTags(self):
+        addAllSounds(self.base_dir, self.commander)
+        self.commander.storage.addTag("coffee", "drink")
+        self.commander.storage.addTag("coffee", "hot, bitter")
+        self.commander.storage.addTag("toaster", "kitchen")
+        tags = {sound.name: sound.tags for sound in self.commander.storage.getAll()}
+        self.assertSetEqual(tags["coffee"], {"drink", "hot, bitter"})
+        self.assertSetEqual(tags["toaster"], {"kitchen"})
+        self.assertSetEqual(tags["coffee-slurp-2"], set())
+
+    def test_iterSounds(self):
+        addAllSounds(self.base_dir, self.commander)
+        storage = self.commander.storage
+        # small batches so that several pages are needed
+        names = [sound.name for sound in storage.iterSounds(batch_size=3)]
+        self.assertListEqual(names, sorted(sound.name for sound in storage.getAll()))
+        storage.addTag("toaster", "kitchen")
+        storage.addTag("coffee", "kitchen")
+        names = [
+            sound.name
+            for sound in storage.iterSounds(
+                order_by="date_added", batch_size=1, tags=["kitchen"]
+            )
+        ]
+        self.assertSetEqual(set(names), {"coffee", "toaster"})
+        with self.assertRaises(ValueError):
+            list(storage.iterSounds(order_by="duration"))
+
     def test_clean(self):
         addAllSounds(self.base_dir, self.commander)
         # remove coffee.wav and toaster.wav and make sure that clean removes them
@@ -166,6 +250,37 @@ class BasicTests(unittest.TestCase):
         Path(self.base_dir, "toaster.wav").unlink()
         removed_sounds = {sound.name for sound in self.commander.storage.clean()}
         self.assertSetEqual(removed_sounds, {"coffee", "toaster"})
+        names = {sound.name for sound in self.commander.storage.getAll()}
+        self.assertNotIn("coffee", names)
+        self.assertIn("coffee-slurp-2", names)
+        self.assertEqual(self.commander.storage.clean(), [])
+
+    def test_cleanDryRun(self):
+        addAllSounds(self.base_dir, self.commander)
+        self.commander.storage.addTag("coffee", "drink")
+        Path(self.base_dir, "coffee.wav").unlink()
+        removed_sounds = self.commander.storage.clean(dry_run=True)
+        self.assertListEqual([sound.name for sound in removed_sounds], ["coffee"])
+        # nothing is removed until the real run, which also removes the tags
+        self.commander.storage.getByName("coffee")
+        self.commander.storage.clean()
+        with self.assertRaises(NameMissing):
+            self.commander.storage.getByName("coffee")
+        self.assertListEqual(self.commander.storage.getByTags(["drink"]), [])
+
+    def test_cleanOutsideBaseDirectory(self):
+        self.commander.storage.addSound(Path(self.base_dir, "coffee.wav"))
+        self.commander.storage.addSound(Path(self.base_dir, "toaster.wav"))
+        # sounds stored somewhere else are checked one by one
+        elsewhere = Path(self.base_dir, "elsewhere")
+        elsewhere.mkdir()
+        moved = Path(elsewhere, "moved.wav")
+        Path(self.base_dir, "coffee.wav").rename(moved)
+        self.commander.storage.database.rename("coffee", "moved", str(moved))
+        self.assertListEqual(self.commander.storage.clean(), [])
+        moved.unlink()
+        removed_sounds = self.commander.storage.clean()
+        self.assertListEqual([sound.name for sound in removed_sounds], ["moved"])
 
     def test_fuzzySearch(self):
         self.commander.storage.addSound(Path(self.base_dir, "coffee.wav"))
@@ -188,6 +303,162 @@ class BasicTests(unittest.TestCase):
             ],
         )
 
+    def test_databaseUsableFromOtherThread(self):
+        addAllSounds(self.base_dir, self.commander)
+        sounds = []
+        thread = Thread(
+            target=lambda: sounds.append(self.commander.storage.getByName("coffee"))
+        )
+        thread.start()
+        thread.join()
+        self.assertEqual(sounds[0].name, "coffee")
+
+    def test_databaseClosesConnectionsOfExitedThreads(self):
+        database = self.commander.storage.database
+        self.commander.storage.getAll()
+        for _ in range(20):
+            thread = Thread(target=self.commander.storage.getAll)
+            thread.start()
+            thread.join()
+        del thread
+        # only the main thread's connection is left
+        self.assertEqual(len(database._connections), 1)
+
+    def test_databaseClosed(self):
+        self.commander.close()
+        with self.assertRaises(DatabaseException):
+            self.commander.storage.getAll()
+
+    def test_fuzzySearchAfterRenameAndRemove(self):
+        addAllSounds(self.base_dir, self.commander)
+        self.commander.storage.rename("coffee", "espresso")
+        self.commander.storage.removeSound("toaster")
+        res = [
+            sound.name for sound in self.commander.storage.fuzzySearch("expresso", 1)
+        ]
+        self.assertListEqual(res, ["espresso"])
+        res = [sound.name for sound in self.commander.storage.fuzzySearch("toaster", 2)]
+        self.assertEqual(res[0], "toaster-2")
+        self.assertNotIn("toaster", res)
+
+    def test_search(self):
+        addAllSounds(self.base_dir, self.commander)
+        self.commander.storage.addTag("coffee", "Breakfast")
+        self.commander.storage.addTag("toaster", "breakfast")
+        res = {sound.name for sound in self.commander.storage.search("slur 3")}
+        self.assertSetEqual(res, {"coffee-slurp-3"})
+        res = {sound.name for sound in self.commander.storage.search("break")}
+        self.assertSetEqual(res, {"coffee", "toaster"})
+        res = self.commander.storage.search("break", fields=["name"])
+        self.assertEqual(len(res), 0)
+
+    def test_searchAfterRenameAndRemove(self):
+        addAllSounds(self.base_dir, self.commander)
+        self.commander.storage.addTag("coffee", "drink")
+        self.commander.storage.rename("coffee", "espresso")
+        self.commander.storage.removeSound("toaster-2")
+        res = [sound.name for sound in self.commander.storage.search("drink")]
+        self.assertListEqual(res, ["espresso"])
+        res = {sound.name for sound in self.commander.storage.search("toaster")}
+        self.assertSetEqual(res, {"toaster"})
+        self.commander.storage.removeTag("espresso", "drink")
+        self.assertEqual(len(self.commander.storage.search("drink")), 0)
+
+    def test_addSounds(self):
+        import_dir = Path("test", "temp_import")
+        shutil.copytree(Path("test", "test_sounds"), Path(import_dir, "nested"))
+        shutil.move(Path(self.base_dir, "coffee.wav"), import_dir)
+        # start from an empty archive directory
+        for path in Path(self.base_dir).iterdir():
+            path.unlink()
+        try:
+            paths = findSoundFiles(import_dir)
+            self.assertEqual(len(paths), 11)
+            report = self.commander.storage.addSounds(paths, "me", workers=2)
+            # coffee.wav is there twice, so the second one fails
+            self.assertEqual(len(report.added), 10)
+            self.assertEqual(len(report.failed), 1)
+            sound = self.commander.storage.getByName("coffee-slurp-2")
+            self.assertEqual(sound.author, "me")
+            self.assertTrue(sound.file_path.exists())
+            self.assertEqual(
+                self.commander.storage.fuzzySearch("tosater", 1)[0].name, "toaster"
+            )
+            # importing again shouldn't add anything
+            report = self.commander.storage.addSounds(paths, workers=1)
+            self.assertEqual(len(report.added), 0)
+            self.assertEqual(len(report.skipped), 11)
+        finally:
+            shutil.rmtree(import_dir)
+
+    def test_addSoundsBadFile(self):
+        bad_path = Path(self.base_dir, "broken.wav")
+        bad_path.write_bytes(b"not a sound")
+        paths = [bad_path, Path(self.base_dir, "coffee.wav")]
+        report = self.commander.storage.addSounds(paths, workers=1)
+        self.assertListEqual(report.added, ["coffee"])
+        self.assertEqual(report.failed[0][0], bad_path)
+        with self.assertRaises(NameMissing):
+            self.commander.storage.getByName("broken")
+
+    def test_addSoundsDoesNotOverwrite(self):
+        import_dir = Path("test", "temp_import")
+        import_dir.mkdir()
+        try:
+            shutil.copyfile(
+                Path(self.base_dir, "toaster.wav"), Path(import_dir, "coffee.wav")
+            )
+            # coffee.wav is in the archive directory but not in the database
+            report = self.commander.storage.addSounds(
+                [Path(import_dir, "coffee.wav")], workers=1
+            )
+            self.assertEqual(report.added, [])
+            self.assertIn("already exists", report.failed[0][1])
+            self.assertEqual(
+                Path(self.base_dir, "coffee.wav").read_bytes(),
+                Path("test", "test_sounds", "coffee.wav").read_bytes(),
+            )
+        finally:
+            shutil.rmtree(import_dir)
+
+    def test_addSoundsResumesInterruptedImport(self):
+        import_dir = Path("test", "temp_import")
+        shutil.copytree(Path("test", "test_sounds"), import_dir)
+        for path in Path(self.base_dir).iterdir():
+            path.unlink()
+        try:
+            paths = findSoundFiles(import_dir)
+            # an import that was stopped after placing some files, before adding
+            # them to the database
+            for path in paths[:3]:
+                _placeSound(path, Path(self.base_dir, path.name))
+            report = self.commander.storage.addSounds(paths, workers=1)
+            self.assertEqual(report.failed, [])
+            self.assertEqual(len(report.added), len(paths))
+            report = self.commander.storage.addSounds(paths, workers=1)
+            self.assertEqual(len(report.skipped), len(paths))
+        finally:
+            shutil.rmtree(import_dir)
+
+    def test_addSoundsRemovesFilesThatArentAdded(self):
+        import_dir = Path("test", "temp_import")
+        import_dir.mkdir()
+        try:
+            path = Path(import_dir, "new.wav")
+            shutil.copyfile(Path(self.base_dir, "coffee.wav"), path)
+            new_path = Path(self.base_dir, "new.wav")
+            duration = _placeSound(path, new_path)
+            # someone else adds a sound with the same name before the insert
+            self.commander.storage.database.addSound("elsewhere.wav", "new", 1, 0)
+            report = ImportReport()
+            sound = (str(new_path), "new", duration, 0, None)
+            self.commander.storage._addBatch([(path, sound, True)], report)
+            self.assertEqual(report.failed[0][0], path)
+            self.assertFalse(new_path.exists())
+            self.assertTrue(path.exists())
+        finally:
+            shutil.rmtree(import_dir)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,77 @@
+import contextlib
+import io
+from pathlib import Path
+import shutil
+import unittest
+from src.archive_client import DEFAULT_SERVER_ADDRESS
+from src.cli import Cli
+from src.commander import Commander
+from src.sqlite_init import create_db
+
+
+class CliParsingTests(unittest.TestCase):
+    def setUp(self):
+        self.cli = Cli(None)
+
+    def test_server(self):
+        args = self.cli.parser.parse_args(["--server", "list"])
+        self.assertTrue(args.server)
+        self.assertEqual(args.command, "list")
+        self.assertEqual(args.address, DEFAULT_SERVER_ADDRESS)
+        args = self.cli.parser.parse_args(["--server", "play", "coffee", "-v", "0.5"])
+        self.assertEqual(args.command, "play")
+        self.assertEqual(args.names, ["coffee"])
+
+    def test_serverAddress(self):
+        address = "unix:///tmp/archive.sock"
+        args = self.cli.parser.parse_args(["--server", "--address", address, "list"])
+        self.assertEqual(
+            (args.server, args.address, args.command), (True, address, "list")
+        )
+        args = self.cli.parser.parse_args(["serve", address])
+        self.assertEqual((args.server, args.address), (False, address))
+        args = self.cli.parser.parse_args(["--address", address, "serve"])
+        self.assertEqual(args.address, address)
+        args = self.cli.parser.parse_args(["serve"])
+        self.assertEqual(args.address, DEFAULT_SERVER_ADDRESS)
+
+    def test_noCommand(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.cli.executeCommand(self.cli.parser.parse_args(["--server"]))
+        self.assertIn("usage:", output.getvalue())
+
+
+class CliCommandTests(unittest.TestCase):
+    def setUp(self):
+        self.base_dir = Path("test", "temp_cli_sounds")
+        shutil.copytree(Path("test", "test_sounds"), self.base_dir)
+        self.db_name = Path("test", "test_cli_archive.db")
+        create_db(str(self.db_name))
+        self.commander = Commander(
+            sounds_directory=str(self.base_dir), database_path=str(self.db_name)
+        )
+        self.cli = Cli(self.commander)
+
+    def tearDown(self):
+        self.commander.close()
+        Path(self.db_name).unlink()
+        shutil.rmtree(self.base_dir)
+
+    def runCli(self, *args):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.cli.executeCommand(self.cli.parser.parse_args(list(args)))
+        return output.getvalue()
+
+    def test_addOverFileNotInArchive(self):
+        # coffee.wav is in the archive directory, but not in the archive
+        output = self.runCli("add", str(Path("test", "test_sounds", "coffee.wav")))
+        self.assertIn("already exists", output)
+        self.assertIn("--name", output)
+        self.runCli("add", str(Path("test", "test_sounds", "coffee.wav")), "-n", "tea")
+        self.assertEqual(self.commander.storage.getByName("tea").name, "tea")
+
+
+if __name__ == "__main__":
+    unittest.main()
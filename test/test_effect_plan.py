@@ -0,0 +1,95 @@
+from pathlib import Path
+import unittest
+import numpy as np
+from src.audio_edits import applyPlan
+from src.audio_edits import _crop, _getData, _reverseSamples, _scaleVolume
+from src.effect_plan import *
+from test.helpers import makeOptions
+
+COFFEE = str(Path("test", "test_sounds", "coffee.wav"))
+
+
+class EffectPlanTests(unittest.TestCase):
+    def test_identityStagesSkipped(self):
+        plan = compilePlan(makeOptions(speed=1, volume=1, transpose=0))
+        self.assertEqual(len(plan), 0)
+        self.assertEqual(plan.passes(), 0)
+        self.assertListEqual(
+            plan.skipped, ["crop", "speed", "volume", "transpose", "reverse"]
+        )
+
+    def test_cropFirst(self):
+        plan = compilePlan(makeOptions(speed=2, reverse=True, end_percent=0.5))
+        self.assertListEqual(
+            plan.stages,
+            [
+                Stage("crop", start=0, end=0.5),
+                Stage("tempo", speed=2),
+                Stage("reverse"),
+            ],
+        )
+        self.assertEqual(plan.passes(), 1)
+
+    def test_slowDownAndTransposeFused(self):
+        options = makeOptions(speed=0.5, volume=2, reverse=True, transpose=3)
+        plan = compilePlan(options)
+        self.assertListEqual(
+            plan.stages,
+            [Stage("resample", speed=0.5, semitones=3, volume=2), Stage("reverse")],
+        )
+        self.assertEqual(plan.passes(), 1)
+        self.assertIn("transpose +3 semitones", plan.explain())
+
+    def test_volumeFoldedIntoTranspose(self):
+        plan = compilePlan(makeOptions(volume=0.5, transpose=-2))
+        self.assertListEqual(
+            plan.stages, [Stage("transpose", semitones=-2, volume=0.5)]
+        )
+
+    def test_planMatchesStageByStage(self):
+        data = _getData(COFFEE)
+        options = makeOptions(volume=0.7, reverse=True, start_percent=0.2)
+        expected = _reverseSamples(_scaleVolume(_crop(data, 0.2, 1), 0.7))
+        res = applyPlan(data, compilePlan(options))
+        self.assertEqual(res.frames, expected.frames)
+
+    def test_cropSeconds(self):
+        data = _getData(COFFEE)
+        res = applyPlan(data, compilePlan(makeOptions(start_sec=0.25, end_sec=0.5)))
+        self.assertEqual(res.params.nframes, data.params.framerate // 4)
+
+    def test_resample(self):
+        data = _getData(COFFEE)
+        res = applyPlan(data, compilePlan(makeOptions(speed=0.5)))
+        self.assertEqual(res.params.framerate, data.params.framerate)
+        self.assertEqual(res.params.sampwidth, data.params.sampwidth)
+        self.assertAlmostEqual(res.params.nframes, 2 * data.params.nframes, delta=2)
+        self.assertTrue(np.abs(res.samples).max() < 2**23)
+
+    def test_speedModes(self):
+        plan = compilePlan(makeOptions(speed=2, volume=2, speed_mode="varispeed"))
+        self.assertEqual(
+            plan.stages, [Stage("resample", speed=2, semitones=0, volume=2)]
+        )
+        self.assertIn("speed up x2", plan.explain())
+        plan = compilePlan(makeOptions(speed=0.5, transpose=1, speed_mode="tempo"))
+        self.assertEqual(
+            plan.stages,
+            [Stage("tempo", speed=0.5), Stage("transpose", semitones=1, volume=1)],
+        )
+
+    def test_tempo(self):
+        data = _getData(COFFEE)
+        for speed in [0.5, 1.5]:
+            options = makeOptions(speed=speed, speed_mode="tempo")
+            res = applyPlan(data, compilePlan(options))
+            self.assertEqual(
+                res.params, data.params._replace(nframes=res.params.nframes)
+            )
+            self.assertAlmostEqual(
+                res.params.nframes, data.params.nframes / speed, delta=1
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+from src.fuzzy_search import *
+
+
+class FuzzySearchTests(unittest.TestCase):
+    def test_editDistance(self):
+        self.assertEqual(editDistance("horse", "ros"), 3)
+        self.assertEqual(editDistance("intention", "execution"), 5)
+        self.assertEqual(editDistance("", "abc"), 3)
+        self.assertEqual(editDistance("coffee", "coffee"), 0)
+
+    def test_editDistanceGivesUp(self):
+        # the distance is 5, so anything lower than that is exceeded
+        self.assertEqual(editDistance("intention", "execution", 2), 3)
+        self.assertEqual(editDistance("intention", "execution", 5), 5)
+        # length difference alone is too much
+        self.assertEqual(editDistance("a", "abcdef", 1), 2)
+
+    def test_batchEditDistance(self):
+        words = ["horse", "", "ros", "roses", "execution"]
+        distances = batchEditDistance("ros", words)
+        self.assertListEqual(
+            [int(distance) for distance in distances],
+            [editDistance(word, "ros") for word in words],
+        )
+
+    def test_topK(self):
+        best = TopK(2)
+        best.push(3, "c", 1)
+        best.push(1, "b", 2)
+        self.assertFalse(best.accepts(4))
+        best.push(1, "a", 3)
+        self.assertListEqual(best.results(), [(1, "a", 3), (1, "b", 2)])
+        self.assertEqual(best.maxDistance(), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -52,6 +52,7 @@ class Test_GUI:
 
     # remove directories
     def stopTesting(self):
+        self.commander.close()
         Path(self.db_name).unlink()
         shutil.rmtree(self.base_dir)
 
@@ -0,0 +1,134 @@
+import gc
+from pathlib import Path
+import shutil
+import threading
+import time
+import unittest
+import weakref
+from src.commander import *
+from src.play_stats import PlayStatsRecorder
+from src.sqlite_init import create_db
+
+
+class FakeStorage:
+    def __init__(self):
+        self.batches = []
+        self.written = threading.Event()
+
+    def recordPlays(self, plays):
+        self.batches.append(sorted(plays))
+        self.written.set()
+        return len(plays)
+
+
+class FailingStorage(FakeStorage):
+    """Storage whose first recordPlays call fails."""
+
+    def __init__(self):
+        super().__init__()
+        self.failed = False
+
+    def recordPlays(self, plays):
+        if not self.failed:
+            self.failed = True
+            raise OSError("database is locked")
+        return super().recordPlays(plays)
+
+
+class PlayStatsTests(unittest.TestCase):
+    def test_batchesEvents(self):
+        storage = FakeStorage()
+        recorder = PlayStatsRecorder(storage, flush_interval=0.05)
+        recorder.record(["coffee", "toaster"], play_time=10)
+        recorder.record(["coffee"], play_time=20)
+        self.assertTrue(storage.written.wait(5))
+        self.assertEqual(storage.batches, [[("coffee", 2, 20), ("toaster", 1, 10)]])
+        self.assertEqual(recorder.pending(), 0)
+        recorder.close()
+
+    def test_closeFlushes(self):
+        storage = FakeStorage()
+        recorder = PlayStatsRecorder(storage, flush_interval=60)
+        recorder.record(["coffee"], play_time=10)
+        start = time.perf_counter()
+        recorder.close()
+        self.assertLess(time.perf_counter() - start, 5)
+        self.assertEqual(storage.batches, [[("coffee", 1, 10)]])
+        recorder.close()
+        with self.assertRaises(RuntimeError):
+            recorder.record(["coffee"])
+
+    def test_failedFlushKeepsEvents(self):
+        storage = FailingStorage()
+        recorder = PlayStatsRecorder(storage, flush_interval=60)
+        recorder.record(["coffee", "toaster"], play_time=10)
+        with self.assertRaises(OSError):
+            recorder.flush()
+        self.assertEqual(recorder.pending(), 2)
+        recorder.record(["coffee"], play_time=20)
+        recorder.close()
+        self.assertEqual(storage.batches, [[("coffee", 2, 20), ("toaster", 1, 10)]])
+
+    def test_notKeptAlive(self):
+        storage = FakeStorage()
+        recorder = PlayStatsRecorder(storage, flush_interval=60)
+        recorder.record(["coffee"], play_time=10)
+        thread = recorder._thread
+        recorder_ref = weakref.ref(recorder)
+        del recorder
+        gc.collect()
+        self.assertIsNone(recorder_ref())
+        # what was left is written, and the thread stops
+        self.assertEqual(storage.batches, [[("coffee", 1, 10)]])
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+
+    def test_noThreadUntilPlayed(self):
+        recorder = PlayStatsRecorder(FakeStorage())
+        self.assertIsNone(recorder._thread)
+        recorder.close()
+
+
+class RecordPlaysTests(unittest.TestCase):
+    def setUp(self):
+        self.base_dir = Path("test", "temp_play_stats_sounds")
+        shutil.copytree(Path("test", "test_sounds"), self.base_dir)
+        self.db_name = Path("test", "test_play_stats.db")
+        create_db(str(self.db_name))
+        self.commander = Commander(
+            sounds_directory=str(self.base_dir), database_path=str(self.db_name)
+        )
+        for name in ["coffee", "toaster"]:
+            self.commander.storage.addSound(Path(self.base_dir, f"{name}.wav"))
+
+    def tearDown(self):
+        self.commander.close()
+        Path(self.db_name).unlink()
+        shutil.rmtree(self.base_dir)
+
+    def test_recordPlays(self):
+        storage = self.commander.storage
+        storage.incrementPlayCount("coffee")
+        storage.updateLastPlayed("coffee")
+        played = storage.getByName("coffee").last_played
+        updated = storage.recordPlays(
+            [("coffee", 2, 5), ("toaster", 3, 100), ("removed", 1, 100)]
+        )
+        self.assertEqual(updated, 2)
+        coffee = storage.getByName("coffee")
+        # an older play doesn't move last_played back
+        self.assertEqual((coffee.play_count, coffee.last_played), (3, played))
+        toaster = storage.getByName("toaster")
+        self.assertEqual((toaster.play_count, toaster.last_played), (3, 100))
+
+    def test_closeWritesPlays(self):
+        self.commander.play_stats.record(["toaster"], play_time=100)
+        self.commander.close()
+        self.commander = Commander(
+            sounds_directory=str(self.base_dir), database_path=str(self.db_name)
+        )
+        self.assertEqual(self.commander.storage.getByName("toaster").play_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
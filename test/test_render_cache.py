@@ -0,0 +1,130 @@
+from pathlib import Path
+import shutil
+from threading import Thread
+import time
+import unittest
+from unittest import mock
+from src.audio_edits import _getData, edit
+from src.render_cache import *
+import src.render_cache as render_cache
+from test.helpers import makeOptions
+
+
+class RenderCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.sounds_dir = Path("test", "temp_render_sounds")
+        shutil.copytree(Path("test", "test_sounds"), self.sounds_dir)
+        self.cache_dir = Path("test", "temp_render_cache")
+        self.cache = RenderCache(self.cache_dir)
+        self.coffee = str(Path(self.sounds_dir, "coffee.wav"))
+        self.toaster = str(Path(self.sounds_dir, "toaster.wav"))
+
+    def tearDown(self):
+        shutil.rmtree(self.sounds_dir)
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_keyNormalizesOptions(self):
+        key = self.cache.key([self.coffee], makeOptions(volume=0.5))
+        self.assertEqual(
+            key, self.cache.key([self.coffee], makeOptions(speed=1, volume=0.5))
+        )
+        # a single sound is the same whether or not it is played in parallel
+        self.assertEqual(
+            key, self.cache.key([self.coffee], makeOptions(volume=0.5, parallel=True))
+        )
+        self.assertNotEqual(key, self.cache.key([self.coffee], makeOptions()))
+        self.assertNotEqual(
+            key, self.cache.key([self.toaster], makeOptions(volume=0.5))
+        )
+
+    def test_keyChangesWithContent(self):
+        options = makeOptions(reverse=True)
+        key = self.cache.key([self.coffee], options)
+        shutil.copyfile(self.toaster, self.coffee)
+        self.assertNotEqual(key, self.cache.key([self.coffee], options))
+
+    def test_keyCoversRenderingCode(self):
+        read = []
+        original = Path.read_bytes
+
+        def readBytes(path):
+            read.append(path.name)
+            return original(path)
+
+        with mock.patch.object(Path, "read_bytes", readBytes):
+            self.cache.key([self.coffee], makeOptions())
+        for name in [
+            "audio_edits.py",
+            "audio_stream.py",
+            "effect_plan.py",
+            "wav_reader.py",
+        ]:
+            self.assertIn(name, read)
+
+    def test_getAndPut(self):
+        options = makeOptions(volume=0.5, reverse=True)
+        key = self.cache.key([self.coffee], options)
+        self.assertIsNone(self.cache.get(key))
+        rendered = edit([self.coffee], options)
+        self.cache.put(key, rendered)
+        cached = self.cache.get(key)
+        self.assertEqual(cached.frames, rendered.frames)
+        self.assertEqual(cached.params, rendered.params)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        self.assertEqual(self.cache.stats()["entries"], 1)
+        self.cache.clear()
+        self.assertIsNone(self.cache.get(key))
+
+    def test_leastRecentlyUsedEvicted(self):
+        data = _getData(self.coffee)
+        size = len(data.frames) + 44
+        self.cache.max_bytes = 2 * size
+        for key in ["a", "b"]:
+            self.cache.put(key, data)
+            # make sure the access times differ
+            time.sleep(0.01)
+        self.cache.get("a")
+        time.sleep(0.01)
+        self.cache.put("c", data)
+        self.assertIsNotNone(self.cache.get("a"))
+        self.assertIsNone(self.cache.get("b"))
+        self.assertIsNotNone(self.cache.get("c"))
+        self.assertEqual(self.cache.evictions, 1)
+        self.assertLessEqual(self.cache.stats()["bytes"], self.cache.max_bytes)
+
+    def test_putFromSeveralThreads(self):
+        data = _getData(self.coffee)
+        errors = []
+
+        def put():
+            try:
+                for _ in range(5):
+                    self.cache.put("same", data)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [Thread(target=put) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertListEqual(errors, [])
+        self.assertEqual(self.cache.get("same").frames, data.frames)
+        # no temporary files are left behind
+        self.assertListEqual(
+            [path.name for path in self.cache_dir.iterdir()], ["same.wav"]
+        )
+
+    def test_fileHashesBounded(self):
+        with mock.patch.object(render_cache, "_MAX_FILE_HASHES", 2):
+            options = makeOptions()
+            key = self.cache.key([self.coffee], options)
+            for name in ["toaster.wav", "toaster-2.wav", "coffee-slurp-2.wav"]:
+                self.cache.key([str(Path(self.sounds_dir, name))], options)
+            self.assertEqual(len(self.cache._file_hashes), 2)
+            # a forgotten hash is found again
+            self.assertEqual(key, self.cache.key([self.coffee], options))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+from pathlib import Path
+import io
+import shutil
+import tempfile
+from threading import Thread
+import unittest
+import wave
+from src.archive_client import ArchiveClient, ServerUnavailable, optionsToDict
+from src.audio_stream import NullSink
+from src.commander import *
+from src.server import SERVER_WORKERS, createApp, makeServer
+from src.sqlite_init import create_db
+from test.helpers import makeOptions
+
+
+class ServerTests(unittest.TestCase):
+    def setUp(self):
+        self.base_dir = Path("test", "temp_server_sounds")
+        shutil.copytree(Path("test", "test_sounds"), self.base_dir)
+        self.db_name = Path("test", "test_server_archive.db")
+        create_db(str(self.db_name))
+        self.commander = Commander(
+            sounds_directory=str(self.base_dir), database_path=str(self.db_name)
+        )
+        self.sink = NullSink()
+        self.commander.output = lambda: self.sink
+        for name in ["coffee", "toaster"]:
+            self.commander.storage.addSound(Path(self.base_dir, f"{name}.wav"))
+        self.app = createApp(self.commander).test_client()
+
+    def tearDown(self):
+        self.commander.close()
+        Path(self.db_name).unlink()
+        shutil.rmtree(self.base_dir)
+
+    def test_listAndTag(self):
+        response = self.app.put("/tags", json={"name": "coffee", "tag": "drink"})
+        self.assertEqual(response.status_code, 200)
+        sounds = self.app.get("/sounds").get_json()
+        self.assertEqual([sound["name"] for sound in sounds], ["coffee", "toaster"])
+        sounds = self.app.get("/sounds", query_string={"tag": "drink"}).get_json()
+        self.assertEqual([sound["name"] for sound in sounds], ["coffee"])
+        self.assertEqual(sounds[0]["tags"], ["drink"])
+        self.app.delete("/tags", json={"name": "coffee", "tag": "drink"})
+        self.assertEqual(self.commander.storage.getByName("coffee").tags, set())
+
+    def test_search(self):
+        response = self.app.get("/sounds/search", query_string={"q": "toast"})
+        self.assertEqual([sound["name"] for sound in response.get_json()], ["toaster"])
+        response = self.app.get("/sounds/find", query_string={"name": "cofee", "n": 1})
+        self.assertEqual([sound["name"] for sound in response.get_json()], ["coffee"])
+
+    def test_errors(self):
+        response = self.app.put("/tags", json={"name": "tea", "tag": "drink"})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.get_json()["error"], "NameMissing")
+        response = self.app.post(
+            "/sounds", json={"file_path": str(Path(self.base_dir, "coffee.wav"))}
+        )
+        self.assertEqual(response.status_code, 409)
+        response = self.app.get("/sounds/find", query_string={"name": "a", "n": "x"})
+        self.assertEqual(response.status_code, 400)
+        response = self.app.post("/play", json={"names": ["coffee"]})
+        self.assertEqual(response.status_code, 400)
+        # toaster-2.wav is in the archive directory, but not in the archive
+        response = self.app.post(
+            "/sounds",
+            json={"file_path": str(Path("test", "test_sounds", "toaster-2.wav"))},
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.get_json()["error"], "FileExistsError")
+
+    def test_playAndRender(self):
+        body = {"names": ["coffee"], "options": optionsToDict(makeOptions(volume=0.5))}
+        response = self.app.post("/play", json=body)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.sink.frames, 45220)
+        self.commander.play_stats.flush()
+        self.assertEqual(self.commander.storage.getByName("coffee").play_count, 1)
+        response = self.app.post("/render", json=body)
+        self.assertEqual(response.mimetype, "audio/wav")
+        with wave.open(io.BytesIO(response.data), "rb") as wave_read:
+            self.assertEqual(wave_read.getnframes(), 45220)
+
+    def test_client(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            address = f"unix://{Path(temp_dir, 'archive.sock')}"
+            server = makeServer(self.commander, address)
+            thread = Thread(target=server.serve_forever)
+            thread.start()
+            try:
+                client = ArchiveClient(address)
+                client.storage.addTag("coffee", "drink")
+                sounds = list(client.storage.iterSounds(tags=["drink"]))
+                self.assertEqual(sounds, [self.commander.storage.getByName("coffee")])
+                self.assertEqual(sounds[0].tags, {"drink"})
+                with self.assertRaises(NameMissing):
+                    client.storage.addTag("tea", "drink")
+                with self.assertRaises(FileExistsError):
+                    client.storage.addSound(
+                        Path("test", "test_sounds", "toaster-2.wav")
+                    )
+                client.playAudio(["toaster"], makeOptions())
+                self.assertGreater(self.sink.frames, 0)
+            finally:
+                server.shutdown()
+                server.server_close()
+                thread.join()
+            with self.assertRaises(ServerUnavailable):
+                list(client.storage.iterSounds())
+
+    def test_serverConnectionsBounded(self):
+        database = self.commander.storage.database
+        with tempfile.TemporaryDirectory() as temp_dir:
+            address = f"unix://{Path(temp_dir, 'archive.sock')}"
+            server = makeServer(self.commander, address)
+            thread = Thread(target=server.serve_forever)
+            thread.start()
+            try:
+                client = ArchiveClient(address)
+                for _ in range(200):
+                    client.storage.fuzzySearch("coffee", 1)
+                # one connection for each worker, and the one used by setUp
+                self.assertLessEqual(len(database._connections), SERVER_WORKERS + 1)
+            finally:
+                server.shutdown()
+                server.server_close()
+                thread.join()
+
+
+if __name__ == "__main__":
+    unittest.main()
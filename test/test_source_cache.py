@@ -0,0 +1,52 @@
+from pathlib import Path
+import shutil
+import unittest
+from src.audio_edits import _readWav
+from src.source_cache import *
+
+
+class SourceCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.sounds_dir = Path("test", "temp_source_sounds")
+        shutil.copytree(Path("test", "test_sounds"), self.sounds_dir)
+        self.coffee = str(Path(self.sounds_dir, "coffee.wav"))
+        self.toaster = str(Path(self.sounds_dir, "toaster.wav"))
+        self.cache = SourceCache()
+
+    def tearDown(self):
+        shutil.rmtree(self.sounds_dir)
+
+    def test_hit(self):
+        first = self.cache.get(self.coffee, _readWav)
+        self.assertIs(self.cache.get(self.coffee, _readWav), first)
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+        self.assertEqual(stats["entries"], 1)
+        self.assertEqual(stats["bytes"], first.nbytes())
+
+    def test_changedFileReloaded(self):
+        first = self.cache.get(self.coffee, _readWav)
+        shutil.copyfile(self.toaster, self.coffee)
+        second = self.cache.get(self.coffee, _readWav)
+        self.assertNotEqual(first.frames, second.frames)
+        self.assertEqual(self.cache.stats()["entries"], 1)
+        self.assertEqual(self.cache.stats()["bytes"], second.nbytes())
+
+    def test_leastRecentlyUsedEvicted(self):
+        coffee = self.cache.get(self.coffee, _readWav)
+        toaster = self.cache.get(self.toaster, _readWav)
+        self.cache.get(self.coffee, _readWav)
+        self.cache.resize(coffee.nbytes())
+        self.assertEqual(self.cache.stats()["entries"], 1)
+        self.assertEqual(self.cache.evictions, 1)
+        self.assertIs(self.cache.get(self.coffee, _readWav), coffee)
+        self.assertIsNot(self.cache.get(self.toaster, _readWav), toaster)
+
+    def test_tooLargeNotKept(self):
+        self.cache.resize(10)
+        self.cache.get(self.coffee, _readWav)
+        self.assertEqual(self.cache.stats()["bytes"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
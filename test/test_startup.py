@@ -0,0 +1,59 @@
+from pathlib import Path
+import subprocess
+import sys
+import unittest
+
+# Modules that are slow to import and are only needed to edit or play sounds.
+AUDIO_MODULES = [
+    "numpy",
+    "librosa",
+    "numba",
+    "pydub",
+    "soundfile",
+    "soxr",
+    "simpleaudio",
+    "audio_edits",
+    "audio_stream",
+]
+# Importing cli takes about 0.1 seconds without the audio modules, and seconds with
+# them, so this leaves room for slow machines while catching regressions.
+IMPORT_BUDGET_SECONDS = 1
+
+
+def importTimes(module):
+    """Import module in a new interpreter with -X importtime.
+
+    Returns:
+        Dictionary from the name of every module that was imported to its
+        cumulative import time in seconds.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=Path(__file__).resolve().parents[1] / "src",
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+class StartupTests(unittest.TestCase):
+    def test_cliSkipsAudioModules(self):
+        times = importTimes("cli")
+        self.assertIn("commander", times)
+        for module in AUDIO_MODULES:
+            self.assertNotIn(module, times)
+
+    def test_cliImportBudget(self):
+        times = importTimes("cli")
+        self.assertLess(times["cli"], IMPORT_BUDGET_SECONDS)
+
+
+if __name__ == "__main__":
+    unittest.main()